@@ -187,4 +187,154 @@ def choi_2011_calculate_non_wear_time(data, time, activity_threshold = 0, min_pe
 		# set the non wear vector according to start and end
 		non_wear_vector[row[0]:row[1]] = 0			
 
-	return non_wear_vector
\ No newline at end of file
+	return non_wear_vector
+
+def choi_2011_calculate_non_wear_time_vectorized(data, time, activity_threshold = 0, min_period_len = 90, spike_tolerance = 2,  min_window_len = 30, window_spike_tolerance = 0,  use_vector_magnitude = False, print_output = False):
+	"""	
+	Vectorized version of choi_2011_calculate_non_wear_time, with the same parameters and the same non wear vector, that can be used as a drop-in replacement
+
+	Instead of looping over the epochs, the non-wear periods are derived from the epochs where a period stops. A period stops at a count > 0 with more than window_spike_tolerance
+	non-zero counts in its upstream or downstream window (window 2), or at the third consecutive count above the activity threshold. Both conditions do not depend on where the 
+	period started, so the windows are counted for all epochs at once from a cumulative sum of non-zero counts. A period starts at the first zero count after the previous stop, and
+	thus spans the zero runs and the allowed spikes up to the next stop. As in choi_2011_calculate_non_wear_time, a period that is still running at the end of the data is 
+	not included. The activity threshold is expected to be >= 0
+
+	Parameters
+	------------
+	data: np.array((n_samples, 3 axes))
+		numpy array with 60s epoch data for axis1, axis2, and axis3 (respectively X,Y, and Z axis)
+	time : np.array((n_samples, 1 axis))
+		numpy array with timestamps for each epoch, note that 1 epoch is 60s
+	activity_threshold : int (optional)
+		The activity threshold is the value of the count that is considered "zero", since we are searching for a sequence of zero counts. Default threshold is 0
+	min_period_len : int (optional)
+		The minimum length of the consecutive zeros that can be considered valid non wear time. Default value is 90 (since we have 60s epoch data, this equals 90 mins)
+	spike_tolerance : int (optional)
+		Any count that is above the activity threshold is considered a spike. The tolerence defines the number of spikes that are acceptable within a sequence of zeros. The default is 2, meaning that we allow for 2 spikes in the data, i.e. aritifical movement
+	min_window_len : int (optional)
+		minimum length of upstream or downstream time window (referred to as window2 in the paper) for consecutive zero counts required before and after the artifactual movement interval to be considered a nonwear time interval.
+	window_spike_tolerance : int (optional)
+		number of non-zero counts that are allowed within the upstream or downstream window
+	use_vector_magnitude: Boolean (optional)
+		if set to true, then use the vector magniturde of X,Y, and Z axis, otherwise, use X-axis only. Default False
+	print_output : Boolean (optional)
+		if set to True, then print the output of the non wear sequence, start index, end index, duration, start time, end time and epoch values. Default is False
+
+	Returns
+	---------
+	non_wear_vector : np.array((n_samples, 1))
+		numpy array with non wear time encoded as 0, and wear time encoded as 1.
+	"""
+
+	# check if data contains at least min_period_len of data
+	if len(data) < min_period_len:
+		logging.error('Epoch data contains {} samples, which is less than the {} minimum required samples'.format(len(data), min_period_len))
+
+	# create non wear vector as numpy array with ones. now we only need to add the zeros which are the non-wear time segments
+	non_wear_vector = np.ones((len(data),1), dtype = np.int16)
+
+	"""
+		ADJUST THE COUNTS IF NECESSARY
+	"""
+
+	# if use vector magnitude is set to True, then calculate the vector magnitude of axis 1, 2, and 3, which are X, Y, and Z
+	if use_vector_magnitude:
+		# calculate vectore
+		data = calculate_vector_magnitude(data, minus_one = False, round_negative_to_zero = False)
+	else:
+		# if not set to true, then use axis 1, which is the X-axis, located at index 0
+		data = data[:,0]
+
+	"""
+		FIND NON WEAR PERIODS IN DATA
+	"""
+
+	# find the start and end of all non wear periods
+	ranges = _find_non_wear_periods(data, activity_threshold, min_period_len, spike_tolerance, min_window_len, window_spike_tolerance)
+
+	# convert ranges into non-wear sequence vector
+	for row in ranges:
+
+		# if set to True, then print output to console/log
+		if print_output:
+			logging.debug('start index: {}, end index: {}, duration : {}'.format(row[0], row[1], row[1] - row[0]))
+			logging.debug('start time: {}, end time: {}'.format(time[row[0]], time[row[1]]))
+			logging.debug('Epoch values \n{}'.format(data[row[0]:row[1]].T))
+		
+		# set the non wear vector according to start and end
+		non_wear_vector[row[0]:row[1]] = 0			
+
+	return non_wear_vector
+
+
+def _find_non_wear_periods(data, activity_threshold, min_period_len, spike_tolerance, min_window_len, window_spike_tolerance):
+	"""
+	Part of the vectorized Choi's (2011) non-wear time algorithm
+	find the start (included) and end (not included) of each non wear period from the epochs where a period stops
+
+	Parameters
+	------------
+	data : np.array(n_samples)
+		activity counts
+	activity_threshold : int
+		counts above the activity threshold are spikes
+	min_period_len : int
+		minimum length of a non wear period
+	spike_tolerance : int
+		offset of the upstream window after a non-zero count
+	min_window_len : int
+		length of the upstream and downstream window
+	window_spike_tolerance : int
+		number of non-zero counts that are allowed within the upstream or downstream window
+
+	Returns
+	---------
+	ranges : np.array((n_periods, 2))
+		start and end index of each non wear period
+	"""
+
+	# flatten the data (the vector magnitude has a single column)
+	data = np.asarray(data).reshape(-1)
+
+	# row indexes
+	index = np.arange(len(data))
+
+	# non-zero counts trigger the window 2 check, zero counts start a non wear period
+	non_zero = data > 0
+	zero = data == 0
+
+	# cumulative count of non-zero counts with a leading zero, so the count of rows [a, b) is cumulative_non_zero[b] - cumulative_non_zero[a]
+	cumulative_non_zero = np.concatenate([[0], np.cumsum(non_zero, dtype = np.int64)])
+
+	# upstream window data[index + spike_tolerance : index + min_window_len + 1], truncated at the end of the data
+	upstream_start = np.minimum(index + spike_tolerance, len(data))
+	upstream_end = np.maximum(np.minimum(index + min_window_len + 1, len(data)), upstream_start)
+	upstream_count = cumulative_non_zero[upstream_end] - cumulative_non_zero[upstream_start]
+
+	# downstream window data[max(index - min_window_len, 0) : index - 1]. A non-zero count within a period is never the first row, so index - 1 is not negative
+	downstream_end = np.maximum(index - 1, 0)
+	downstream_start = np.minimum(np.maximum(index - min_window_len, 0), downstream_end)
+	downstream_count = cumulative_non_zero[downstream_end] - cumulative_non_zero[downstream_start]
+
+	# invalid second window: too many non-zero counts upstream or downstream of a non-zero count
+	window_2_invalid = non_zero & ((upstream_count > window_spike_tolerance) | (downstream_count > window_spike_tolerance))
+
+	# the spike counter up to and including each row: the number of counts above the activity threshold since the last count at or below the activity threshold
+	spike = data > activity_threshold
+	cumulative_spikes = np.concatenate([[0], np.cumsum(spike, dtype = np.int64)])
+	last_no_spike = np.maximum.accumulate(np.where(data <= activity_threshold, index, -1))
+	consecutive_spikes = cumulative_spikes[index + 1] - cumulative_spikes[last_no_spike + 1]
+
+	# rows where a non wear period stops: 3 consecutive spikes or an invalid second window
+	stop_index = np.flatnonzero((consecutive_spikes == 3) | window_2_invalid)
+
+	# first zero count at or after each row (len(data) if there is none)
+	next_zero = np.minimum.accumulate(np.where(zero, index, len(data))[::-1])[::-1] if len(data) > 0 else index
+
+	# each period starts at the first zero count after the previous stop and ends at the next stop
+	start_index = next_zero[np.concatenate([[0], stop_index[:-1] + 1])[:len(stop_index)]]
+
+	# keep periods that started before the stop and are long enough
+	valid = (start_index < stop_index) & (stop_index - start_index >= min_period_len)
+
+	return np.column_stack([start_index[valid], stop_index[valid]])
@@ -114,4 +114,158 @@ def _check_preceding_time_interval_threshold(data, index, time_window, threshold
 		start_slice = 0
 	
 	# return True or False if the window contains more than the min_count
-	return ((data[start_slice:end_slice] > threshold).sum()) >= min_count
\ No newline at end of file
+	return ((data[start_slice:end_slice] > threshold).sum()) >= min_count
+
+
+def hecht_2009_triaxial_calculate_non_wear_time_vectorized(data, epoch_sec = 60, threshold = 5, time_interval_mins = 20, min_count = 2):
+	"""
+	Vectorized version of hecht_2009_triaxial_calculate_non_wear_time that returns the same non-wear vector. Instead of summing the following and preceding window 
+	for every row, the number of values above the threshold within each window is calculated from the cumulative sum of data > threshold, so the run time is O(n) 
+	instead of O(n * time window)
+
+	Parameters
+	---------
+	data : np.array((n_samples, 1))
+		numpy array with n_samples rows and a single column that contains the vector magnitude
+	epoch_sec : int (optional)
+		How many seconds a single row contains (default 60 seconds) (means that each row contains epoch data of 60 seconds)
+	threshold : int (optional)
+		threshold value for Hecht non-wear time algorithm. Defaults to 5 VMU
+	time_interval_mins : int (optional)
+		time interval threshold for hecht non-wear time algorithm. Defaults to 20 min
+	min_count : int (optional)
+		threshold for following and preceding window to check if at least min_count >= threshold
+
+	Returns
+	---------
+	non_wear_time_vector : np.array((n_samples, 1))
+		numpy array with non wear time encoded as 0, and wear time encoded as 1.
+	"""
+
+	# calculate the sliding windows size based on incoming epoch data and time interval to determine non-wear-time
+	time_window = time_interval_mins / (epoch_sec / 60.)
+
+	# check of epoch seconds can fit in time interval of equal parts
+	if time_window % 1 != 0:
+		logging.error('Invalid epoch {} (sec) or time interval {} (mins). Time window ratio {}'.format(epoch_sec, time_interval_mins, time_window))
+		exit(1)
+
+	# set time_window to integer
+	time_window = int(time_window)
+
+	# VMU values greater than threshold
+	above_threshold = np.asarray(data).reshape(-1) > threshold
+
+	# number of values above the threshold in the following and preceding time window of each row
+	following_count, preceding_count = _calculate_window_counts(above_threshold, time_window)
+
+	# True if the following or preceding time window has at least min_count values greater than the threshold
+	following = following_count >= min_count
+	preceding = preceding_count >= min_count
+
+	# VMU greater than threshold: non-wear time if neither window has min_count values greater than threshold. VMU NOT greater than threshold: non-wear time if one of the windows has not
+	non_wear = np.where(above_threshold, ~following & ~preceding, ~following | ~preceding)
+
+	# encode non-wear time as 0 and wear time as 1
+	return (~non_wear).astype(np.uint8).reshape(-1, 1)
+
+
+def _calculate_window_counts(above_threshold, time_window):
+	"""
+	Part of the vectorized Hecht's (2009) non-wear time algorithm
+	count the values above the threshold within the following [time_window] (excluding the row itself) and preceding [time_window] of each row from the cumulative sum
+
+	Parameters
+	---------
+	above_threshold : np.array(n_samples)
+		boolean array, True if the value of the row is greater than the threshold
+	time_window : int
+		number of rows of the following and preceding window
+
+	Returns
+	---------
+	following_count : np.array(n_samples)
+		number of values above the threshold in rows index + 1 up to index + 1 + time_window
+	preceding_count : np.array(n_samples)
+		number of values above the threshold in rows index - time_window up to index
+	"""
+
+	# cumulative count with a leading zero, so the count of rows [a, b) is cumulative_count[b] - cumulative_count[a]
+	cumulative_count = np.concatenate([[0], np.cumsum(above_threshold, dtype = np.int64)])
+
+	# row indexes
+	index = np.arange(len(above_threshold))
+
+	# following window, python truncates slices at the end of the data
+	following_count = cumulative_count[np.minimum(index + 1 + time_window, len(above_threshold))] - cumulative_count[index + 1]
+
+	# preceding window, a negative start slice is set to zero
+	preceding_count = cumulative_count[index] - cumulative_count[np.maximum(index - time_window, 0)]
+
+	return following_count, preceding_count
+
+
+def hecht_2009_triaxial_calculate_non_wear_time_grid(data, epoch_sec = 60, thresholds = [5], time_intervals_mins = [20], min_counts = [2]):
+	"""
+	Calculate the Hecht 2009 non-wear vector of every combination of threshold, time interval, and min count in one pass. The cumulative count of data > threshold is
+	calculated once per threshold, the window counts once per time interval, and all min counts are evaluated by broadcasting. Each non-wear vector is the same as 
+	returned by hecht_2009_triaxial_calculate_non_wear_time for that combination
+
+	Parameters
+	---------
+	data : np.array((n_samples, 1))
+		numpy array with n_samples rows and a single column that contains the vector magnitude
+	epoch_sec : int (optional)
+		How many seconds a single row contains (default 60 seconds) (means that each row contains epoch data of 60 seconds)
+	thresholds : list (optional)
+		threshold values in VMU
+	time_intervals_mins : list (optional)
+		time intervals in minutes
+	min_counts : list (optional)
+		min counts for the following and preceding window
+
+	Returns
+	---------
+	non_wear_time_tensor : np.array((n_thresholds, n_time_intervals, n_min_counts, n_samples))
+		non wear time of each combination encoded as 0, and wear time encoded as 1.
+	"""
+
+	# calculate the sliding windows size of each time interval
+	time_windows = [time_interval_mins / (epoch_sec / 60.) for time_interval_mins in time_intervals_mins]
+
+	# check of epoch seconds can fit in time interval of equal parts
+	for time_interval_mins, time_window in zip(time_intervals_mins, time_windows):
+		if time_window % 1 != 0:
+			logging.error('Invalid epoch {} (sec) or time interval {} (mins). Time window ratio {}'.format(epoch_sec, time_interval_mins, time_window))
+			exit(1)
+
+	# flatten the data
+	data = np.asarray(data).reshape(-1)
+
+	# min counts as (1, n_min_counts, 1) so they broadcast over the time windows and the samples
+	min_counts = np.asarray(min_counts).reshape(1, -1, 1)
+
+	# define new numpy array where we store the non-wear values: 0 for non-wear and 1 for wear time
+	non_wear_time_tensor = np.ones((len(thresholds), len(time_windows), min_counts.shape[1], len(data)), dtype = np.uint8)
+
+	for t, threshold in enumerate(thresholds):
+
+		# VMU values greater than threshold
+		above_threshold = data > threshold
+
+		# window counts of all time windows as (n_time_intervals, 1, n_samples)
+		window_counts = [_calculate_window_counts(above_threshold, int(time_window)) for time_window in time_windows]
+		following_count = np.stack([x[0] for x in window_counts])[:, None, :]
+		preceding_count = np.stack([x[1] for x in window_counts])[:, None, :]
+
+		# True if the following or preceding time window has at least min_count values greater than the threshold
+		following = following_count >= min_counts
+		preceding = preceding_count >= min_counts
+
+		# the same decision as in hecht_2009_triaxial_calculate_non_wear_time_vectorized
+		non_wear = np.where(above_threshold, ~following & ~preceding, ~following | ~preceding)
+
+		# encode non-wear time as 0 and wear time as 1
+		non_wear_time_tensor[t] = ~non_wear
+
+	return non_wear_time_tensor
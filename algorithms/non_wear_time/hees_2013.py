@@ -5,6 +5,7 @@
 """
 import numpy as np
 import logging
+from math import gcd
 
 def hees_2013_calculate_non_wear_time(data, hz = 100, min_non_wear_time_window = 60, window_overlap = 15, std_mg_threshold = 3.0, std_min_num_axes = 2 , value_range_mg_threshold = 50.0, value_range_min_num_axes = 2):
 	"""
@@ -94,4 +95,291 @@ def hees_2013_calculate_non_wear_time(data, hz = 100, min_non_wear_time_window =
 			# set the non wear vector to non-wear time for the start to end slice of the data
 			non_wear_vector[start:end] = 0
 
-	return non_wear_vector
\ No newline at end of file
+	return non_wear_vector
+
+
+def hees_2013_calculate_non_wear_time_vectorized(data, hz = 100, min_non_wear_time_window = 60, window_overlap = 15, std_mg_threshold = 3.0, std_min_num_axes = 2 , value_range_mg_threshold = 50.0, value_range_min_num_axes = 2):
+	"""
+	Rolling statistics version of hees_2013_calculate_non_wear_time, with the same parameters and the same non wear vector
+
+	Instead of calculating np.std and np.ptp on a copy of every window (with the default parameters every sample is part of 4 windows), the data is split into blocks of 
+	gcd(min_non_wear_time_window, window_overlap) minutes. The sum, the sum of squared deviations, the min, and the max of each block are calculated once (see calculate_block_statistics), 
+	and the standard deviation and value range of each window are combined from the blocks of the window (see combine_block_statistics)
+
+	Parameters
+	----------
+	data: np.array(n_samples, axes)
+		numpy array with acceleration data in g values. Each column represent a different axis, normally ordered YXZ
+	hz: int (optional)
+		sample frequency in hertz. Indicates the number of samples per 1 second. Default to 100 for 100hz
+	min_non_wear_time_window : int (optional)
+		minimum window length in minutes to be classified as non-wear time
+	window_overlap : int (optional)
+		basically the sliding window that progresses over the acceleration data. Defaults to 15 minutes.
+	std_mg_threshold : float (optional)
+		standard deviation in milli g threshold. Acceleration axes values below or equal this threshold can be considered non-wear time. Defaults to 3.0g, this will be converted to mg
+	std_min_num_axes : int (optional)
+		minimum numer of axes used to check if acceleration values are below the std_mg_threshold value. Defaults to 2 axes
+	value_range_mg_threshold : float (optional)
+		value range threshold value in mg. Default to 50 mg
+	value_range_min_num_axes : int (optional)
+		minimum numer of axes used to check if acceleration values range are below the value_range_mg_threshold value. Defaults to 2 axes
+
+	Returns
+	---------
+	non_wear_vector : np.array((n_samples, 1))
+		numpy array with non wear time encoded as 0, and wear time encoded as 1.
+	"""
+
+	# number of data samples in 1 minute
+	num_samples_per_min = hz * 60
+
+	# block size in minutes: the largest block that fits a whole number of times in the window and in the window overlap
+	block_mins = gcd(min_non_wear_time_window, window_overlap)
+
+	# statistics of each block
+	block_statistics = calculate_block_statistics(data, block_size = block_mins * num_samples_per_min)
+
+	# standard deviation and value range of each window, combined from the blocks of the window
+	std, value_range = combine_block_statistics(block_statistics, window_blocks = min_non_wear_time_window // block_mins, step_blocks = window_overlap // block_mins)
+
+	# windows with the standard deviation or the value range below the threshold for enough axes (thresholds converted from mg to g)
+	non_wear_windows = ((std < std_mg_threshold / 1000).sum(axis = 1) >= std_min_num_axes) | ((value_range < value_range_mg_threshold / 1000).sum(axis = 1) >= value_range_min_num_axes)
+
+	# non wear blocks: blocks that are part of at least one non wear window
+	non_wear_blocks = windows_to_blocks(non_wear_windows, num_blocks = len(block_statistics['mean']), window_blocks = min_non_wear_time_window // block_mins, step_blocks = window_overlap // block_mins)
+
+	# new array to record non-wear time. Convention is 0 = non-wear time, and 1 is wear time
+	non_wear_vector = np.ones((data.shape[0], 1), dtype = 'uint8')
+
+	# set the samples of the non wear blocks to non-wear time
+	non_wear_vector[:len(non_wear_blocks) * block_mins * num_samples_per_min, 0] = ~non_wear_blocks.repeat(block_mins * num_samples_per_min)
+
+	return non_wear_vector
+
+
+def calculate_block_statistics(data, block_size, chunk_size = 360000):
+	"""
+	Calculate the statistics of consecutive blocks of data, per axis. Samples after the last full block are not used. The data is processed in chunks of blocks, so 
+	the float64 copies stay small (about 9 MB for 3 axes with the default chunk size)
+
+	Parameters
+	----------
+	data: np.array(n_samples, axes)
+		numpy array with acceleration data
+	block_size : int
+		number of samples of each block, for example hz * 60 for blocks of 1 minute
+	chunk_size : int (optional)
+		number of samples to process at once, rounded down to a multiple of block_size (at least one block). Default 360000, one hour of 100hz data
+
+	Returns
+	---------
+	block_statistics : dict()
+		count : number of samples of each block (block_size)
+		mean : np.array((n_blocks, axes)) with the mean of each block
+		m2 : np.array((n_blocks, axes)) with the sum of squared deviations from the mean of each block
+		min : np.array((n_blocks, axes)) with the minimum of each block
+		max : np.array((n_blocks, axes)) with the maximum of each block
+	"""
+
+	# number of full blocks
+	num_blocks = data.shape[0] // block_size
+	# number of blocks to process at once
+	chunk_blocks = max(1, min(chunk_size // block_size, num_blocks))
+
+	# empty arrays to store the statistics of each block
+	block_statistics = {'count' : block_size}
+	for statistic in ['mean', 'm2']:
+		block_statistics[statistic] = np.zeros((num_blocks, data.shape[1]), dtype = np.float64)
+	for statistic in ['min', 'max']:
+		block_statistics[statistic] = np.zeros((num_blocks, data.shape[1]), dtype = data.dtype)
+
+	# buffer for the deviations from the block mean, reused for every chunk
+	deviations_buffer = np.empty((chunk_blocks, block_size, data.shape[1]), dtype = np.float64)
+
+	for start in range(0, num_blocks, chunk_blocks):
+
+		# blocks of the chunk as (blocks, samples, axes)
+		end = min(start + chunk_blocks, num_blocks)
+		blocks = data[start * block_size:end * block_size].reshape(end - start, block_size, data.shape[1])
+
+		# min and max of each block
+		block_statistics['min'][start:end] = _reduce_blocks(np.minimum, blocks)
+		block_statistics['max'][start:end] = _reduce_blocks(np.maximum, blocks)
+
+		# mean of each block
+		block_statistics['mean'][start:end] = _reduce_blocks(np.add, blocks, dtype = np.float64) / block_size
+
+		# sum of squared deviations from the mean of each block
+		deviations = np.subtract(blocks, block_statistics['mean'][start:end, None, :], out = deviations_buffer[:end - start])
+		block_statistics['m2'][start:end] = np.einsum('ijk,ijk->ik', deviations, deviations)
+
+	return block_statistics
+
+
+def _reduce_blocks(ufunc, blocks, dtype = None):
+	"""
+	Reduce the samples of each block per axis with a numpy ufunc, for example np.minimum. Reducing over (blocks, samples, axes) directly is slow because the axes 
+	are interleaved; the samples are first reduced as rows of many samples and axes, and then per axis
+
+	Parameters
+	----------
+	ufunc : np.ufunc
+		ufunc to reduce with, for example np.minimum, np.maximum, or np.add
+	blocks : np.array((n_blocks, block_size, axes))
+		data of each block
+	dtype : np.dtype (optional)
+		dtype of the reduction
+
+	Returns
+	---------
+	reduced : np.array((n_blocks, axes))
+		reduced value of each block and axis
+	"""
+
+	# number of samples per row: a divisor of the block size
+	num_blocks, block_size, num_axes = blocks.shape
+	samples_per_row = gcd(block_size, 1000)
+
+	# reduce the rows of samples_per_row samples, and then the samples within a row per axis
+	reduced = ufunc.reduce(blocks.reshape(num_blocks, block_size // samples_per_row, samples_per_row * num_axes), axis = 1, dtype = dtype)
+
+	return ufunc.reduce(reduced.reshape(num_blocks, samples_per_row, num_axes), axis = 1)
+
+
+def combine_block_statistics(block_statistics, window_blocks, step_blocks):
+	"""
+	Combine the statistics of blocks into the standard deviation and the value range of windows of window_blocks blocks, starting every step_blocks blocks. Only windows
+	that fully fit within the blocks are returned
+
+	Parameters
+	----------
+	block_statistics : dict()
+		statistics of each block (see calculate_block_statistics)
+	window_blocks : int
+		number of blocks of each window
+	step_blocks : int
+		number of blocks between the start of two windows
+
+	Returns
+	---------
+	std : np.array((n_windows, axes))
+		standard deviation of each window
+	value_range : np.array((n_windows, axes))
+		value range (max - min) of each window
+	"""
+
+	# no full window
+	if len(block_statistics['mean']) < window_blocks:
+		return np.zeros((0, block_statistics['mean'].shape[1])), np.zeros((0, block_statistics['mean'].shape[1]))
+
+	# view of the blocks of each window as (windows, axes, window_blocks)
+	windows = {statistic : np.lib.stride_tricks.sliding_window_view(block_statistics[statistic], window_blocks, axis = 0)[::step_blocks] for statistic in ['mean', 'm2', 'min', 'max']}
+
+	# mean of each window
+	mean = windows['mean'].mean(axis = 2)
+
+	# sum of squared deviations of each window: the sum of the squared deviations within the blocks and of the block means from the window mean
+	m2 = windows['m2'].sum(axis = 2) + block_statistics['count'] * np.square(windows['mean'] - mean[:, :, None]).sum(axis = 2)
+
+	# population standard deviation, the same as np.std
+	std = np.sqrt(m2 / (block_statistics['count'] * window_blocks))
+
+	# value range of each window
+	value_range = windows['max'].max(axis = 2) - windows['min'].min(axis = 2)
+
+	return std, value_range
+
+
+def windows_to_blocks(windows, num_blocks, window_blocks, step_blocks):
+	"""
+	Return the blocks that are part of at least one of the selected windows, counted from the cumulative sum over the windows (see _get_block_windows)
+
+	Parameters
+	----------
+	windows : np.array((..., n_windows))
+		boolean array, True for the selected windows. Leading dimensions are kept, for example one for each grid search combination
+	num_blocks : int
+		number of blocks
+	window_blocks : int
+		number of blocks of each window
+	step_blocks : int
+		number of blocks between the start of two windows
+
+	Returns
+	---------
+	blocks : np.array((..., num_blocks))
+		boolean array, True for the blocks that are part of a selected window
+	"""
+
+	# first and last window that contain each block
+	first_window, last_window = _get_block_windows(num_blocks, windows.shape[-1], window_blocks, step_blocks)
+
+	# cumulative count of selected windows with a leading zero, so the count of windows [a, b) is cumulative_windows[..., b] - cumulative_windows[..., a]
+	cumulative_windows = np.concatenate([np.zeros(windows.shape[:-1] + (1,), dtype = np.int64), np.cumsum(windows, axis = -1, dtype = np.int64)], axis = -1)
+
+	return cumulative_windows[..., last_window + 1] - cumulative_windows[..., first_window] > 0
+
+
+def windows_to_blocks_minimum(windows, num_blocks, window_blocks, step_blocks):
+	"""
+	Return for each block the minimum of a window statistic over all windows that contain the block, so a block is part of a window with a statistic below a threshold
+	when the returned value is below that threshold. The minimum of each range of windows is read from a sparse table of minima over power of two lengths
+
+	Parameters
+	----------
+	windows : np.array((..., n_windows))
+		statistic of each window. Leading dimensions are kept, for example one for each grid search combination. NaN values are ignored
+	num_blocks : int
+		number of blocks
+	window_blocks : int
+		number of blocks of each window
+	step_blocks : int
+		number of blocks between the start of two windows
+
+	Returns
+	---------
+	blocks : np.array((..., num_blocks))
+		minimum statistic of the windows that contain each block, inf for blocks that are not part of a window
+	"""
+
+	# first and last window that contain each block
+	first_window, last_window = _get_block_windows(num_blocks, windows.shape[-1], window_blocks, step_blocks)
+
+	# number of windows that contain each block
+	num_windows = last_window - first_window + 1
+
+	# empty array to store the minimum of each block, blocks without windows stay inf
+	blocks = np.full(windows.shape[:-1] + (num_blocks,), np.inf)
+
+	# level k of the sparse table has the minimum of the windows [i, i + 2 ** k)
+	level, table = 0, windows
+	while (num_windows >= 2 ** level).any():
+
+		# blocks with 2 ** level <= num_windows < 2 ** (level + 1), their range is covered by two overlapping ranges of length 2 ** level
+		index = np.flatnonzero((num_windows >= 2 ** level) & (num_windows < 2 ** (level + 1)))
+		blocks[..., index] = np.fmin(table[..., first_window[index]], table[..., last_window[index] - 2 ** level + 1])
+
+		# next level of the sparse table
+		table = np.fmin(table[..., :-2 ** level], table[..., 2 ** level:])
+		level += 1
+
+	return blocks
+
+
+def _get_block_windows(num_blocks, num_windows, window_blocks, step_blocks):
+	"""
+	Return the first and the last window that contain each block. Block j is part of the windows k with k * step_blocks <= j < k * step_blocks + window_blocks.
+	Blocks that are not part of any window have last_window = first_window - 1
+	"""
+
+	block = np.arange(num_blocks)
+
+	# first and last window that contain each block
+	first_window = np.minimum(np.maximum(-((window_blocks - 1 - block) // step_blocks), 0), num_windows)
+	last_window = np.minimum(block // step_blocks, num_windows - 1)
+
+	# blocks that are not part of any window (after the last full window)
+	last_window = np.maximum(last_window, first_window - 1)
+
+	return first_window, last_window
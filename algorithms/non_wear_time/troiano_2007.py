@@ -165,4 +165,165 @@ def troiano_2007_calculate_non_wear_time(data, time, activity_threshold = 0, min
 		# set the non wear vector according to start and end
 		non_wear_vector[row[0]:row[1]] = 0
 
-	return non_wear_vector
\ No newline at end of file
+	return non_wear_vector
+
+def troiano_2007_calculate_non_wear_time_vectorized(data, time, activity_threshold = 0, min_period_len = 60, spike_tolerance = 2, spike_stoplevel = 100, use_vector_magnitude = False, print_output = False):
+	"""
+	Vectorized version of troiano_2007_calculate_non_wear_time, with the same parameters and the same non wear vector, that can be used as a drop-in replacement
+
+	Instead of looping over the epochs with a state machine, the non-wear periods are derived from the epochs where a period stops. A period stops at a minute with 
+	intensity count > spike_stoplevel, at the (spike_tolerance + 1)th consecutive minute with a count between activity_threshold and spike_stoplevel, or at the last minute.
+	These stops do not depend on where the period started, since a period always starts with a zero count that resets the spike counter. Each period thus starts at the
+	first zero count after the previous stop, and ends at the next stop
+
+	Parameters
+	------------
+	data: np.array((n_samples, 3 axes))
+		numpy array with 60s epoch data for axis1, axis2, and axis3 (respectively X,Y, and Z axis)
+	time : np.array((n_samples, 1 axis))
+		numpy array with timestamps for each epoch, note that 1 epoch is 60s
+	activity_threshold : int (optional)
+		The activity threshold is the value of the count that is considered "zero", since we are searching for a sequence of zero counts. Default threshold is 0
+	min_period_len : int (optional)
+		The minimum length of the consecutive zeros that can be considered valid non wear time. Default value is 60 (since we have 60s epoch data, this equals 60 mins)
+	spike_tolerance : int (optional)
+		Any count that is above the activity threshold is considered a spike. The tolerence defines the number of spikes that are acceptable within a sequence of zeros. The default is 2, meaning that we allow for 2 spikes in the data, i.e. aritifical movement
+	spike_stoplevel : int (Optional)
+		any activity above the spike stoplevel end the non wear sequence, default to 100.
+	use_vector_magnitude: Boolean (optional)
+		if set to true, then use the vector magniturde of X,Y, and Z axis, otherwise, use X-axis only. Default False
+	print_output : Boolean (optional)
+		if set to True, then print the output of the non wear sequence, start index, end index, duration, start time, end time and epoch values. Default is False
+
+	Returns
+	---------
+	non_wear_vector : np.array((n_samples, 1))
+		numpy array with non wear time encoded as 0, and wear time encoded as 1.
+	"""
+
+	# check if data contains at least min_period_len of data
+	if len(data) < min_period_len:
+		logging.error('Epoch data contains {} samples, which is less than the {} minimum required samples'.format(len(data), min_period_len))
+
+	# create non wear vector as numpy array with ones. now we only need to add the zeros which are the non-wear time segments
+	non_wear_vector = np.ones((len(data),1), dtype = np.uint8)
+
+	# no data, thus no non wear periods
+	if len(data) == 0:
+		return non_wear_vector
+
+	"""
+		ADJUST THE COUNTS IF NECESSARY
+	"""
+
+	# if use vector magnitude is set to True, then calculate the vector magnitude of axis 1, 2, and 3, which are X, Y, and Z
+	if use_vector_magnitude:
+		# calculate vectore
+		data = calculate_vector_magnitude(data, minus_one = False, round_negative_to_zero = False)
+	else:
+		# if not set to true, then use axis 1, which is the X-axis, located at index 0
+		data = data[:,0]
+
+	"""
+		FIND NON WEAR PERIODS IN DATA
+	"""
+
+	# find the start and end of all non wear periods
+	ranges = _find_non_wear_periods(data, activity_threshold, min_period_len, spike_tolerance, spike_stoplevel)
+
+	# convert ranges into non-wear sequence vector
+	for row in ranges:
+
+		# if set to True, then print output to console/log
+		if print_output:
+			logging.debug('start index: {}, end index: {}, duration : {}'.format(row[0], row[1], row[1] - row[0]))
+			logging.debug('start time: {}, end time: {}'.format(time[row[0]], time[row[1]]))
+			logging.debug('Epoch values \n{}'.format(data[row[0]:row[1]].T))
+
+	# set the non wear vector according to start and end of all periods at once (the periods do not overlap)
+	non_wear_vector[:, 0] = _ranges_to_vector(ranges, len(data))
+
+	return non_wear_vector
+
+
+def _find_non_wear_periods(data, activity_threshold, min_period_len, spike_tolerance, spike_stoplevel):
+	"""
+	Part of the vectorized Troiano's (2007) non-wear time algorithm
+	find the start (included) and end (not included) of each non wear period from the epochs where a period stops
+
+	Parameters
+	------------
+	data : np.array(n_samples)
+		activity counts, at least one
+	activity_threshold : int
+		counts at or below the activity threshold are zero counts
+	min_period_len : int
+		minimum length of a non wear period
+	spike_tolerance : int
+		number of consecutive spikes that are allowed within a non wear period
+	spike_stoplevel : int
+		counts above the spike stoplevel stop the non wear period
+
+	Returns
+	---------
+	ranges : np.array((n_periods, 2))
+		start and end index of each non wear period
+	"""
+
+	# flatten the data (the vector magnitude has a single column)
+	data = np.asarray(data).reshape(-1)
+
+	# row indexes
+	index = np.arange(len(data))
+
+	# zero counts start a non wear period and reset the spike counter
+	zero = data <= activity_threshold
+	# spikes are counts between the activity threshold and the spike stoplevel
+	spike = (data > activity_threshold) & (data <= spike_stoplevel)
+
+	# the spike counter up to and including each row: the number of spikes since the last zero count (a missing count does not reset the counter)
+	cumulative_spikes = np.concatenate([[0], np.cumsum(spike, dtype = np.int64)])
+	last_zero = np.maximum.accumulate(np.where(zero, index, -1))
+	consecutive_spikes = cumulative_spikes[index + 1] - cumulative_spikes[last_zero + 1]
+
+	# rows where a non wear period stops: a count above the spike stoplevel, too many consecutive spikes, or the last row
+	stop = (data > spike_stoplevel) | (spike & (consecutive_spikes > spike_tolerance))
+	stop[-1] = True
+	stop_index = np.flatnonzero(stop)
+
+	# first zero count at or after each row (len(data) if there is none)
+	next_zero = np.minimum.accumulate(np.where(zero, index, len(data))[::-1])[::-1]
+
+	# each period starts at the first zero count after the previous stop and ends at the next stop
+	start_index = next_zero[np.concatenate([[0], stop_index[:-1] + 1])]
+
+	# keep periods that started before the stop and are long enough
+	valid = (start_index <= stop_index) & (stop_index - start_index >= min_period_len)
+
+	return np.column_stack([start_index[valid], stop_index[valid]])
+
+
+def _ranges_to_vector(ranges, length):
+	"""
+	Part of the vectorized Troiano's (2007) non-wear time algorithm
+	convert non-overlapping [start, end) ranges to a vector with 0 within the ranges and 1 outside the ranges
+
+	Parameters
+	------------
+	ranges : np.array((n_ranges, 2))
+		start and end index of each range
+	length : int
+		length of the vector
+
+	Returns
+	---------
+	vector : np.array(length)
+		0 within the ranges and 1 outside the ranges
+	"""
+
+	# +1 at the start and -1 at the end of each range, the cumulative sum is 1 within a range
+	delta = np.zeros(length + 1, dtype = np.int64)
+	np.add.at(delta, ranges[:, 0], 1)
+	np.add.at(delta, ranges[:, 1], -1)
+
+	return (np.cumsum(delta[:-1]) == 0).astype(np.uint8)
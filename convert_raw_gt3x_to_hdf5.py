@@ -7,17 +7,17 @@ import glob2
 import re
 import time
 import os
+import queue
 import logging
-from multiprocessing import cpu_count
-from joblib import Parallel
-from joblib import delayed
+import numpy as np
+from multiprocessing import cpu_count, Pool, Process, Queue
 
 """
 	IMPORTED FUNCTIONS
 """
-from functions.helper_functions import set_start, set_end, delete_file, delete_directory
-from functions.gt3x_functions import unzip_gt3x_file, extract_info, extract_log
-from functions.hdf5_functions import get_all_subjects_hdf5, read_metadata_from_group, read_dataset_from_group, read_metadata_from_group_dataset, save_multi_data_to_group_hdf5, save_meta_data_to_group_dataset, save_data_to_group_hdf5
+from functions.helper_functions import set_start, set_end, delete_file
+from functions.gt3x_functions import read_gt3x_info, read_gt3x_file, extract_log_vectorized, extract_gt3x_log_chunks, build_log_index, extract_log_records
+from functions.hdf5_functions import get_all_subjects_hdf5, delete_group, read_metadata_from_group, read_dataset_from_group, read_metadata_from_group_dataset, save_multi_data_to_group_hdf5, save_meta_data_to_group_dataset, save_data_to_group_hdf5, append_data_to_group_hdf5, write_queue_to_hdf5, get_hdf5_metrics
 
 """
 CHANGE LOG
@@ -33,9 +33,15 @@ CHANGE LOG
 GT3X_FOLDER = os.path.join(os.sep, 'Volumes', 'LaCie_server', 'Actigraph_raw')
 # folder location to store data in HDF5 format to
 HDF5_SAVE = os.path.join(os.sep, 'Volumes', 'LaCie_server', 'ACTIGRAPH_TU7.hdf5')
+# queue of the HDF5 writer process, set within each worker process when processing in parallel
+SAVE_QUEUE = None
+# number of seconds to wait for space on the queue of the HDF5 writer before giving up
+SAVE_QUEUE_TIMEOUT = 600
+# number of seconds between checks if the HDF5 writer process is still running
+WRITER_CHECK_SECONDS = 5
 
 
-def batch_process_gt3x_files(gt3x_folder = GT3X_FOLDER, use_parallel = False, num_jobs = cpu_count(), limit = None, skip_n = 0, ignore_already_processed_subjects = False, remove_unwanted_files = False):
+def batch_process_gt3x_files(gt3x_folder = GT3X_FOLDER, use_parallel = False, num_jobs = cpu_count(), limit = None, skip_n = 0, ignore_already_processed_subjects = False, remove_unwanted_files = False, streaming = False, recovery = 'skip', queue_size = None):
 	"""
 	Batch processing to convert actigraph .gt3x (raw acceleration) files into YXZ acceleration in g, and also the corresponding time array so we know the start and stop times of the signal
 
@@ -56,7 +62,13 @@ def batch_process_gt3x_files(gt3x_folder = GT3X_FOLDER, use_parallel = False, nu
 	ignore_already_processed_subjects : Boolean (optional)
 		set to True if already processed subjects need to be removed from the files
 	remove_unwanted_files : Boolean (optional)
-		set to True if you want to delete any files prior to processing the full folder (in case of interuptions there might be half unzipped log files)
+		set to True if you want to delete any log.bin and info.txt files that were unzipped by earlier versions of this script (the .gt3x files are no longer unzipped to disk)
+	streaming : Boolean (optional)
+		if set to True, then each file is decoded and saved in chunks, so the memory usage per file is bounded. This allows for more parallel jobs on the same machine
+	recovery : string (optional)
+		what to do with corrupt log.bin records: 'skip' (default) leaves them out, 'zero' sets their acceleration values to zero, None skips the whole file. See extract_log_vectorized
+	queue_size : int (optional)
+		if use_parallel is set to True, the maximum number of datasets waiting on the queue of the HDF5 writer. Bounds the memory usage when decoding is faster than writing. Default 2 * num_jobs
 	"""
 
 
@@ -86,25 +98,61 @@ def batch_process_gt3x_files(gt3x_folder = GT3X_FOLDER, use_parallel = False, nu
 
 		logging.info('Processing in parallel (parallelization on)')
 
-		# use parallel processing to speed up processing time
-		executor = Parallel(n_jobs = num_jobs, backend = 'multiprocessing')
+		# the worker processes only decode the .gt3x files, a single writer process owns the HDF5 file. The bounded queue makes the workers wait when the writer falls behind
+		save_queue = Queue(maxsize = queue_size or 2 * num_jobs)
+
+		# read the already processed subjects once, the workers cannot open the HDF5 file while the writer has it open
+		processed_subjects = get_all_subjects_hdf5(hdf5_file = HDF5_SAVE)
+
+		# start the writer
+		writer = Process(target = write_queue_to_hdf5, args = (save_queue, HDF5_SAVE))
+		writer.start()
+
 		# create tasks so we can execute them in parallel
-		tasks = (delayed(process_gt3x_file)(f, i, len(gt3x_files)) for i, f in enumerate(gt3x_files))
-		# execute tasks
-		executor(tasks)
+		tasks = [(f, i, len(gt3x_files), streaming, recovery, processed_subjects) for i, f in enumerate(gt3x_files)]
+
+		try:
+
+			# execute tasks, each worker puts the decoded datasets on the save queue
+			with Pool(processes = num_jobs, initializer = _set_save_queue, initargs = (save_queue,)) as pool:
+
+				result = pool.starmap_async(_process_gt3x_file_worker, tasks, chunksize = 1)
+
+				# the workers would wait forever for space on the queue when the writer has stopped
+				while not result.ready():
+					result.wait(timeout = WRITER_CHECK_SECONDS)
+					if not result.ready() and not writer.is_alive():
+						raise RuntimeError('HDF5 writer stopped with exit code {} before all files were processed'.format(writer.exitcode))
+
+				# raise the exception of a worker
+				result.get()
+
+		finally:
+
+			# tell the writer that all files are decoded and wait until everything is written
+			if writer.is_alive():
+				save_queue.put(None, timeout = SAVE_QUEUE_TIMEOUT)
+			writer.join()
+
+		# the writer exits with exit code 1 when a group could not be saved
+		if writer.exitcode != 0:
+			raise RuntimeError('HDF5 writer failed with exit code {}, not all subjects were saved (see the log for the subjects)'.format(writer.exitcode))
 
 	else:
 		# process files one by one
 		for i, f in enumerate(gt3x_files):
 
 			# call process_gt3x_file function, f = file name, and i = index of file, len(gt3x_files) = total number of gt3x files to be processed
-			process_gt3x_file(f, i, len(gt3x_files))
+			process_gt3x_file(f, i, len(gt3x_files), streaming = streaming, recovery = recovery)
+
+		# time spent waiting for the HDF5 file and the number of retries
+		logging.info('HDF5 access metrics: {}'.format(get_hdf5_metrics()))
 
 
-def process_gt3x_file(f, i = 1, total = 1, hdf5_save_location = HDF5_SAVE, delete_zip_folder = True):
+def process_gt3x_file(f, i = 1, total = 1, hdf5_save_location = HDF5_SAVE, streaming = False, chunk_records = 3600, recovery = 'skip', save_queue = None, processed_subjects = None):
 	"""
 	Process .gt3x file
-	- unzip into log.bin and info.txt
+	- read info.txt and log.bin directly from the .gt3x file (no unzipping to disk)
 	- extract information from info.txt
 	- extract information from log.bin
 	- save data to hdf5 file
@@ -119,59 +167,281 @@ def process_gt3x_file(f, i = 1, total = 1, hdf5_save_location = HDF5_SAVE, delet
 		total number of files to be processed, is used to display a counter of the process. Default = 1. For example, processing 12/20
 	hdf5_save_location : os.path
 		folder location where to save the extracted acceleration data to.
+	streaming : Boolean (optional)
+		if set to True, then log.bin is decoded chunk_records at a time and each chunk is appended to resizable HDF5 datasets. This keeps the memory usage bounded regardless of the length of the recording
+	chunk_records : int (optional)
+		number of activity records (seconds) within one chunk when streaming is set to True. Default 3600, which is one hour of data
+	recovery : string (optional)
+		what to do with records that have an invalid checksum or that cannot be read: 'skip' (default), 'zero', or None. See extract_log_vectorized
+	save_queue : multiprocessing.Queue (optional)
+		if given, the datasets are put on the queue of the HDF5 writer process instead of being saved directly (see write_queue_to_hdf5)
+	processed_subjects : list (optional)
+		subjects that are already part of the HDF5 file. If not given, they are read from the HDF5 file
 	"""
 
 	logging.debug('Processing GTX3 binary file: {} {}/{}'.format(f, i + 1, total))
 
-	# unzip the raw .gt3x file: this will provide a log.bin and info.txt file
-	# the save_location is a new folder with the same name as the .gt3x file
-	log_bin, info_txt = unzip_gt3x_file(f, save_location = f.split('.')[0])
-
-	# check if unzipping went ok
-	if log_bin is not None:
+	# read the info.txt content from the raw .gt3x file, without writing it to a temporary folder
+	info_data = read_gt3x_info(f)
 
-		# print verbose
-		logging.debug('log.bin location: {}'.format(log_bin))
-		logging.debug('info.txt location: {}'.format(info_txt))
-
-		# get info data from info file
-		info_data = extract_info(info_txt)
+	# check if reading went ok
+	if info_data is not None:
 
 		# check if subject name could be read from the binary file
-		if info_data['Subject_Name'] is not "":
-
-			# check if subject ID already processed
-			if info_data['Subject_Name'] not in get_all_subjects_hdf5(hdf5_file = HDF5_SAVE):
+		if info_data['Subject_Name'] != "":
 
-				# retrieve log_data; i.e. accellerometer data and log_time; timestamps of acceleration data
-				log_data, log_time = extract_log(log_bin, acceleration_scale = float(info_data['Acceleration_Scale']), sample_rate = int(info_data['Sample_Rate']))
+			# read already processed subject IDs
+			if processed_subjects is None:
+				processed_subjects = get_all_subjects_hdf5(hdf5_file = HDF5_SAVE)
 
-				# check if log data is not None (with None something went wrong during reading of the binary file)
-				if log_data is not None:
+			# check if subject ID already processed
+			if info_data['Subject_Name'] not in processed_subjects:
 
-					# save log_data to HDF5 file
-					save_data_to_group_hdf5(group = info_data['Subject_Name'], data = log_data, data_name = 'log', meta_data = info_data, overwrite = True, hdf5_file = hdf5_save_location)
-					
-					# save log_time data to HDF file
-					save_data_to_group_hdf5(group = info_data['Subject_Name'], data = log_time, data_name = 'time', meta_data = info_data, overwrite = True, hdf5_file = hdf5_save_location)
-				
+				if streaming:
+					# decode and save the log.bin file chunk by chunk
+					_process_gt3x_log_streaming(f, info_data, hdf5_save_location, chunk_records, recovery, save_queue)
 				else:
-					logging.error('Unable to convert .gt3x file: {} (subject {})'.format(f, info_data['Subject_Name']))
+					# decode and save the log.bin file at once
+					_process_gt3x_log(f, info_data, hdf5_save_location, recovery, save_queue)
 			else:
 				logging.info('Subject name already defined as group in HDF5 file: {}, skipping..'.format(info_data['Subject_Name']))
 		else:
 			logging.error("Unable to read subject from info.txt file, skipping file: {}".format(f))
 	else:
-		logging.error("Error unzipping file: {}".format(f))
-		
-	# delete the created zip folder
-	if delete_zip_folder:
-		delete_directory(f.split('.')[0])
+		logging.error("Error reading file: {}".format(f))
 
 	# print time and memory
 	set_end(tic, process)
 
 
+def _process_gt3x_log(f, info_data, hdf5_save_location, recovery = 'skip', save_queue = None):
+	"""
+	Decode the full log.bin file of a .gt3x file in memory and save the log, time, log_index, log_report, battery, lux, metadata, and capsense datasets to HDF5
+
+	Parameters
+	----------
+	f : string
+		file location of the .gt3x file
+	info_data : dictionary
+		content of the info.txt file
+	hdf5_save_location : os.path
+		folder location where to save the extracted acceleration data to.
+	recovery : string (optional)
+		what to do with records that have an invalid checksum or that cannot be read. See extract_log_vectorized
+	save_queue : multiprocessing.Queue (optional)
+		if given, the datasets are put on the queue of the HDF5 writer process instead of being saved directly
+	"""
+
+	# read the log.bin content from the raw .gt3x file
+	_, log_buffer = read_gt3x_file(f)
+
+	if log_buffer is None:
+		logging.error('Unable to read log.bin from .gt3x file: {} (subject {})'.format(f, info_data['Subject_Name']))
+		return
+
+	# scan the record headers of the log.bin file once, the payloads are then read by offset
+	log_index = build_log_index(log_buffer, recovery = recovery is not None)
+
+	# retrieve log_data; i.e. accellerometer data and log_time; timestamps of acceleration data, and a report of the corrupt records
+	log_data, log_time, log_report = extract_log_vectorized(log_buffer, acceleration_scale = float(info_data['Acceleration_Scale']), sample_rate = int(info_data['Sample_Rate']), log_index = log_index, recovery = recovery, return_report = True)
+
+	# check if log data is not None (with None something went wrong during reading of the binary file)
+	if log_data is not None:
+
+		# save log_data to HDF5 file
+		save_dataset(info_data['Subject_Name'], log_data, 'log', meta_data = info_data, hdf5_file = hdf5_save_location, save_queue = save_queue)
+		
+		# save log_time data to HDF file
+		save_dataset(info_data['Subject_Name'], log_time, 'time', meta_data = info_data, hdf5_file = hdf5_save_location, save_queue = save_queue)
+
+		# save the record index so the log.bin records can later be read selectively without scanning the file again
+		save_dataset(info_data['Subject_Name'], log_index, 'log_index', hdf5_file = hdf5_save_location, save_queue = save_queue)
+
+		# save the report of corrupt records, unreadable bytes, and missing seconds
+		save_dataset(info_data['Subject_Name'], log_report, 'log_report', hdf5_file = hdf5_save_location, save_queue = save_queue)
+
+		# save the battery, lux, metadata, and capsense records, these are read by offset from the same record index
+		for data_name, records in extract_log_records(log_buffer, log_index).items():
+			save_dataset(info_data['Subject_Name'], records, data_name, hdf5_file = hdf5_save_location, save_queue = save_queue)
+
+		# summary of the report
+		log_report_summary(info_data['Subject_Name'], log_report)
+	
+	else:
+		logging.error('Unable to convert .gt3x file: {} (subject {})'.format(f, info_data['Subject_Name']))
+
+
+def _process_gt3x_log_streaming(f, info_data, hdf5_save_location, chunk_records = 3600, recovery = 'skip', save_queue = None):
+	"""
+	Decode the log.bin file of a .gt3x file chunk by chunk and append each chunk to the resizable log, time, and log_index datasets in HDF5. Only one chunk is
+	kept in memory at a time. When the conversion fails after the first chunk, the group of the subject is deleted, otherwise the incomplete subject would be skipped as
+	already processed in the next run
+
+	Parameters
+	----------
+	f : string
+		file location of the .gt3x file
+	info_data : dictionary
+		content of the info.txt file
+	hdf5_save_location : os.path
+		folder location where to save the extracted acceleration data to.
+	chunk_records : int (optional)
+		number of activity records (seconds) within one chunk
+	recovery : string (optional)
+		what to do with records that have an invalid checksum or that cannot be read. See extract_log_vectorized
+	save_queue : multiprocessing.Queue (optional)
+		if given, the datasets are put on the queue of the HDF5 writer process instead of being saved directly
+	"""
+
+	# the sample rate defines the number of samples within one activity record
+	sample_rate = int(info_data['Sample_Rate'])
+
+	try:
+
+		# decode the log.bin file chunk by chunk
+		for chunk_cnt, (log_data, log_time, log_index, log_report, log_records) in enumerate(extract_gt3x_log_chunks(f, acceleration_scale = float(info_data['Acceleration_Scale']), sample_rate = sample_rate, chunk_records = chunk_records, recovery = recovery)):
+
+			# the first chunk creates the datasets, this also removes datasets from an earlier interrupted run
+			first_chunk = chunk_cnt == 0
+
+			# append log_data, the chunk shape of the resizable datasets follows the storage policy (see get_storage_options)
+			save_dataset(info_data['Subject_Name'], log_data, 'log', meta_data = info_data, overwrite = first_chunk, append = True, hdf5_file = hdf5_save_location, save_queue = save_queue)
+			# append log_time data
+			save_dataset(info_data['Subject_Name'], log_time, 'time', meta_data = info_data, overwrite = first_chunk, append = True, hdf5_file = hdf5_save_location, save_queue = save_queue)
+			# append the record index
+			save_dataset(info_data['Subject_Name'], log_index, 'log_index', overwrite = first_chunk, append = True, hdf5_file = hdf5_save_location, save_queue = save_queue)
+			# append the report of corrupt records, unreadable bytes, and missing seconds
+			save_dataset(info_data['Subject_Name'], log_report, 'log_report', overwrite = first_chunk, append = True, hdf5_file = hdf5_save_location, save_queue = save_queue)
+			# append the battery, lux, metadata, and capsense records
+			for data_name, records in log_records.items():
+				save_dataset(info_data['Subject_Name'], records, data_name, overwrite = first_chunk, append = True, hdf5_file = hdf5_save_location, save_queue = save_queue)
+
+			# keep the report of all chunks for the summary
+			full_report = log_report if first_chunk else np.concatenate([full_report, log_report])
+
+			logging.debug('Saved chunk {} of subject {}'.format(chunk_cnt + 1, info_data['Subject_Name']))
+
+		# summary of the report
+		log_report_summary(info_data['Subject_Name'], full_report)
+	
+	except Exception as e:
+		logging.error('Unable to convert .gt3x file: {} (subject {}): {}'.format(f, info_data['Subject_Name'], e))
+
+		# remove the chunks that were already saved
+		delete_subject(info_data['Subject_Name'], hdf5_file = hdf5_save_location, save_queue = save_queue)
+
+
+def save_dataset(group, data, data_name, meta_data = None, overwrite = True, append = False, chunks = True, hdf5_file = HDF5_SAVE, save_queue = None):
+	"""
+	Save a dataset of a subject, either directly to the HDF5 file or, when processing in parallel, by putting it on the queue of the HDF5 writer process
+
+	Parameters
+	----------
+	group : string
+		subject ID, the name of the group where the data needs to be stored
+	data : numpy.array
+		data that needs to be stored
+	data_name : string
+		name of the dataset
+	meta_data : dictionary (optional)
+		meta data to save with the dataset
+	overwrite : Boolean (optional)
+		if set to True then the current dataset is replaced. Default True
+	append : Boolean (optional)
+		if set to True then the data is appended to a resizable dataset (see append_data_to_group_hdf5)
+	chunks : tuple or Boolean (optional)
+		chunk shape of a resizable dataset
+	hdf5_file : os.path
+		location of the HDF5 file
+	save_queue : multiprocessing.Queue (optional)
+		queue of the HDF5 writer process (see write_queue_to_hdf5). If not given, the data is saved directly to the HDF5 file
+	"""
+
+	if save_queue is not None:
+		try:
+			# the writer process saves the data, this blocks when the queue is full
+			save_queue.put({'group' : group, 'data' : data, 'data_name' : data_name, 'meta_data' : meta_data, 'overwrite' : overwrite, 'append' : append, 'chunks' : chunks}, timeout = SAVE_QUEUE_TIMEOUT)
+		except queue.Full:
+			raise RuntimeError('HDF5 writer did not accept data for {} seconds, dataset {} of group {} not saved'.format(SAVE_QUEUE_TIMEOUT, data_name, group))
+	elif append:
+		# add the data at the end of the resizable dataset
+		append_data_to_group_hdf5(group = group, data = data, data_name = data_name, meta_data = meta_data, overwrite = overwrite, chunks = chunks, hdf5_file = hdf5_file)
+	else:
+		# save the data as a new dataset
+		save_data_to_group_hdf5(group = group, data = data, data_name = data_name, meta_data = meta_data, overwrite = overwrite, hdf5_file = hdf5_file)
+
+
+def delete_subject(group, hdf5_file = HDF5_SAVE, save_queue = None):
+	"""
+	Delete the group of a subject, either directly from the HDF5 file or, when processing in parallel, through the queue of the HDF5 writer process
+
+	Parameters
+	----------
+	group : string
+		subject ID, the name of the group that needs to be deleted
+	hdf5_file : os.path
+		location of the HDF5 file
+	save_queue : multiprocessing.Queue (optional)
+		queue of the HDF5 writer process (see write_queue_to_hdf5). If not given, the group is deleted directly from the HDF5 file
+	"""
+
+	if save_queue is not None:
+		try:
+			# the writer process deletes the group after the datasets that are already on the queue
+			save_queue.put({'group' : group, 'delete_group' : True}, timeout = SAVE_QUEUE_TIMEOUT)
+		except queue.Full:
+			raise RuntimeError('HDF5 writer did not accept data for {} seconds, group {} not deleted'.format(SAVE_QUEUE_TIMEOUT, group))
+	elif os.path.exists(hdf5_file) and group in get_all_subjects_hdf5(hdf5_file = hdf5_file):
+		delete_group(group, hdf5_file = hdf5_file)
+
+
+def _set_save_queue(save_queue):
+	"""
+	Initializer of the worker processes: make the queue of the HDF5 writer available to the worker (a multiprocessing.Queue cannot be passed as task argument)
+
+	Parameters
+	----------
+	save_queue : multiprocessing.Queue
+		queue of the HDF5 writer process
+	"""
+
+	global SAVE_QUEUE
+	SAVE_QUEUE = save_queue
+
+
+def _process_gt3x_file_worker(f, i, total, streaming, recovery, processed_subjects):
+	"""
+	Process a .gt3x file within a worker process, the datasets are put on the queue of the HDF5 writer process (see process_gt3x_file)
+	"""
+
+	process_gt3x_file(f, i, total, streaming = streaming, recovery = recovery, save_queue = SAVE_QUEUE, processed_subjects = processed_subjects)
+
+
+def log_report_summary(subject, log_report):
+	"""
+	Log a summary of the records that were corrupt or could not be read (see create_log_report)
+
+	Parameters
+	----------
+	subject : string
+		subject ID
+	log_report : np.array(n_entries, dtype = LOG_REPORT_DTYPE)
+		report of invalid records, unreadable bytes, and missing seconds
+	"""
+
+	# nothing to report
+	if len(log_report) == 0:
+		return
+
+	# number of entries for each reason
+	num_checksum = np.sum(log_report['reason'] == b'checksum')
+	num_unreadable = np.sum(log_report['reason'] == b'unreadable')
+	# total number of missing seconds
+	num_missing = np.sum(log_report['num_seconds'][log_report['reason'] == b'missing'])
+
+	logging.warning('Subject {}: {} records with invalid checksum, {} unreadable parts, {} missing seconds'.format(subject, num_checksum, num_unreadable, num_missing))
+
+
 def remove_processed_subjects(gt3x_files):
 	"""
 	Remove files that are already processed
@@ -26,7 +26,7 @@ from functions.hdf5_functions import save_data_to_group_hdf5, get_all_subjects_h
 from functions.raw_non_wear_functions import find_candidate_non_wear_segments_from_raw, find_consecutive_index_ranges, group_episodes
 from functions.plot_functions import plot_merged_episodes, plot_cnn_classification_performance, plot_training_results_per_epoch, plot_cnn_inferred_nw_time, plot_episodes_used_for_training, plot_baseline_performance, plot_performance_cnn_nw_method, plot_episodes_used_for_training_combined
 from functions.datasets_functions import get_actigraph_acc_data, get_actiwave_acc_data, get_actiwave_hr_data
-from functions.ml_functions import get_confusion_matrix, calculate_classification_performance
+from functions.ml_functions import calculate_binary_confusion_matrix, calculate_classification_performance
 from functions.dl_functions import create_1d_cnn_non_wear_episodes, load_tf_model
 
 
@@ -143,7 +143,7 @@ def process_calculate_true_nw_time_from_labeled_episodes(merged_episodes_folder,
 		episodes = pd.read_csv(f)
 
 		# read actigraph raw data for subject
-		actigraph_acc, *_ = get_actigraph_acc_data(subject, hdf5_file = hdf5_read_file)
+		actigraph_acc, *_ = get_actigraph_acc_data(subject, hdf5_file = hdf5_read_file, return_time = False)
 
 		# create new nw_vector
 		nw_vector = np.zeros((actigraph_acc.shape[0], 1)).astype('uint8')
@@ -377,7 +377,7 @@ def get_start_and_stop_episodes(file, label_folder, hdf5_read_file, episode_wind
 	episodes = pd.read_csv(file)
 
 	# read actigraph raw data for subject
-	actigraph_acc, *_ = get_actigraph_acc_data(subject, hdf5_file = hdf5_read_file)
+	actigraph_acc, *_ = get_actigraph_acc_data(subject, hdf5_file = hdf5_read_file, return_time = False)
 
 	# empty list that will hold all the data
 	data = {'x_0' : [], 'x_1' : []}
@@ -993,7 +993,7 @@ def process_plot_episodes_used_for_training(merged_episodes_folder, hdf5_acc_fil
 		logging.info(f'=== Processing subject {subject} ===')
 
 		# read actigraph raw data for subject
-		actigraph_acc, *_ = get_actigraph_acc_data(subject, hdf5_file = hdf5_acc_file)
+		actigraph_acc, *_ = get_actigraph_acc_data(subject, hdf5_file = hdf5_acc_file, return_time = False)
 
 		# read dataframe
 		df = pd.read_csv(f)
@@ -1249,7 +1249,7 @@ def _calculate_confusion_matrix(key, values, hz = 100):
 	y_hat = y_hat[::hz]
 
 	# get confusion matrix values
-	tn, fp, fn, tp = get_confusion_matrix(y, y_hat, labels = [0,1]).ravel()
+	tn, fp, fn, tp = calculate_binary_confusion_matrix(y, y_hat)
 
 	logging.debug('tn: {}, fp: {}, fn: {}, tp: {}'.format(tn, fp, fn, tp))
 
@@ -1275,7 +1275,7 @@ def _evaluate_baseline(hdf5_acc_file, subject, std_threshold, episode_length, us
 	"""
 
 	# read actigraph raw data for subject
-	actigraph_acc, *_ = get_actigraph_acc_data(subject, hdf5_file = hdf5_acc_file)
+	actigraph_acc, *_ = get_actigraph_acc_data(subject, hdf5_file = hdf5_acc_file, return_time = False)
 
 	# create new nw_vector
 	nw_vector = np.zeros((actigraph_acc.shape[0], 1)).astype('uint8')
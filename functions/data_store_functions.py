@@ -0,0 +1,533 @@
+# -*- coding: utf-8 -*-
+
+"""
+	IMPORT PACKAGES
+"""
+import os
+import json
+import glob2
+import hashlib
+import logging
+import tempfile
+import numpy as np
+
+"""
+	IMPORTED FUNCTIONS
+"""
+from functions.helper_functions import create_directory, delete_directory
+
+"""
+	GLOBAL VARIABLES
+"""
+# subject data stores attached within this process, store folder to subjects data with memory-mapped arrays
+_ATTACHED_SUBJECT_DATA_STORES = {}
+# result caches attached within this process, result cache folder to subject IDs, combination IDs, and memory-mapped confusion matrices
+_ATTACHED_RESULT_CACHES = {}
+
+
+def create_subject_data_store(subjects_data, store_folder = None):
+	"""
+	Save the arrays of all subjects as .npy files, one file per subject and key, so parallel workers can attach to them by folder name (see attach_subject_data_store)
+	instead of receiving a pickled copy of the data with every task
+
+	Parameters
+	----------
+	subjects_data : dict()
+		subject ID to a dictionary of key to np.array, for example {'data' : epoch data, 'true_nw_time' : true non wear time}. Keys with None are not saved
+	store_folder : os.path (optional)
+		folder to save the arrays to. Defaults to a new temporary folder
+
+	Returns
+	---------
+	store_folder : os.path
+		folder of the subject data store
+	"""
+
+	# create the folder of the store
+	if store_folder is None:
+		store_folder = tempfile.mkdtemp(prefix = 'subject-data-store-')
+	else:
+		create_directory(store_folder)
+
+	for subject, subject_data in subjects_data.items():
+		for key, data in subject_data.items():
+
+			# skip keys without data (for example the epoch data when processing raw data)
+			if data is None:
+				continue
+
+			# save the array as one contiguous .npy file that can be memory-mapped
+			np.save(_get_subject_data_store_file(store_folder, subject, key), np.ascontiguousarray(data))
+
+	return store_folder
+
+
+def attach_subject_data_store(store_folder):
+	"""
+	Attach to a subject data store and return the data of all subjects as read-only memory-mapped arrays. The arrays are views on the page cache, so workers share one
+	copy of the data. The store is attached once per process, later calls return the same arrays
+
+	Parameters
+	----------
+	store_folder : os.path
+		folder of the subject data store (see create_subject_data_store)
+
+	Returns
+	---------
+	subjects_data : dict()
+		subject ID to a dictionary of key to np.memmap. Keys that are only saved for other subjects are None
+	"""
+
+	if store_folder not in _ATTACHED_SUBJECT_DATA_STORES:
+
+		# empty dictionary to populate with memory-mapped arrays
+		subjects_data = {}
+
+		for file in sorted(os.listdir(store_folder)):
+
+			# skip files that are not part of the store
+			if not file.endswith('.npy'):
+				continue
+
+			# parse the subject ID and the key from the file name
+			subject, key = file[:-len('.npy')].rsplit('.', 1)
+
+			# memory-map the array
+			subjects_data.setdefault(subject, {})[key] = np.load(os.path.join(store_folder, file), mmap_mode = 'r')
+
+		# keys that are not saved for a subject are None, the same as in the dictionary the store was created from
+		keys = {key for subject_data in subjects_data.values() for key in subject_data}
+		for subject_data in subjects_data.values():
+			for key in keys:
+				subject_data.setdefault(key, None)
+
+		_ATTACHED_SUBJECT_DATA_STORES[store_folder] = subjects_data
+
+	return _ATTACHED_SUBJECT_DATA_STORES[store_folder]
+
+
+def delete_subject_data_store(store_folder):
+	"""
+	Detach from a subject data store within this process and delete the folder of the store
+
+	Parameters
+	----------
+	store_folder : os.path
+		folder of the subject data store (see create_subject_data_store)
+	"""
+
+	# remove the memory-mapped arrays of this process
+	_ATTACHED_SUBJECT_DATA_STORES.pop(store_folder, None)
+
+	# delete the .npy files
+	delete_directory(store_folder)
+
+
+def create_result_cache(cache_folder, method, subjects, combinations, resume = True, fingerprint = None):
+	"""
+	Create or extend a result cache with the confusion matrix (tn, fp, fn, tp) of each subject and combination of a method. The confusion matrices are stored in a 
+	memory-mapped .npy array of shape (n_subjects, n_combinations, 4), indexed by integer subject and combination IDs, with -1 for results that have not been
+	calculated yet. Parallel workers write their own rows directly into the array (see set_cached_result), so no lock or manager process is needed as long as no
+	two workers calculate the same subject and combination at the same time. The cache persists between runs: subjects and combinations that are already part
+	of the cache keep their ID and their results, new subjects and combinations are appended
+
+	Every result is also appended to a journal file of the worker process, which is synced to disk after each task (see sync_result_cache). The journals of an
+	interrupted run are replayed into the array when the cache is created again, so a resumed run skips all results that were completed before the interruption
+
+	The cached results are only valid as long as the data and the method of the subjects do not change. The fingerprint of the run (see get_result_cache_fingerprint) is 
+	saved with the cache, and when the cache is created again with a different fingerprint, the cached results are deleted instead of reused
+
+	Parameters
+	----------
+	cache_folder : os.path
+		folder of all result caches
+	method : string
+		name of the method, for example 'epoch-troiano'. Each method has its own result cache
+	subjects : list
+		subject IDs
+	combinations : list
+		combination names
+	resume : bool (optional)
+		if True, keep the results of earlier (interrupted) runs. If False, delete the cached results of the method first
+	fingerprint : string (optional)
+		fingerprint of the subjects, combinations, and algorithm version of the run. If given, cached results of a run with another fingerprint are deleted
+
+	Returns
+	---------
+	result_cache : os.path
+		folder of the result cache of the method, used by the workers to attach to the cache
+	"""
+
+	# folder of the result cache of the method
+	result_cache = os.path.join(cache_folder, method)
+
+	# file with the fingerprint of the run that created the cache
+	fingerprint_file = os.path.join(result_cache, 'fingerprint.npy')
+
+	# the cached results belong to another run
+	if resume and fingerprint is not None and os.path.exists(result_cache) and (not os.path.exists(fingerprint_file) or str(np.load(fingerprint_file)) != fingerprint):
+		logging.warning('Result cache {} was created by another run (different subjects, combinations, or algorithm version), start without cached results'.format(result_cache))
+		resume = False
+
+	# start without cached results
+	if not resume and os.path.exists(result_cache):
+		delete_directory(result_cache)
+		
+	create_directory(result_cache)
+
+	# save the fingerprint of the run
+	if fingerprint is not None:
+		np.save(fingerprint_file, np.array(fingerprint))
+
+	# subject and combination IDs already in the cache
+	cached_ids = {x : _load_result_cache_ids(result_cache, x) for x in ['subjects', 'combinations']}
+
+	# append new subjects and combinations
+	ids = {x : cached_ids[x] + [y for y in dict.fromkeys(values) if y not in set(cached_ids[x])] for x, values in [('subjects', subjects), ('combinations', combinations)]}
+
+	# file with the confusion matrices
+	cache_file = os.path.join(result_cache, 'confusion_matrix.npy')
+
+	# shape of the array with the confusion matrices
+	shape = (len(ids['subjects']), len(ids['combinations']), 4)
+
+	if not os.path.exists(cache_file) or np.load(cache_file, mmap_mode = 'r').shape != shape:
+
+		# save the IDs, they are only appended so the IDs of the existing results stay valid
+		for x in ids:
+			np.save(os.path.join(result_cache, '{}.npy'.format(x)), np.array(ids[x], dtype = str))
+
+		# new array with -1 for results that have not been calculated yet
+		confusion_matrix = np.full(shape, -1, dtype = np.int64)
+
+		# copy the results of the existing subjects and combinations
+		if os.path.exists(cache_file):
+			cached_confusion_matrix = np.load(cache_file, mmap_mode = 'r')
+			num_subjects, num_combinations = min(shape[0], cached_confusion_matrix.shape[0]), min(shape[1], cached_confusion_matrix.shape[1])
+			confusion_matrix[:num_subjects, :num_combinations] = cached_confusion_matrix[:num_subjects, :num_combinations]
+
+		# save the array to a temporary file first, so an interrupted resize does not lose the cache
+		np.save(cache_file + '.tmp.npy', confusion_matrix)
+		os.replace(cache_file + '.tmp.npy', cache_file)
+
+	# replay the journals of earlier runs into the array
+	_replay_result_cache_journals(result_cache, ids, cache_file)
+
+	# attach again after the cache has been changed
+	_ATTACHED_RESULT_CACHES.pop(result_cache, None)
+
+	return result_cache
+
+
+def get_result_cache_fingerprint(subjects, combinations, version):
+	"""
+	Return the fingerprint of a run of a result cache: a hash of the subjects, the combinations, and the version of the algorithm that calculates the results
+
+	Parameters
+	----------
+	subjects : list
+		subject IDs
+	combinations : list
+		combination names
+	version : int or string
+		version of the algorithm, increase the version when the algorithm changes so the cached results are not reused
+
+	Returns
+	---------
+	fingerprint : string
+		hexadecimal SHA-1 hash
+	"""
+
+	return hashlib.sha1(json.dumps([list(subjects), list(combinations), version], default = str).encode('utf-8')).hexdigest()
+
+
+def attach_result_cache(result_cache, journal_only = False):
+	"""
+	Attach to a result cache and return the subject IDs, the combination IDs, and the memory-mapped confusion matrices. The cache is attached once per process
+
+	Workers on other nodes attach with journal_only = True: they only append their results to their own journal, because writes of several nodes to the same 
+	memory-mapped file on a shared filesystem can overwrite each other. Processes that are forked from a process that attached with journal_only = True keep that
+	mode. The journals are merged into the array by the coordinator (see merge_result_cache_journals)
+
+	Parameters
+	----------
+	result_cache : os.path
+		folder of the result cache of a method (see create_result_cache)
+	journal_only : bool (optional)
+		if True, results are only written to the journal of the process, and no results are read from the cache
+
+	Returns
+	---------
+	cache : dict()
+		'subjects' : subject ID to integer ID, 'combinations' : combination name to integer ID, 'confusion_matrix' : np.memmap((n_subjects, n_combinations, 4)), 
+		None if journal_only is True
+	"""
+
+	# cache attached by this process or by the parent process
+	attached = _ATTACHED_RESULT_CACHES.get(result_cache)
+
+	# attach again within a new (forked) process, so each process writes to its own journal
+	if attached is None or attached['pid'] != os.getpid():
+
+		# keep the mode of the parent process
+		journal_only = journal_only or (attached is not None and attached['journal_only'])
+
+		_ATTACHED_RESULT_CACHES[result_cache] = {	'pid' : os.getpid(),
+													'journal_only' : journal_only,
+													'subjects' : {x : i for i, x in enumerate(_load_result_cache_ids(result_cache, 'subjects'))},
+													'combinations' : {x : i for i, x in enumerate(_load_result_cache_ids(result_cache, 'combinations'))},
+													'confusion_matrix' : None if journal_only else np.load(os.path.join(result_cache, 'confusion_matrix.npy'), mmap_mode = 'r+'),
+													'journal' : None}
+
+	return _ATTACHED_RESULT_CACHES[result_cache]
+
+
+def get_cached_result(result_cache, subject, combination):
+	"""
+	Return the cached confusion matrix of a subject and a combination
+
+	Parameters
+	----------
+	result_cache : os.path
+		folder of the result cache of a method (see create_result_cache)
+	subject : string
+		subject ID
+	combination : string
+		combination name
+
+	Returns
+	---------
+	confusion_matrix : np.array(4) or None
+		tn, fp, fn, tp, None if the result has not been calculated yet
+	"""
+
+	# attach to the result cache
+	cache = attach_result_cache(result_cache)
+
+	# no results are read in journal only mode
+	if cache['journal_only']:
+		return None
+
+	# read the cached confusion matrix
+	confusion_matrix = np.array(cache['confusion_matrix'][cache['subjects'][subject], cache['combinations'][combination]])
+
+	# results that have not been (completely) written are -1
+	return confusion_matrix if (confusion_matrix >= 0).all() else None
+
+
+def set_cached_result(result_cache, subject, combination, confusion_matrix):
+	"""
+	Write the confusion matrix of a subject and one or more combinations to the result cache
+
+	Parameters
+	----------
+	result_cache : os.path
+		folder of the result cache of a method (see create_result_cache)
+	subject : string
+		subject ID
+	combination : string or list
+		combination name, or list of combination names
+	confusion_matrix : np.array(4) or np.array((n_combinations, 4))
+		tn, fp, fn, tp of each combination
+	"""
+
+	# attach to the result cache
+	cache = attach_result_cache(result_cache)
+
+	# combination names and confusion matrices
+	combination = np.atleast_1d(combination)
+	confusion_matrix = np.asarray(confusion_matrix, dtype = np.int64).reshape(-1, 4)
+
+	# write the row(s) of the subject and combination(s)
+	if not cache['journal_only']:
+		cache['confusion_matrix'][cache['subjects'][subject], [cache['combinations'][x] for x in combination]] = confusion_matrix
+
+	# open the journal of this process
+	if cache['journal'] is None:
+		cache['journal'] = open(os.path.join(result_cache, 'journal-{}-{}.tsv'.format(os.uname().nodename, os.getpid())), 'a')
+
+	# append the results to the journal, one line per subject and combination
+	cache['journal'].write(''.join('{}\t{}\t{}\n'.format(subject, x, '\t'.join(str(y) for y in cm)) for x, cm in zip(combination, confusion_matrix)))
+
+
+def sync_result_cache(result_cache):
+	"""
+	Write the results of this process to disk: flush the memory-mapped array, and flush and sync the journal. Results that are synced survive an interruption of
+	the run (see create_result_cache)
+
+	Parameters
+	----------
+	result_cache : os.path
+		folder of the result cache of a method (see create_result_cache)
+	"""
+
+	# attach to the result cache
+	cache = attach_result_cache(result_cache)
+
+	# flush the memory-mapped array
+	if not cache['journal_only']:
+		cache['confusion_matrix'].flush()
+
+	# flush the journal and sync it to disk
+	if cache['journal'] is not None:
+		cache['journal'].flush()
+		os.fsync(cache['journal'].fileno())
+
+
+def get_result_cache_progress(result_cache):
+	"""
+	Return the number of calculated results and the total number of results of a result cache
+
+	Parameters
+	----------
+	result_cache : os.path
+		folder of the result cache of a method (see create_result_cache)
+
+	Returns
+	---------
+	num_completed : int
+		number of subject and combination results that have been calculated
+	num_total : int
+		number of subject and combination results of the cache
+	"""
+
+	# array with the confusion matrices
+	confusion_matrix = attach_result_cache(result_cache)['confusion_matrix']
+
+	return int(np.count_nonzero((confusion_matrix >= 0).all(axis = -1))), confusion_matrix.shape[0] * confusion_matrix.shape[1]
+
+
+def get_result_cache_tensor(result_cache, subjects, combinations):
+	"""
+	Return the cached confusion matrices of subjects and combinations as one dense array
+
+	Parameters
+	----------
+	result_cache : os.path
+		folder of the result cache of a method (see create_result_cache)
+	subjects : list
+		subject IDs
+	combinations : list
+		combination names
+
+	Returns
+	---------
+	confusion_tensor : np.array((n_subjects, n_combinations, 4))
+		tn, fp, fn, tp of each subject and combination, -1 for results that have not been calculated
+	"""
+
+	# attach to the result cache and flush pending writes
+	cache = attach_result_cache(result_cache)
+	cache['confusion_matrix'].flush()
+
+	# copy the confusion matrices of the subjects and combinations
+	return cache['confusion_matrix'][np.ix_([cache['subjects'][x] for x in subjects], [cache['combinations'][x] for x in combinations])]
+
+
+def get_result_cache_dict(result_cache, subjects, combinations):
+	"""
+	Return the cached confusion matrices of subjects and combinations as a dictionary with '<subject>-<combination>' as key
+
+	Parameters
+	----------
+	result_cache : os.path
+		folder of the result cache of a method (see create_result_cache)
+	subjects : list
+		subject IDs
+	combinations : list
+		combination names
+
+	Returns
+	---------
+	subject_combination_results : dict()
+		'<subject>-<combination>' to [tn, fp, fn, tp], for the results that have been calculated
+	"""
+
+	# confusion matrices of the subjects and combinations
+	confusion_tensor = get_result_cache_tensor(result_cache, subjects, combinations)
+
+	return {'{}-{}'.format(subject, combination) : list(confusion_tensor[i, j]) for i, subject in enumerate(subjects) for j, combination in enumerate(combinations) if (confusion_tensor[i, j] >= 0).all()}
+
+
+def detach_result_cache(result_cache):
+	"""
+	Detach from a result cache within this process and close the journal of this process, the next call to attach_result_cache attaches again
+
+	Parameters
+	----------
+	result_cache : os.path
+		folder of the result cache of a method (see create_result_cache)
+	"""
+
+	# cache attached by this process or by the parent process
+	attached = _ATTACHED_RESULT_CACHES.pop(result_cache, None)
+
+	# close the journal of this process, the journal of a parent process is closed by the parent
+	if attached is not None and attached['journal'] is not None and attached['pid'] == os.getpid():
+		attached['journal'].close()
+
+
+def merge_result_cache_journals(result_cache):
+	"""
+	Merge the journals of all workers (for example workers on other nodes that attached with journal_only = True) into the array with the confusion matrices
+
+	Parameters
+	----------
+	result_cache : os.path
+		folder of the result cache of a method (see create_result_cache)
+	"""
+
+	# close the journal of this process, it is deleted after the merge
+	detach_result_cache(result_cache)
+
+	_replay_result_cache_journals(result_cache, {x : _load_result_cache_ids(result_cache, x) for x in ['subjects', 'combinations']}, os.path.join(result_cache, 'confusion_matrix.npy'))
+
+
+def _replay_result_cache_journals(result_cache, ids, cache_file):
+	"""
+	Write the results of the journals into the array with the confusion matrices, and delete the journals once the array has been flushed to disk
+	"""
+
+	# journals of earlier runs
+	journals = sorted(glob2.glob(os.path.join(result_cache, 'journal-*.tsv')))
+
+	if len(journals) == 0:
+		return
+
+	# subject and combination ID of each name
+	subject_ids = {x : i for i, x in enumerate(ids['subjects'])}
+	combination_ids = {x : i for i, x in enumerate(ids['combinations'])}
+
+	# open the array to write to
+	confusion_matrix = np.load(cache_file, mmap_mode = 'r+')
+
+	for journal in journals:
+		with open(journal, 'r') as f:
+			for line in f:
+
+				# skip incomplete lines (for example the last line of an interrupted process)
+				values = line.rstrip('\n').split('\t')
+				if not line.endswith('\n') or len(values) != 6 or values[0] not in subject_ids or values[1] not in combination_ids:
+					continue
+
+				confusion_matrix[subject_ids[values[0]], combination_ids[values[1]]] = [int(x) for x in values[2:]]
+
+	# flush the array before the journals are deleted
+	confusion_matrix.flush()
+	del confusion_matrix
+
+	for journal in journals:
+		os.remove(journal)
+
+
+def _load_result_cache_ids(result_cache, ids):
+
+	# file with the subject or combination IDs
+	file = os.path.join(result_cache, '{}.npy'.format(ids))
+
+	return np.load(file).tolist() if os.path.exists(file) else []
+
+
+def _get_subject_data_store_file(store_folder, subject, key):
+
+	return os.path.join(store_folder, '{}.{}.npy'.format(subject, key))
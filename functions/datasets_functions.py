@@ -11,15 +11,15 @@ import numpy as np
 	IMPORT FUNCTIONS
 """
 from functions.helper_functions import dictionary_values_bytes_to_string
-from functions.hdf5_functions import read_dataset_from_group, read_metadata_from_group_dataset
+from functions.hdf5_functions import read_group_bundle, read_dataset_from_group, get_time_axis, get_time_gaps_dataset_name, create_time_axis_array
 from functions.epoch_functions import create_epoch_time_array, convert_epoch_data
 from functions.autocalibrate_functions_2 import calibrate_accelerometer_data, parse_calibration_weights
 
 
-def get_actigraph_acc_data(subject, hdf5_file, autocalibrate = False, acc_dataset = 'actigraph_acc', time_dataset = 'actigraph_time'):
+def get_actigraph_acc_data(subject, hdf5_file, autocalibrate = False, acc_dataset = 'actigraph_acc', time_dataset = 'actigraph_time', return_time = True):
 	"""
 	Read actigraph acceleration data from HDF5 file, if autocalibrate is set to True, then perform autocalibration. Also create the correct
-	time array
+	time array from the implicit time axis of the acceleration data, or read the time dataset if the data has no time axis
 
 	Parameters
 	---------
@@ -29,6 +29,8 @@ def get_actigraph_acc_data(subject, hdf5_file, autocalibrate = False, acc_datase
 		location of the HDF5 file where the data is stored
 	autocalibrate: Boolean (optional)
 		set to true if autocalibration need to be done
+	return_time : Boolean (optional)
+		if set to False, the time array is not created and None is returned instead
 
 	Returns
 	---------
@@ -42,20 +44,21 @@ def get_actigraph_acc_data(subject, hdf5_file, autocalibrate = False, acc_datase
 	
 	try:
 
-		# read actigraph acceleration data
-		actigraph_acc = read_dataset_from_group(group_name = subject, dataset = acc_dataset, hdf5_file = hdf5_file)
-		# read actigraph meta-data
-		actigraph_meta_data = read_metadata_from_group_dataset(group_name = subject, dataset = acc_dataset, hdf5_file = hdf5_file)
-		# convert the values of the dictionary from bytes to string
-		actigraph_meta_data = dictionary_values_bytes_to_string(actigraph_meta_data)
+		# read actigraph acceleration data and meta-data with one open HDF5 file
+		bundle = read_group_bundle(subject, [acc_dataset], hdf5_file = hdf5_file)
+
+		# actigraph acceleration data
+		actigraph_acc = bundle['data'][acc_dataset]
+		# convert the values of the meta-data dictionary from bytes to string
+		actigraph_meta_data = dictionary_values_bytes_to_string(bundle['meta_data'][acc_dataset])
 		
 		if autocalibrate:
 			# parse out the weights
 			actigraph_weights = parse_calibration_weights(actigraph_meta_data)
 			# autocalibrate actigraph acceleration data 
 			actigraph_acc = calibrate_accelerometer_data(actigraph_acc, actigraph_weights)
-		# read actigraph acceleration time
-		actigraph_time = np.asarray(read_dataset_from_group(group_name = subject, dataset = time_dataset, hdf5_file = hdf5_file), dtype = 'datetime64[ms]')
+		# actigraph acceleration time
+		actigraph_time = _get_time_data(subject, bundle, acc_dataset, time_dataset, time_unit = 'ms', hdf5_file = hdf5_file) if return_time else None
 
 		return actigraph_acc, actigraph_meta_data, actigraph_time
 
@@ -64,7 +67,7 @@ def get_actigraph_acc_data(subject, hdf5_file, autocalibrate = False, acc_datase
 		exit(1)
 
 
-def get_actiwave_acc_data(subject, hdf5_file, autocalibrate = False):
+def get_actiwave_acc_data(subject, hdf5_file, autocalibrate = False, return_time = True):
 	"""
 	Read actiwave acceleration data from HDF5 file, if autocalibrate is set to True, then perform autocalibration. Also create the correct time array
 
@@ -76,6 +79,8 @@ def get_actiwave_acc_data(subject, hdf5_file, autocalibrate = False):
 		location of the HDF5 file where the data is stored. For example ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE
 	autocalibrate: Boolean (optional)
 		set to true if autocalibration need to be done
+	return_time : Boolean (optional)
+		if set to False, the time array is not created and None is returned instead
 
 	Returns
 	---------
@@ -87,31 +92,31 @@ def get_actiwave_acc_data(subject, hdf5_file, autocalibrate = False):
 		time array in np.datetime
 	"""
 
-	# read actiwave acceleration data
-	actiwave_acc = read_dataset_from_group(group_name = subject, dataset = 'actiwave_acc', hdf5_file = hdf5_file)
+	# read actiwave acceleration data and meta-data with one open HDF5 file
+	bundle = read_group_bundle(subject, ['actiwave_acc'], hdf5_file = hdf5_file)
 
-	# read actigraph meta-data
-	actiwave_meta_data = read_metadata_from_group_dataset(group_name = subject, dataset = 'actiwave_acc', hdf5_file = hdf5_file)
+	# actiwave acceleration data
+	actiwave_acc = bundle['data']['actiwave_acc']
 
-	# convert the values of the dictionary from bytes to string
-	actiwave_meta_data = dictionary_values_bytes_to_string(actiwave_meta_data)
+	# convert the values of the meta-data dictionary from bytes to string
+	actiwave_meta_data = dictionary_values_bytes_to_string(dict(bundle['meta_data']['actiwave_acc']))
 
 	if autocalibrate:
 		logging.debug('Perform autocalibration of acceleration signal')
-		# read actigraph meta-data
-		actiwave_meta_data = read_metadata_from_group_dataset(group_name = subject, dataset = 'actiwave_acc', hdf5_file = hdf5_file)
+		# the original actiwave meta-data
+		actiwave_meta_data = bundle['meta_data']['actiwave_acc']
 		# parse out the weights
 		actiwave_weights = parse_calibration_weights(actiwave_meta_data)
 		# autocalibrate actigraph acceleration data 
 		actiwave_acc = calibrate_accelerometer_data(actiwave_acc, actiwave_weights)
 	
-	# read actiwave acceleration time
-	actiwave_time = np.asarray(read_dataset_from_group(group_name = subject, dataset = 'actiwave_time', hdf5_file = hdf5_file), dtype = 'datetime64[ns]')
+	# actiwave acceleration time
+	actiwave_time = _get_time_data(subject, bundle, 'actiwave_acc', 'actiwave_time', time_unit = 'ns', hdf5_file = hdf5_file) if return_time else None
 
 	return actiwave_acc, actiwave_meta_data, actiwave_time
 
 
-def get_actiwave_hr_data(subject, hdf5_file):
+def get_actiwave_hr_data(subject, hdf5_file, return_time = True):
 	"""
 	Read actiwave heart rate data from HDF5 file
 
@@ -121,6 +126,8 @@ def get_actiwave_hr_data(subject, hdf5_file):
 		subject ID
 	hdf5_file : os.path()
 		location of the HDF5 file where the data is stored. For example ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE
+	return_time : Boolean (optional)
+		if set to False, the time array is not created and None is returned instead
 
 	Returns
 	---------
@@ -131,14 +138,17 @@ def get_actiwave_hr_data(subject, hdf5_file):
 
 	"""
 
-	# read actiwave acceleration data
-	actiwave_hr = read_dataset_from_group(group_name = subject, dataset = 'actiwave_hr', hdf5_file = hdf5_file)
-	# read actiwave acceleration time
-	actiwave_hr_time = np.asarray(read_dataset_from_group(group_name = subject, dataset = 'actiwave_hr_time', hdf5_file = hdf5_file), dtype = 'datetime64[ns]')
+	# read actiwave heart rate data and meta-data with one open HDF5 file
+	bundle = read_group_bundle(subject, ['actiwave_hr'], hdf5_file = hdf5_file)
+
+	# actiwave heart rate data
+	actiwave_hr = bundle['data']['actiwave_hr']
+	# actiwave heart rate time
+	actiwave_hr_time = _get_time_data(subject, bundle, 'actiwave_hr', 'actiwave_hr_time', time_unit = 'ns', hdf5_file = hdf5_file) if return_time else None
 
 	return actiwave_hr, actiwave_hr_time
 
-def get_actiwave_ecg_data(subject, hdf5_file):
+def get_actiwave_ecg_data(subject, hdf5_file, return_time = True):
 	"""
 	Read actiwave ECG data from HDF5 file
 
@@ -148,6 +158,8 @@ def get_actiwave_ecg_data(subject, hdf5_file):
 		subject ID		
 	hdf5_file : os.path()
 		location of the HDF5 file where the data is stored. For example ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE
+	return_time : Boolean (optional)
+		if set to False, the time array is not created and None is returned instead
 
 	Returns
 	---------
@@ -157,10 +169,13 @@ def get_actiwave_ecg_data(subject, hdf5_file):
 		time array in np.datetime
 	"""
 
-	# read actiwave acceleration data
-	actiwave_ecg = read_dataset_from_group(group_name = subject, dataset = 'actiwave_ecg', hdf5_file = hdf5_file)
-	# read actiwave acceleration time
-	actiwave_ecg_time = np.asarray(read_dataset_from_group(group_name = subject, dataset = 'actiwave_ecg_time', hdf5_file = hdf5_file), dtype = 'datetime64[ns]')
+	# read actiwave ECG data and meta-data with one open HDF5 file
+	bundle = read_group_bundle(subject, ['actiwave_ecg'], hdf5_file = hdf5_file)
+
+	# actiwave ECG data
+	actiwave_ecg = bundle['data']['actiwave_ecg']
+	# actiwave ECG time
+	actiwave_ecg_time = _get_time_data(subject, bundle, 'actiwave_ecg', 'actiwave_ecg_time', time_unit = 'ns', hdf5_file = hdf5_file) if return_time else None
 
 	return actiwave_ecg, actiwave_ecg_time
 
@@ -190,18 +205,18 @@ def get_actigraph_epoch_data(subject, epoch_dataset, hdf5_file):
 
 	try:
 
-		# read epoch data
-		epoch_data = read_dataset_from_group(group_name = subject, dataset = epoch_dataset, hdf5_file = hdf5_file)
+		# read epoch data and meta data with one open HDF5 file
+		bundle = read_group_bundle(subject, [epoch_dataset], hdf5_file = hdf5_file)
 
 		# check if subject has epoch data
-		if epoch_data is None:
+		if bundle is None or bundle['data'][epoch_dataset] is None:
 			logging.warning('Subject {} has no epoch data, skipping...'.format(subject))
 			return None, None, None
 
-		# read epoch meta data
-		epoch_meta_data = read_metadata_from_group_dataset(group_name = subject, dataset = epoch_dataset, hdf5_file = hdf5_file)
-		# convert the values of the dictionary from bytes to string
-		epoch_meta_data = dictionary_values_bytes_to_string(epoch_meta_data)
+		# epoch data
+		epoch_data = bundle['data'][epoch_dataset]
+		# convert the values of the meta data dictionary from bytes to string
+		epoch_meta_data = dictionary_values_bytes_to_string(bundle['meta_data'][epoch_dataset])
 
 		# create time array of the epoch data
 		epoch_time_data = create_epoch_time_array(start_date = epoch_meta_data['Start Date'], start_date_format = epoch_meta_data['Date Format'], start_time = epoch_meta_data['Start Time'], epoch_data_length = len(epoch_data), epoch_sec = 10)
@@ -250,4 +265,49 @@ def get_actigraph_epoch_60_data(epoch_data, epoch_time_data, start_epoch_sec = 1
 	except Exception as e:
 		
 		logging.error('[{}] : {}'.format(sys._getframe().f_code.co_name,e))
-		exit(1)
\ No newline at end of file
+		exit(1)
+
+
+def _get_time_data(subject, bundle, dataset, time_dataset, time_unit, hdf5_file):
+	"""
+	Create the time array of a dataset from its implicit time axis (see create_time_axis). Datasets that were saved before the time axis was introduced
+	have no time axis attributes, for these the time dataset with int64 timestamps is read instead
+
+	Parameters
+	---------
+	subject : string
+		subject ID
+	bundle : dict()
+		data and meta data of the dataset as returned by read_group_bundle
+	dataset : string
+		name of the dataset, for example actigraph_acc
+	time_dataset : string
+		name of the dataset with int64 timestamps, for example actigraph_time
+	time_unit : string
+		unit of the timestamps, for example 'ms' or 'ns'
+	hdf5_file : os.path()
+		location of the HDF5 file where the data is stored
+
+	Returns
+	---------
+	time_data : np.array((n_samples, 1))
+		time array in np.datetime
+	"""
+
+	# meta data of the dataset
+	meta_data = bundle['meta_data'][dataset]
+
+	# the gap table of the time axis is stored as a separate dataset
+	time_gaps = None
+	if meta_data.get('num_time_gaps', 0) > 0:
+		time_gaps = read_dataset_from_group(group_name = subject, dataset = get_time_gaps_dataset_name(dataset), hdf5_file = hdf5_file)
+
+	# implicit time axis from the attributes of the dataset and the gap table
+	time_axis = get_time_axis(meta_data, time_gaps)
+
+	# no time axis, read the timestamps from the time dataset
+	if time_axis is None:
+		return np.asarray(read_dataset_from_group(group_name = subject, dataset = time_dataset, hdf5_file = hdf5_file), dtype = 'datetime64[{}]'.format(time_unit))
+
+	# create the timestamps from the time axis
+	return create_time_axis_array(time_axis, num_rows = len(bundle['data'][dataset])).astype('datetime64[{}]'.format(time_unit))
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+"""
+	IMPORT PACKAGES
+"""
+import numpy as np
+from math import gcd
+from functools import reduce
+
+"""
+	IMPORTED FUNCTIONS
+"""
+from functions.helper_functions import calculate_vector_magnitude
+from algorithms.non_wear_time.hecht_2009 import hecht_2009_triaxial_calculate_non_wear_time_grid
+from functions.ml_functions import calculate_threshold_confusion_matrix
+from algorithms.non_wear_time.hees_2013 import calculate_block_statistics, combine_block_statistics, windows_to_blocks_minimum
+
+
+def get_epoch_label_counts(y, num_epochs, epoch_sec = 60):
+	"""
+	Count the true labels of each epoch when a vector with one prediction per epoch is upscaled to one prediction per second (nw_vector.repeat(epoch_sec)). Seconds
+	beyond the end of y are not counted, the same as clipping both vectors to the shortest length
+
+	Parameters
+	----------
+	y : np.array((n_seconds, 1))
+		true class labels per second, 1 for the positive class and 0 for the negative class
+	num_epochs : int
+		number of epochs of the predicted vector
+	epoch_sec : int (optional)
+		number of seconds of each epoch
+
+	Returns
+	---------
+	positive_counts : np.array(num_epochs)
+		number of seconds with a positive label within each epoch
+	total_counts : np.array(num_epochs)
+		number of seconds within each epoch that are within y
+	"""
+
+	# flatten the labels and clip them to the length of the upscaled prediction
+	y = np.asarray(y).reshape(-1)[:num_epochs * epoch_sec]
+
+	# epoch of each second
+	epochs = np.arange(len(y)) // epoch_sec
+
+	# count the positive labels and the seconds per epoch
+	positive_counts = np.bincount(epochs, weights = y == 1, minlength = num_epochs).astype(np.int64)
+	total_counts = np.bincount(epochs, minlength = num_epochs).astype(np.int64)
+
+	return positive_counts, total_counts
+
+
+def calculate_epoch_confusion_matrix(y_hat, positive_counts, total_counts):
+	"""
+	Calculate the confusion matrix of one or more predicted epoch vectors against the true labels per second, without upscaling the predictions to seconds. Epochs beyond
+	the end of y_hat are predicted as the negative class
+
+	Parameters
+	----------
+	y_hat : np.array((..., num_epochs))
+		predicted class labels per epoch, 1 for the positive class and 0 for the negative class. Leading dimensions are kept, for example one for each grid search combination
+	positive_counts : np.array(num_epochs)
+		number of seconds with a positive label within each epoch (see get_epoch_label_counts)
+	total_counts : np.array(num_epochs)
+		number of seconds within each epoch (see get_epoch_label_counts)
+
+	Returns
+	---------
+	confusion_matrix : np.array((..., 4))
+		tn, fp, fn, tp along the last axis
+	"""
+
+	# number of positive labels and negative labels
+	num_positive = positive_counts.sum()
+	num_negative = total_counts.sum() - num_positive
+
+	# number of predicted epochs
+	num_epochs = y_hat.shape[-1]
+
+	# seconds predicted as positive with a positive and with a negative label
+	tp = np.dot(y_hat, positive_counts[:num_epochs])
+	fp = np.dot(y_hat, (total_counts - positive_counts)[:num_epochs])
+
+	return np.stack([num_negative - fp, fp, num_positive - tp, tp], axis = -1).astype(np.int64)
+
+
+def calculate_hecht_grid_confusion_matrix(data, y, thresholds, time_intervals_mins, min_counts, epoch_sec = 60):
+	"""
+	Calculate the confusion matrix of all Hecht 2009 grid search combinations of one subject. The VMU is calculated once, the non-wear vectors of all combinations
+	are calculated in one pass (see hecht_2009_triaxial_calculate_non_wear_time_grid), and the confusion matrix is calculated per epoch instead of per second
+
+	Parameters
+	----------
+	data : np.array((n_epochs, axes))
+		epoch data of the subject
+	y : np.array((n_seconds, 1))
+		true non-wear time per second, non-wear time encoded as 1 and wear time as 0
+	thresholds : list
+		threshold values in VMU (T)
+	time_intervals_mins : list
+		time intervals in minutes (I)
+	min_counts : list
+		min counts (M)
+	epoch_sec : int (optional)
+		number of seconds of each epoch
+
+	Returns
+	---------
+	confusion_matrix : np.array((n_thresholds, n_time_intervals, n_min_counts, 4))
+		tn, fp, fn, tp of each combination, with non-wear time as the positive class
+	"""
+
+	# calculate the VMU
+	data = calculate_vector_magnitude(data)
+
+	# count the non-wear seconds per epoch
+	positive_counts, total_counts = get_epoch_label_counts(y, num_epochs = len(data), epoch_sec = epoch_sec)
+
+	# non-wear vectors of all combinations, wear time encoded as 1 and non-wear time as 0
+	nw_tensor = hecht_2009_triaxial_calculate_non_wear_time_grid(data, epoch_sec = epoch_sec, thresholds = thresholds, time_intervals_mins = time_intervals_mins, min_counts = min_counts)
+
+	# empty array to store the confusion matrix of each combination
+	confusion_matrix = np.zeros(nw_tensor.shape[:-1] + (4,), dtype = np.int64)
+
+	for t in range(len(thresholds)):
+
+		# reverse 0>1 and 1>0 so non-wear time is the positive class
+		confusion_matrix[t] = calculate_epoch_confusion_matrix(1 - nw_tensor[t], positive_counts, total_counts)
+
+	return confusion_matrix
+
+
+def calculate_hees_grid_confusion_matrix(data, y, min_non_wear_time_windows, window_overlaps, std_mg_thresholds, std_min_num_axes, value_range_mg_thresholds, value_range_min_num_axes, hz = 100):
+	"""
+	Calculate the confusion matrix of all Hees 2013 grid search combinations of one subject. The raw data is split into blocks of gcd(all windows and overlaps) minutes,
+	and the statistics of each block are calculated once (see calculate_block_statistics). The std and value range of the windows of each window and overlap combination
+	are combined from the blocks, and the confusion matrix is calculated per block instead of per second
+
+	At least SA axes have a std below ST when the SA-th smallest std of the window is below ST (the same for the value range). For each ST, SA, and VA combination the
+	value range thresholds VT then only move a cutoff: a block is non-wear time when the minimum over the windows that contain the block of the VA-th smallest value range
+	(-inf for windows that are already non-wear time by their std) is below VT. All VT values are evaluated in one sorted pass (see calculate_threshold_confusion_matrix)
+
+	The predictions are compared the same way as the per combination grid search: the non-wear vector is taken every hz samples (one value per second), and the samples
+	after the last full window are wear time
+
+	Parameters
+	----------
+	data : np.array((n_samples, axes))
+		raw acceleration data of the subject
+	y : np.array((n_seconds, 1))
+		true non-wear time per second, non-wear time encoded as 1 and wear time as 0
+	min_non_wear_time_windows : list
+		minimum non wear time windows in minutes (MW)
+	window_overlaps : list
+		window overlaps in minutes (WO)
+	std_mg_thresholds : list
+		standard deviation thresholds in mg (ST)
+	std_min_num_axes : list
+		minimum number of axes with a standard deviation below the threshold (SA)
+	value_range_mg_thresholds : list
+		value range thresholds in mg (VT)
+	value_range_min_num_axes : list
+		minimum number of axes with a value range below the threshold (VA)
+	hz : int (optional)
+		sample frequency of the data
+
+	Returns
+	---------
+	confusion_matrix : np.array((n_MW, n_WO, n_ST, n_SA, n_VT, n_VA, 4))
+		tn, fp, fn, tp of each combination, with non-wear time as the positive class
+	"""
+
+	# block length in minutes, so every window and overlap is a whole number of blocks
+	block_mins = reduce(gcd, list(min_non_wear_time_windows) + list(window_overlaps))
+
+	# statistics of each block
+	block_statistics = calculate_block_statistics(data, block_size = block_mins * 60 * hz)
+	num_blocks = len(block_statistics['mean'])
+
+	# the non-wear vector is taken every hz samples, so each block covers block_mins * 60 seconds. Clip the labels to the seconds of the non-wear vector
+	y = np.asarray(y).reshape(-1)[:-(-len(data) // hz)]
+
+	# count the non-wear seconds per block, with one extra epoch for the seconds after the last full block (these are always wear time)
+	positive_counts, total_counts = get_epoch_label_counts(y, num_epochs = num_blocks + 1, epoch_sec = block_mins * 60)
+
+	# the labels of each block twice: once with the number of non-wear seconds as positive samples and once with the number of wear seconds as negative samples
+	block_labels = np.concatenate([np.ones(num_blocks + 1, dtype = np.uint8), np.zeros(num_blocks + 1, dtype = np.uint8)])
+	block_weights = np.concatenate([positive_counts, total_counts - positive_counts])
+
+	# thresholds converted from mg to g
+	std_mg_thresholds = np.asarray(std_mg_thresholds, dtype = np.float64) / 1000
+	value_range_mg_thresholds = np.asarray(value_range_mg_thresholds, dtype = np.float64) / 1000
+
+	# empty array to store the confusion matrix of each combination
+	confusion_matrix = np.zeros((len(min_non_wear_time_windows), len(window_overlaps), len(std_mg_thresholds), len(std_min_num_axes), len(value_range_mg_thresholds), len(value_range_min_num_axes), 4), dtype = np.int64)
+
+	for i, mw in enumerate(min_non_wear_time_windows):
+		for j, wo in enumerate(window_overlaps):
+
+			# std and value range of each window
+			std, value_range = combine_block_statistics(block_statistics, window_blocks = mw // block_mins, step_blocks = wo // block_mins)
+
+			# SA-th smallest std and VA-th smallest value range of each window (n_SA, n_windows) and (n_VA, n_windows)
+			std_statistic = _get_min_num_axes_statistic(std, std_min_num_axes)
+			value_range_statistic = _get_min_num_axes_statistic(value_range, value_range_min_num_axes)
+
+			# windows with at least SA axes below the std threshold (n_ST, n_SA, n_windows)
+			std_windows = std_statistic[None] < std_mg_thresholds[:, None, None]
+
+			# value range statistic of each window, -inf for the windows that are non-wear time by their std (n_ST, n_SA, n_VA, n_windows)
+			window_statistic = np.where(std_windows[:, :, None], -np.inf, value_range_statistic[None, None])
+
+			# minimum statistic of the windows that contain each block, with inf (wear time) for the seconds after the last full block
+			block_statistic = windows_to_blocks_minimum(window_statistic, num_blocks = num_blocks, window_blocks = mw // block_mins, step_blocks = wo // block_mins)
+			block_statistic = np.concatenate([block_statistic, np.full(block_statistic.shape[:-1] + (1,), np.inf)], axis = -1)
+
+			# confusion matrix of all value range thresholds of each std threshold and number of axes combination
+			for st, sa, va in np.ndindex(block_statistic.shape[:-1]):
+				confusion_matrix[i, j, st, sa, :, va] = calculate_threshold_confusion_matrix(np.tile(block_statistic[st, sa, va], 2), block_labels, value_range_mg_thresholds, sample_weight = block_weights)
+
+	return confusion_matrix
+
+
+def _get_min_num_axes_statistic(values, min_num_axes):
+	"""
+	Return for each minimum number of axes the value that at least that number of axes are below: at least n axes are below a threshold when the n-th smallest value
+	is below that threshold
+
+	Parameters
+	----------
+	values : np.array((n_windows, axes))
+		statistic of each axis of each window
+	min_num_axes : list
+		minimum number of axes
+
+	Returns
+	---------
+	statistic : np.array((n_min_num_axes, n_windows))
+		n-th smallest value of each window, -inf if n is below 1 and inf if n is larger than the number of axes
+	"""
+
+	# sort the axes of each window (NaN values are sorted to the end, and are never below a threshold)
+	values = np.sort(values, axis = 1)
+
+	# empty array to store the statistic of each minimum number of axes
+	statistic = np.empty((len(min_num_axes), len(values)))
+
+	for i, n in enumerate(min_num_axes):
+		
+		if n < 1:
+			statistic[i] = -np.inf
+		elif n > values.shape[1]:
+			statistic[i] = np.inf
+		else:
+			statistic[i] = values[:, n - 1]
+
+	return statistic
+
+
+def get_grid_combinations(parameters):
+	"""
+	Return the combination names of a grid with one axis per parameter, in the same order as the axes of the grid (for example 5-20-2 for T = 5, I = 20, M = 2)
+
+	Parameters
+	----------
+	parameters : list
+		list with the values of each parameter, for example [T, I, M]
+
+	Returns
+	---------
+	combinations : np.array(n_values_parameter_1, n_values_parameter_2, ...)
+		combination name of each grid cell
+	"""
+
+	# one axis per parameter
+	grid = np.meshgrid(*[np.asarray(values, dtype = object) for values in parameters], indexing = 'ij')
+
+	# join the values of each cell
+	combinations = np.empty(grid[0].shape, dtype = object)
+	for index in np.ndindex(combinations.shape):
+		combinations[index] = '-'.join(str(x[index]) for x in grid)
+
+	return combinations
+
+
+def grid_to_combination_dict(confusion_matrix, combinations):
+	"""
+	Convert a grid of confusion matrices to a dictionary with combination name as key
+
+	Parameters
+	----------
+	confusion_matrix : np.array((..., 4))
+		tn, fp, fn, tp of each grid cell
+	combinations : np.array(...)
+		combination name of each grid cell (see get_grid_combinations)
+
+	Returns
+	---------
+	combination_to_confusion_matrix : dict()
+		combination name to np.array(tn, fp, fn, tp)
+	"""
+
+	return {combination : confusion_matrix[index] for index, combination in np.ndenumerate(combinations)}
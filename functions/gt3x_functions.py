@@ -6,11 +6,28 @@
 import os
 import logging
 import zipfile
+import tempfile
 import h5py
 import numpy as np
-from struct import unpack
+from struct import unpack, unpack_from
 from bitstring import Bits
 
+"""
+	GLOBAL VARIABLES
+"""
+# record index of the log.bin file: byte offset, type, timestamp, payload size, and checksum of each record
+LOG_INDEX_DTYPE = np.dtype([('offset', '<u8'), ('type', 'u1'), ('timestamp', '<u4'), ('size', '<u2'), ('checksum', 'u1')])
+# report of the problems found while reading log.bin: reason (checksum, unreadable, or missing), byte offset, timestamp, number of seconds, and number of bytes
+LOG_REPORT_DTYPE = np.dtype([('reason', 'S10'), ('offset', '<u8'), ('timestamp', '<u4'), ('num_seconds', '<u4'), ('num_bytes', '<u8')])
+# record types of the log.bin file (activity, battery, event, heart rate BLE, lux, metadata, tag, epoch, heart rate ANT, epoch 2, capsense, heart rate, epoch 3, epoch 4,
+# parameters, sensor schema, sensor data, activity 2), a header with another type is not a valid record
+LOG_RECORD_TYPE_IDS = frozenset([0x00, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0x09, 0x0B, 0x0C, 0x0D, 0x0E, 0x0F, 0x10, 0x15, 0x16, 0x18, 0x1A])
+# non-activity record types that are decoded next to the acceleration data: record type -> (dataset name, payload format)
+LOG_RECORD_TYPES = {	0x02 : ('battery', np.dtype([('voltage', '<u2')])),
+						0x05 : ('lux', np.dtype([('lux', '<u2')])),
+						0x06 : ('metadata', np.dtype([('payload', h5py.string_dtype())])),
+						0x0D : ('capsense', np.dtype([('signature', '<u2'), ('reference', '<u2'), ('state', 'u1'), ('bursts', 'u1')]))}
+
 
 def get_folder_gt3x_files():
 	"""
@@ -104,28 +121,140 @@ def extract_info(info_txt):
 		dictionary of key, value pairs as extracted from the info file
 	"""
 
-	# create empty dictionary
-	info_data = {}
-
 	try:
 		# open the file
 		with open(info_txt, 'r') as f:
-			# loop trough each of the lines
-			for l in f.readlines():
-				# strip away the new lines
-				l = l.strip('\r\n')
-				# split on semicolon + space (the timezone value has semicolons in it and not using the space would cause issues splitting it)
-				key, value = l.split(': ')
-				# add to dictionary and replace key values with space in key with underscore
-				info_data[key.replace(' ', '_')] = value
+			# parse the lines of the file
+			return parse_info_lines(f.readlines())
 	except Exception as e:
 		logging.error('Error extracting data from info.txt file: {}'.format(e))	
 		exit(1)
+
+
+def parse_info_lines(lines):
+	"""
+	Parse the lines of the info.txt file into a dictionary (see extract_info)
+
+	Parameters
+	----------
+	lines : list
+		list of strings, the lines of the info.txt file
+
+	Returns
+	---------
+	info_data : dictionary
+		dictionary of key, value pairs as extracted from the info file
+	"""
+
+	# create empty dictionary
+	info_data = {}
+
+	# loop trough each of the lines
+	for l in lines:
+		# strip away the new lines
+		l = l.strip('\r\n')
+		# skip empty lines
+		if not l:
+			continue
+		# split on semicolon + space (the timezone value has semicolons in it and not using the space would cause issues splitting it)
+		key, value = l.split(': ')
+		# add to dictionary and replace key values with space in key with underscore
+		info_data[key.replace(' ', '_')] = value
 	
 	# return dictionary
 	return info_data
 
 
+def read_gt3x_info(f):
+	"""
+	Read and parse the info.txt file directly from the .gt3x file, without unzipping it to disk first
+
+	Parameters
+	---------
+	f : string
+		file location of the .gt3x file
+
+	Returns
+	---------
+	info_data : dictionary
+		dictionary of key, value pairs as extracted from the info file
+	"""
+
+	try:
+		# open the .gt3x file and parse info.txt in memory
+		with zipfile.ZipFile(f, 'r') as myzip:
+			return parse_info_lines(myzip.read('info.txt').decode('utf-8-sig').splitlines())
+
+	except Exception as e:
+		logging.error('Error reading info.txt from .gt3x file {}: {}'.format(f, e))
+		return None
+
+
+def read_gt3x_file(f, block_size = 1048576):
+	"""
+	Read the info.txt and log.bin file directly from the .gt3x file, without unzipping them to disk first. The info.txt file is parsed in memory. When the log.bin file is stored
+	without compression, it is memory mapped straight out of the .gt3x file; when it is compressed, it is streamed out of the .gt3x file block by block into an anonymous 
+	temporary file that is memory mapped, so the decompressed log.bin file is never held in memory as a whole
+
+	Parameters
+	---------
+	f : string
+		file location of the .gt3x file
+	block_size : int (optional)
+		number of bytes decompressed at once when the log.bin file is compressed
+
+	Returns
+	---------
+	info_data : dictionary
+		dictionary of key, value pairs as extracted from the info file
+	log_buffer : np.array(n_bytes, dtype = np.uint8)
+		the content of the log.bin file. Can be used as log_bin by build_log_index and extract_log_vectorized
+	"""
+
+	try:
+
+		# open the .gt3x file
+		with zipfile.ZipFile(f, 'r') as myzip:
+
+			# parse info.txt in memory
+			info_data = parse_info_lines(myzip.read('info.txt').decode('utf-8-sig').splitlines())
+
+			# get the zip entry of the log.bin file
+			log_info = myzip.getinfo('log.bin')
+
+			# an empty log.bin file cannot be memory mapped
+			if log_info.file_size == 0:
+				log_buffer = np.zeros(0, dtype = np.uint8)
+
+			# uncompressed log.bin can be memory mapped from the .gt3x file
+			elif log_info.compress_type == zipfile.ZIP_STORED:
+
+				# read the local file header to find the start of the data: 30 bytes followed by the file name and extra field
+				myzip.fp.seek(log_info.header_offset)
+				local_header = myzip.fp.read(30)
+				data_offset = log_info.header_offset + 30 + unpack('<H', local_header[26:28])[0] + unpack('<H', local_header[28:30])[0]
+
+				# map the log.bin bytes into memory
+				log_buffer = np.memmap(f, dtype = np.uint8, mode = 'r', offset = data_offset, shape = (log_info.file_size,))
+
+			else:
+				# decompress log.bin block by block into a temporary file, the file is removed as soon as the memory map is closed
+				with myzip.open('log.bin') as log_stream, tempfile.TemporaryFile() as temp_file:
+
+					for block in iter(lambda: log_stream.read(block_size), b''):
+						temp_file.write(block)
+					temp_file.flush()
+
+					# map the decompressed log.bin bytes into memory, the memory map stays valid after the temporary file is closed
+					log_buffer = np.memmap(temp_file, dtype = np.uint8, mode = 'r', shape = (log_info.file_size,))
+
+	except Exception as e:
+		logging.error('Error reading .gt3x file {}: {}'.format(f, e))
+		return None, None
+
+	return info_data, log_buffer
+
+
 def extract_log(log_bin, acceleration_scale, sample_rate, use_scaling = False):
 	"""
 	Extract acceleration data from log.bin file that was unzipped from the raw .gt3x file
@@ -282,6 +411,853 @@ def extract_log(log_bin, acceleration_scale, sample_rate, use_scaling = False):
 		return log_data, time_data
 
 
+def extract_log_vectorized(log_bin, acceleration_scale, sample_rate, use_scaling = False, batch_size = 3600, log_index = None, verify_checksums = True, recovery = None, return_report = False):
+	"""
+	Extract acceleration data from log.bin file that was unzipped from the raw .gt3x file. Same output as extract_log, but instead of converting
+	each payload into a string of bits and slicing 12 characters at a time, the activity payloads are read by offset (see build_log_index) in batches 
+	of raw bytes and unpacked with numpy shifts and masks (see unpack_activity_payloads). The checksum of each activity record is validated on the same batches
+
+	Parameters
+	----------
+	log_bin : string or np.array
+		location of the log.bin file on disk, or the content of the log.bin file as returned by read_gt3x_file
+	acceleration_scale : float
+		Scale the resultant by the scale factor (this gives us an acceleration value in g's). See extract_log
+	sample_rate : int
+		sample rate, i.e. the number of Hz (how many values we obtain per second)
+	use_scaling: Boolean (optional)
+		if set to True, scale the signed integers by the acceleration_scale to obtain g values. See extract_log
+	batch_size : int (optional)
+		number of activity records that are unpacked at once. Default 3600, which is one hour of data
+	log_index : np.array (optional)
+		record index of the log.bin file as returned by build_log_index. If not given, the index will be created here
+	verify_checksums : Boolean (optional)
+		if set to True, validate the checksum of each activity record. Default True
+	recovery : string (optional)
+		what to do with records that have an invalid checksum or that cannot be read. None (default) stops the extraction and returns None, None. 
+		'skip' leaves out the records, which results in missing seconds within log_time. 'zero' keeps the records but sets the acceleration values to zero
+	return_report : Boolean (optional)
+		if set to True, also return the report of invalid records, unreadable bytes, and missing seconds (see create_log_report)
+
+	Returns
+	---------
+	log_data : numpy array (time steps * sample_rate, num axes)
+		log data contains the raw acceleration values in YXZ order
+	log_time : numpy array (time steps, 1)
+		log time contains the timestamps of measurements
+	log_report : np.array(n_entries, dtype = LOG_REPORT_DTYPE)
+		only returned when return_report is set to True
+	"""
+
+	# raw data values are stored in ints, to obtain values in G, we need to scale them by a factor found in the acceleration_scale parameter within the info.txt file. For example, 256.0
+	SCALING = 1 / acceleration_scale
+	# number of axes, the GTX3 is tri-axial, so we hard code it here.
+	NUM_AXES = 3
+
+	try:
+
+		# map the log.bin file into memory, the payloads are read by their offset
+		log_buffer = get_log_buffer(log_bin)
+
+		# scan the record headers if no index is given, skip unreadable bytes when a recovery mode is set
+		if log_index is None:
+			log_index = build_log_index(log_bin, recovery = recovery is not None)
+
+		# acceleration type 0 is the activity data, leave out the last record to return exactly the same number of records as extract_log
+		activity_rows = np.flatnonzero(log_index['type'] == 0)[:-1]
+		activity_index = log_index[activity_rows]
+
+		# define the size of the payload
+		SIZE = len(activity_index)
+
+		# create empty array for the acceleration data, use float when we want to store the acceleration data in G
+		log_data = np.empty((sample_rate * SIZE , NUM_AXES), dtype = np.float64 if use_scaling else np.int16)
+
+		# keep track of which records have a valid checksum
+		valid = np.ones(len(log_index), dtype = bool)
+
+		# read and unpack the records batch by batch
+		for start in range(0, SIZE, batch_size):
+
+			# read the header and payload bytes of the batch (n_records, 8 + payload size)
+			records = read_log_records(log_buffer, activity_index[start:start + batch_size])
+
+			# validate the checksums of the batch
+			if verify_checksums:
+				valid[activity_rows[start:start + len(records)]] = calculate_log_checksums(records) == activity_index['checksum'][start:start + len(records)]
+
+			# unpack the 12 bit values of the payloads (bytes after the 8 byte header), and scale if set to True
+			payload_values = unpack_activity_payloads(records[:, 8:], sample_rate, NUM_AXES)
+			if use_scaling:
+				payload_values = payload_values * SCALING
+
+			# add batch to overall numpy array
+			log_data[start * sample_rate:(start + len(records)) * sample_rate] = payload_values
+
+		# validate the checksums of the other record types
+		if verify_checksums and return_report:
+			other_rows = np.flatnonzero(log_index['type'] != 0)
+			valid[other_rows] = validate_log_checksums(log_buffer, log_index[other_rows])
+
+		# valid activity records
+		valid_activity = valid[activity_rows]
+
+		# handle invalid activity records
+		if not np.all(valid_activity):
+
+			logging.warning('{} activity records with invalid checksum'.format(np.sum(~valid_activity)))
+
+			if recovery is None:
+				raise ValueError('Invalid checksum, set recovery to skip or zero the invalid records')
+			elif recovery == 'zero':
+				# set the acceleration of the invalid records to zero
+				log_data.reshape(SIZE, sample_rate, NUM_AXES)[~valid_activity] = 0
+			elif recovery == 'skip':
+				# leave out the invalid records
+				log_data = log_data.reshape(SIZE, sample_rate, NUM_AXES)[valid_activity].reshape(-1, NUM_AXES)
+				activity_index = activity_index[valid_activity]
+			else:
+				raise ValueError('Unknown recovery mode: {}'.format(recovery))
+
+		# the timestamps are part of the index
+		time_data = activity_index['timestamp'].astype(np.uint32).reshape(-1, 1)
+
+		logging.info('Finished processing activity data')
+
+	except Exception as e:
+		logging.error('Unpacking GTX3 exception: {}'.format(e))
+		return (None, None, None) if return_report else (None, None)
+
+	# return acceleration data + time data
+	if return_report:
+		return log_data, time_data, create_log_report(log_index, valid, time_data)
+	return log_data, time_data
+
+
+def build_log_index(log_bin, recovery = False):
+	"""
+	Scan the record headers of the log.bin file once and create an index of all the records. The index contains the offset, type, timestamp, size, and checksum of
+	each record and can be used to read the payloads by offset without reading the log.bin file header by header again (see read_log_payloads)
+
+	Log Record Format
+	Offset (bytes)	Size (bytes)	Name	Description	Part of Record
+	0	1	Seperator	An ASCII record separator byte (1Eh) marks the beginning of each log record.	Header
+	1	1	Type	A type identifier is used to interpret the payload of the record.	Header
+	2	4	Timestamp	The date and time of the data contained in the record are marked to the nearest second in Unix time format.	Header
+	6	2	Size	The size of the payload is given in bytes as an little-endian unsigned integer.	Header
+	8	Size	Payload	The payload of the record	Payload
+	8 + Size	1	Checksum	1's complement, exclusive-or (XOR) of the log header and payload with an initial value of zero	Checksum
+
+	Parameters
+	----------
+	log_bin : string or np.array
+		location of the log.bin file on disk, or the content of the log.bin file as returned by read_gt3x_file
+	recovery : Boolean (optional)
+		if set to True, unreadable bytes (no record separator, an unknown record type, or a record that runs past the end of the file) are skipped and scanning continues 
+		at the next valid record. If set to False, scanning stops at the first unreadable byte
+
+	A record with a corrupt size byte ends at the wrong offset, so the next header is invalid. When the record before an invalid header also has an invalid checksum, 
+	that record is left out of the index as well, and scanning continues after its separator. The left out bytes are reported as unreadable (see create_log_report)
+
+	Returns
+	---------
+	log_index : np.array(n_records, dtype = LOG_INDEX_DTYPE)
+		structured numpy array with the fields offset, type, timestamp, size, and checksum
+	"""
+
+	# map the log.bin file into memory, only the header bytes are read when scanning
+	log_buffer = get_log_buffer(log_bin)
+	# total number of bytes
+	num_bytes = len(log_buffer)
+
+	# empty list to store the index rows
+	log_index = []
+	# offset of the current record
+	offset = 0
+
+	# keep reading until there is no full record left
+	while offset + 9 <= num_bytes:
+
+		# extract header information
+		separator, payload_type, timestamp, size = unpack_from("<BBLH", log_buffer, offset)
+
+		# the record needs to start with the record separator, have a known type, and end within the file
+		if separator != 0x1E or payload_type not in LOG_RECORD_TYPE_IDS or offset + 9 + size > num_bytes:
+
+			# the previous record ends here, it has a corrupt header (for example the size) when its checksum is invalid as well
+			offset, _ = _remove_corrupt_records(log_buffer, log_index, offset)
+
+			if not recovery:
+				logging.warning('Invalid or incomplete record at offset {}, stopped scanning'.format(offset))
+				break
+
+			# continue at the next valid record
+			next_offset = _find_next_record(log_buffer, offset + 1, num_bytes)
+			logging.warning('Unreadable bytes at offset {}, continue at offset {}'.format(offset, next_offset))
+
+			if next_offset is None:
+				break
+
+			offset = next_offset
+			continue
+
+		# add the record to the index
+		log_index.append((offset, payload_type, timestamp, size, log_buffer[offset + 8 + size]))
+
+		# move to the next record: 8 bytes header, payload, 1 byte checksum
+		offset += 9 + size
+
+	logging.info('Indexed {} records'.format(len(log_index)))
+
+	return np.array(log_index, dtype = LOG_INDEX_DTYPE)
+
+
+def extract_gt3x_log_chunks(f, acceleration_scale, sample_rate, use_scaling = False, chunk_records = 3600, verify_checksums = True, recovery = None):
+	"""
+	Stream the log.bin file out of the .gt3x file and decode the acceleration data chunk by chunk. Only one chunk of log.bin records is kept in memory at a time, so the 
+	memory usage does not depend on the length of the recording. Concatenating all chunks gives the same data as extract_log_vectorized
+
+	Parameters
+	----------
+	f : string
+		file location of the .gt3x file
+	acceleration_scale : float
+		Scale the resultant by the scale factor (this gives us an acceleration value in g's). See extract_log
+	sample_rate : int
+		sample rate, i.e. the number of Hz (how many values we obtain per second)
+	use_scaling: Boolean (optional)
+		if set to True, scale the signed integers by the acceleration_scale to obtain g values. See extract_log
+	chunk_records : int (optional)
+		number of activity records within one chunk. Default 3600, which is one hour of data
+	verify_checksums : Boolean (optional)
+		if set to True, validate the checksum of each record. Default True
+	recovery : string (optional)
+		what to do with records that have an invalid checksum or that cannot be read. None (default) raises a ValueError. 'skip' leaves out the records, 
+		'zero' keeps the records but sets the acceleration values to zero. See extract_log_vectorized
+
+	Yields
+	---------
+	log_data : numpy array (chunk time steps * sample_rate, num axes)
+		log data contains the raw acceleration values in YXZ order
+	log_time : numpy array (chunk time steps, 1)
+		log time contains the timestamps of measurements
+	log_index : np.array(n_records, dtype = LOG_INDEX_DTYPE)
+		index of all records within the chunk, the offsets are relative to the start of the log.bin file
+	log_report : np.array(n_entries, dtype = LOG_REPORT_DTYPE)
+		invalid records, unreadable bytes, and missing seconds within the chunk (see create_log_report)
+	log_records : dictionary
+		battery, lux, metadata, and capsense records within the chunk (see extract_log_records)
+	"""
+
+	# raw data values are stored in ints, to obtain values in G, we need to scale them by a factor found in the acceleration_scale parameter within the info.txt file. For example, 256.0
+	SCALING = 1 / acceleration_scale
+	# number of axes, the GTX3 is tri-axial, so we hard code it here.
+	NUM_AXES = 3
+
+	# last timestamp and end offset of the previous chunk, to report missing seconds and unreadable bytes between chunks
+	previous_time, previous_end = None, 0
+
+	# open the log.bin file as a stream from the .gt3x file
+	with zipfile.ZipFile(f, 'r') as myzip, myzip.open('log.bin') as log_stream:
+
+		# the chunks are decoded one step behind, so we know which chunk is the last one
+		chunks = iter_log_chunks(log_stream, chunk_records = chunk_records, recovery = recovery is not None)
+		next_chunk = next(chunks)
+
+		while next_chunk is not None:
+
+			# get the current chunk and read ahead
+			chunk_index, chunk_buffer, chunk_offset = next_chunk
+			next_chunk = next(chunks, None)
+
+			# validate the checksums of all records within the chunk
+			valid = validate_log_checksums(chunk_buffer, chunk_index) if verify_checksums else np.ones(len(chunk_index), dtype = bool)
+
+			# acceleration type 0 is the activity data
+			activity_rows = np.flatnonzero(chunk_index['type'] == 0)
+
+			# leave out the last activity record of the last chunk to return exactly the same number of records as extract_log
+			if next_chunk is None:
+				activity_rows = activity_rows[:-1]
+
+			# read and unpack the payloads of the chunk, and scale if set to True
+			log_data = unpack_activity_payloads(read_log_payloads(chunk_buffer, chunk_index[activity_rows]), sample_rate, NUM_AXES)
+			if use_scaling:
+				log_data = log_data * SCALING
+
+			# handle invalid activity records
+			valid_activity = valid[activity_rows]
+			if not np.all(valid_activity):
+
+				if recovery is None:
+					raise ValueError('Invalid checksum within chunk at offset {}, set recovery to skip or zero the invalid records'.format(chunk_offset))
+				elif recovery == 'zero':
+					# set the acceleration of the invalid records to zero
+					log_data.reshape(len(activity_rows), sample_rate, NUM_AXES)[~valid_activity] = 0
+				elif recovery == 'skip':
+					# leave out the invalid records
+					log_data = log_data.reshape(len(activity_rows), sample_rate, NUM_AXES)[valid_activity].reshape(-1, NUM_AXES)
+					activity_rows = activity_rows[valid_activity]
+				else:
+					raise ValueError('Unknown recovery mode: {}'.format(recovery))
+
+			# the timestamps are part of the index
+			log_time = chunk_index['timestamp'][activity_rows].astype(np.uint32).reshape(-1, 1)
+
+			# decode the other record types of the chunk, the checksums are already validated
+			log_records = extract_log_records(chunk_buffer, chunk_index[valid], verify_checksums = False)
+
+			# make the offsets relative to the start of the log.bin file
+			chunk_index['offset'] += chunk_offset
+
+			# create the report of the chunk
+			log_report = create_log_report(chunk_index, valid, log_time, previous_time = previous_time, previous_end = previous_end)
+
+			# keep track of the end of this chunk
+			if len(log_time) > 0:
+				previous_time = log_time[-1, 0]
+			if len(chunk_index) > 0:
+				previous_end = int(chunk_index['offset'][-1]) + 9 + int(chunk_index['size'][-1])
+
+			yield log_data, log_time, chunk_index, log_report, log_records
+
+
+def iter_log_chunks(log_stream, chunk_records = 3600, recovery = False, block_size = 1048576):
+	"""
+	Read the records of a log.bin stream sequentially and return them in chunks that contain chunk_records activity records. A chunk is only returned once the next activity
+	record has been read, so the last activity record of the stream always ends up in the last chunk
+
+	Parameters
+	----------
+	log_stream : file object
+		binary stream of the log.bin file, for example opened from the .gt3x file with zipfile
+	chunk_records : int (optional)
+		number of activity records within one chunk
+	recovery : Boolean (optional)
+		if set to True, unreadable bytes are skipped and reading continues at the next valid record (see build_log_index)
+	block_size : int (optional)
+		number of bytes read from the stream at once
+
+	Yields
+	---------
+	chunk_index : np.array(n_records, dtype = LOG_INDEX_DTYPE)
+		index of the records within the chunk, the offsets are relative to the start of chunk_buffer
+	chunk_buffer : np.array(n_bytes, dtype = np.uint8)
+		the bytes of the records within the chunk
+	chunk_offset : int
+		offset of the chunk relative to the start of the log.bin stream
+	"""
+
+	# the largest possible record: 8 bytes header, 65535 bytes payload, 1 byte checksum
+	MAX_RECORD_SIZE = 9 + 65535
+
+	# bytes read from the stream, the current chunk starts at position 0
+	data = bytearray()
+	# position of the current record within data, and whether the end of the stream has been reached
+	pos, eof = 0, False
+	# index of the current chunk, offset of the current chunk, and the number of activity records within the chunk
+	chunk_index, chunk_offset, num_activity = [], 0, 0
+
+	while True:
+
+		# make sure that a full record can be read from data
+		while not eof and len(data) - pos < MAX_RECORD_SIZE:
+			block = log_stream.read(block_size)
+			eof = len(block) == 0
+			data += block
+
+		# stop when there is no full header left
+		if pos + 9 > len(data):
+			break
+
+		# extract header information (see build_log_index for the log record format)
+		separator, payload_type, timestamp, size = unpack_from("<BBLH", data, pos)
+
+		# the record needs to start with the record separator, have a known type, and needs to be complete
+		if separator != 0x1E or payload_type not in LOG_RECORD_TYPE_IDS or pos + 9 + size > len(data):
+
+			# the previous records of the chunk with a corrupt header, scanning continues after their separator (see build_log_index)
+			pos, removed = _remove_corrupt_records(data, chunk_index, pos)
+			num_activity -= sum(1 for x in removed if x[1] == 0)
+
+			if not recovery:
+				logging.warning('Invalid or incomplete record at offset {}, stopped reading'.format(chunk_offset + pos))
+				break
+
+			# continue at the next valid record, or after the bytes that have been searched if there is more to read
+			next_pos = _find_next_record(data, pos + 1, len(data))
+			logging.warning('Unreadable bytes at offset {}, continue at offset {}'.format(chunk_offset + pos, None if next_pos is None else chunk_offset + next_pos))
+
+			if next_pos is None:
+				if eof:
+					break
+				next_pos = max(pos + 1, len(data) - MAX_RECORD_SIZE)
+
+			pos = next_pos
+			continue
+
+		# a new activity record when the chunk is full: return the chunk and start a new one (this way the last activity record always ends up in the last chunk)
+		if payload_type == 0 and num_activity == chunk_records:
+
+			yield np.array(chunk_index, dtype = LOG_INDEX_DTYPE), np.frombuffer(bytes(data[:pos]), dtype = np.uint8), chunk_offset
+
+			# start a new chunk at the current record
+			del data[:pos]
+			chunk_offset += pos
+			pos, chunk_index, num_activity = 0, [], 0
+
+		# add the record to the chunk
+		chunk_index.append((pos, payload_type, timestamp, size, data[pos + 8 + size]))
+
+		# count the activity records
+		if payload_type == 0:
+			num_activity += 1
+
+		# move to the next record
+		pos += 9 + size
+
+	# return the last chunk
+	yield np.array(chunk_index, dtype = LOG_INDEX_DTYPE), np.frombuffer(bytes(data[:pos]), dtype = np.uint8), chunk_offset
+
+
+def extract_log_records(log_buffer, log_index, verify_checksums = True):
+	"""
+	Decode the non-activity records of the log.bin file (see LOG_RECORD_TYPES) into columnar arrays. The records are read by their offset from the record index, so
+	the log.bin file does not need to be scanned again
+
+	Battery record (type 0x02): battery voltage in millivolts (little-endian unsigned 16 bit)
+	Lux record (type 0x05): raw lux value (little-endian unsigned 16 bit), multiply by the Lux_Scale_Factor of info.txt to obtain lux
+	Metadata record (type 0x06): arbitrary metadata as a JSON string
+	Capsense record (type 0x0D): signature and reference of the capacitive sensor (both little-endian unsigned 16 bit), wear state (0 = not worn, 1 = worn), and number of bursts
+
+	Parameters
+	----------
+	log_buffer : np.array(n_bytes, dtype = np.uint8)
+		the content of the log.bin file, for example as a np.memmap
+	log_index : np.array(n_records, dtype = LOG_INDEX_DTYPE)
+		record index of the log.bin file as returned by build_log_index
+	verify_checksums : Boolean (optional)
+		if set to True, records with an invalid checksum are left out. Default True
+
+	Returns
+	---------
+	log_records : dictionary
+		for each record name (battery, lux, metadata, capsense) a structured numpy array with the timestamp and the decoded payload fields
+	"""
+
+	# empty dictionary to store the records of each type
+	log_records = {}
+
+	for payload_type, (name, payload_dtype) in LOG_RECORD_TYPES.items():
+
+		# dtype of the decoded records: timestamp + payload fields
+		record_dtype = np.dtype([('timestamp', '<u4')] + [(field, payload_dtype.fields[field][0]) for field in payload_dtype.names])
+
+		# rows of this record type
+		type_index = log_index[log_index['type'] == payload_type]
+
+		# leave out records with an invalid checksum
+		if verify_checksums:
+			type_index = type_index[validate_log_checksums(log_buffer, type_index)]
+
+		# records with a fixed payload format (metadata has a variable size)
+		if payload_dtype.names != ('payload',):
+
+			# leave out records that are too small for the payload format
+			too_small = type_index['size'] < payload_dtype.itemsize
+			if np.any(too_small):
+				logging.warning('Skipping {} {} records with a payload smaller than {} bytes'.format(np.sum(too_small), name, payload_dtype.itemsize))
+				type_index = type_index[~too_small]
+
+			# read only the bytes of the payload format, newer firmware might add bytes at the end
+			payloads = read_log_payloads(log_buffer, _with_payload_size(type_index, payload_dtype.itemsize))
+
+			# interpret the payload bytes as the payload format
+			decoded = np.frombuffer(payloads.tobytes(), dtype = payload_dtype)
+		else:
+			# decode each metadata record as string
+			decoded = np.array([(bytes(log_buffer[row['offset'] + 8:row['offset'] + 8 + row['size']]).decode('utf-8', 'replace'),) for row in type_index], dtype = payload_dtype)
+
+		# combine the timestamps and the payload fields
+		records = np.empty(len(type_index), dtype = record_dtype)
+		records['timestamp'] = type_index['timestamp']
+		for field in payload_dtype.names:
+			records[field] = decoded[field]
+
+		log_records[name] = records
+
+	return log_records
+
+
+def _with_payload_size(log_index, size):
+	"""
+	Return a copy of the record index where all payload sizes are set to size, this way only the first size bytes of each payload are read (see read_log_records)
+
+	Parameters
+	----------
+	log_index : np.array(n_records, dtype = LOG_INDEX_DTYPE)
+		index rows of the records
+	size : int
+		payload size
+
+	Returns
+	---------
+	log_index : np.array(n_records, dtype = LOG_INDEX_DTYPE)
+		copy of the index rows with the new payload size
+	"""
+
+	log_index = log_index.copy()
+	log_index['size'] = size
+
+	return log_index
+
+
+def get_log_buffer(log_bin):
+	"""
+	Return the content of the log.bin file as an array of bytes
+
+	Parameters
+	----------
+	log_bin : string or np.array
+		location of the log.bin file on disk, or the content of the log.bin file (see read_gt3x_file)
+
+	Returns
+	---------
+	log_buffer : np.array(n_bytes, dtype = np.uint8)
+		the content of the log.bin file, memory mapped when log_bin is a file location
+	"""
+
+	# already an array of bytes, for example read directly from the .gt3x file
+	if isinstance(log_bin, np.ndarray):
+		return log_bin
+
+	# map the log.bin file into memory
+	return np.memmap(log_bin, dtype = np.uint8, mode = 'r')
+
+
+def read_log_records(log_buffer, log_index):
+	"""
+	Read the header and payload bytes of a set of records by their offset (the checksum byte is already part of the index)
+
+	Parameters
+	----------
+	log_buffer : np.array(n_bytes, dtype = np.uint8)
+		the content of the log.bin file, for example as a np.memmap
+	log_index : np.array(n_records, dtype = LOG_INDEX_DTYPE)
+		index rows of the records to read. All records need to have the same payload size
+
+	Returns
+	---------
+	records : np.array((n_records, 8 + payload_size), dtype = np.uint8)
+		raw bytes of the header and payload, one record per row
+	"""
+
+	# empty records
+	if len(log_index) == 0:
+		return np.empty((0, 8), dtype = np.uint8)
+
+	# all payloads need to be of the same size to be read into a 2D array
+	size = int(log_index['size'][0])
+	if np.any(log_index['size'] != size):
+		raise ValueError('Payloads of unequal size cannot be read into a single array')
+
+	# the position of each header and payload byte
+	positions = log_index['offset'].astype(np.int64).reshape(-1, 1) + np.arange(8 + size)
+
+	# read all bytes at once
+	return np.asarray(log_buffer[positions], dtype = np.uint8)
+
+
+def read_log_payloads(log_buffer, log_index):
+	"""
+	Read the payloads of a set of records by their offset
+
+	Parameters
+	----------
+	log_buffer : np.array(n_bytes, dtype = np.uint8)
+		the content of the log.bin file, for example as a np.memmap
+	log_index : np.array(n_records, dtype = LOG_INDEX_DTYPE)
+		index rows of the records to read. All records need to have the same payload size
+
+	Returns
+	---------
+	payloads : np.array((n_records, payload_size), dtype = np.uint8)
+		raw bytes of the payloads, one record per row
+	"""
+
+	# the payload starts after the 8 byte header
+	return read_log_records(log_buffer, log_index)[:, 8:]
+
+
+def calculate_log_checksums(records):
+	"""
+	Calculate the checksum of a batch of records. The checksum is the 1's complement, exclusive-or (XOR) of the log header and payload with an initial value of zero
+
+	Parameters
+	----------
+	records : np.array((n_records, 8 + payload_size), dtype = np.uint8)
+		raw bytes of the header and payload, one record per row (see read_log_records)
+
+	Returns
+	---------
+	checksums : np.array(n_records, dtype = np.uint8)
+		calculated checksum of each record
+	"""
+
+	# XOR of all bytes within a record, followed by the 1's complement
+	return np.invert(np.bitwise_xor.reduce(records, axis = 1, initial = 0).astype(np.uint8))
+
+
+def validate_log_checksums(log_buffer, log_index, batch_size = 3600):
+	"""
+	Validate the checksums of a set of records. Records of the same payload size are validated in batches
+
+	Parameters
+	----------
+	log_buffer : np.array(n_bytes, dtype = np.uint8)
+		the content of the log.bin file, for example as a np.memmap
+	log_index : np.array(n_records, dtype = LOG_INDEX_DTYPE)
+		index rows of the records to validate
+	batch_size : int (optional)
+		number of records that are validated at once
+
+	Returns
+	---------
+	valid : np.array(n_records, dtype = bool)
+		True if the calculated checksum matches the checksum of the record
+	"""
+
+	# empty array to store if a record is valid
+	valid = np.zeros(len(log_index), dtype = bool)
+
+	# records of the same size can be read into one array
+	for size in np.unique(log_index['size']):
+
+		# rows with this payload size
+		rows = np.flatnonzero(log_index['size'] == size)
+
+		for start in range(0, len(rows), batch_size):
+
+			# rows of the batch
+			batch = rows[start:start + batch_size]
+
+			# compare the calculated checksums with the checksums of the records
+			valid[batch] = calculate_log_checksums(read_log_records(log_buffer, log_index[batch])) == log_index['checksum'][batch]
+
+	return valid
+
+
+def create_log_report(log_index, valid, log_time, previous_time = None, previous_end = 0):
+	"""
+	Create a report of the problems found while reading the log.bin file:
+	- checksum : records with an invalid checksum
+	- unreadable : bytes that could not be read as a record, and were skipped (see build_log_index with recovery = True)
+	- missing : missing seconds within the acceleration data, for example due to skipped records
+
+	Parameters
+	----------
+	log_index : np.array(n_records, dtype = LOG_INDEX_DTYPE)
+		index of the records, the offsets are relative to the start of the log.bin file
+	valid : np.array(n_records, dtype = bool)
+		True if the record has a valid checksum
+	log_time : np.array(time steps, 1)
+		timestamps of the extracted acceleration data
+	previous_time : int (optional)
+		last timestamp before log_time, used when the log.bin file is processed in chunks
+	previous_end : int (optional)
+		offset where the records before log_index end, used when the log.bin file is processed in chunks
+
+	Returns
+	---------
+	log_report : np.array(n_entries, dtype = LOG_REPORT_DTYPE)
+		structured numpy array with the fields reason, offset, timestamp, num_seconds, and num_bytes
+	"""
+
+	# empty list to store the report entries
+	log_report = []
+
+	# records with an invalid checksum: an activity record is one second of data
+	for row in log_index[~valid]:
+		log_report.append((b'checksum', row['offset'], row['timestamp'], 1 if row['type'] == 0 else 0, 9 + int(row['size'])))
+
+	# unreadable bytes between consecutive records, with the timestamp of the record after the unreadable bytes
+	record_starts = log_index['offset'].astype(np.int64)
+	record_ends = np.concatenate([[previous_end], record_starts + 9 + log_index['size']])[:-1]
+	for row in np.flatnonzero(record_starts > record_ends):
+		log_report.append((b'unreadable', record_ends[row], log_index['timestamp'][row], 0, record_starts[row] - record_ends[row]))
+
+	# missing seconds within the acceleration data
+	timestamps = log_time[:, 0].astype(np.int64)
+	if previous_time is not None:
+		timestamps = np.concatenate([[previous_time], timestamps])
+	for row in np.flatnonzero(np.diff(timestamps) > 1):
+		log_report.append((b'missing', 0, timestamps[row] + 1, timestamps[row + 1] - timestamps[row] - 1, 0))
+
+	if len(log_report) > 0:
+		logging.warning('Found {} problems while reading log.bin'.format(len(log_report)))
+
+	return np.array(log_report, dtype = LOG_REPORT_DTYPE)
+
+
+def _find_next_record(log_buffer, offset, num_bytes, search_size = 65536):
+	"""
+	Find the next valid record after unreadable bytes. A valid record starts with the record separator, has a known type, ends within the buffer, and has a valid checksum
+
+	Parameters
+	----------
+	log_buffer : np.array(n_bytes, dtype = np.uint8) or bytearray
+		the content of the log.bin file
+	offset : int
+		offset to start searching from
+	num_bytes : int
+		number of bytes within log_buffer
+	search_size : int (optional)
+		number of bytes that are searched for a record separator at once
+
+	Returns
+	---------
+	offset : int
+		offset of the next valid record, None if there is no valid record left
+	"""
+
+	while offset + 9 <= num_bytes:
+
+		# find the next record separator
+		position = bytes(log_buffer[offset:offset + search_size]).find(b'\x1e')
+
+		# no record separator within the searched bytes, continue with the next bytes
+		if position == -1:
+			offset += search_size
+			continue
+
+		# candidate offset of the next record
+		offset += position
+
+		# check if the candidate is a complete record of a known type with a valid checksum
+		if offset + 9 <= num_bytes and log_buffer[offset + 1] in LOG_RECORD_TYPE_IDS:
+
+			# read the size of the payload
+			size = unpack_from("<H", log_buffer, offset + 6)[0]
+
+			if offset + 9 + size <= num_bytes and _has_valid_checksum(log_buffer, offset, size):
+				return offset
+
+		# not a valid record, continue searching after the separator
+		offset += 1
+
+	return None
+
+
+def _remove_corrupt_records(log_buffer, log_index, offset):
+	"""
+	Remove the last records of the index when they end at offset, where an invalid header was found, and have an invalid checksum. Such a record most likely has a
+	corrupt header, for example a corrupt size byte that makes the record end at the wrong offset
+
+	Parameters
+	----------
+	log_buffer : np.array(n_bytes, dtype = np.uint8) or bytearray
+		the content of the log.bin file
+	log_index : list
+		index rows (offset, type, timestamp, size, checksum) of the records that have been read, the corrupt records are removed from the list
+	offset : int
+		offset of the invalid header
+
+	Returns
+	---------
+	offset : int
+		offset of the first removed record, or the given offset if no record was removed. Scanning continues after this offset
+	removed : list
+		the removed index rows
+	"""
+
+	# empty list to store the removed rows
+	removed = []
+
+	while len(log_index) > 0:
+
+		# the last record needs to end at the invalid header and have an invalid checksum
+		record_offset, _, _, size, _ = log_index[-1]
+		if record_offset + 9 + size != offset or _has_valid_checksum(log_buffer, record_offset, size):
+			break
+
+		removed.append(log_index.pop())
+		offset = record_offset
+
+	if len(removed) > 0:
+		logging.warning('Record with corrupt header at offset {}, removed {} record(s) from the index'.format(offset, len(removed)))
+
+	return offset, removed
+
+
+def _has_valid_checksum(log_buffer, offset, size):
+	"""
+	Return True if the record at offset with a payload of size bytes has a valid checksum (see calculate_log_checksums)
+	"""
+
+	# calculate the checksum of the header and payload
+	checksum = calculate_log_checksums(np.frombuffer(bytes(log_buffer[offset:offset + 8 + size]), dtype = np.uint8).reshape(1, -1))[0]
+
+	return checksum == log_buffer[offset + 8 + size]
+
+
+def unpack_activity_payloads(payloads, sample_rate, num_axes = 3):
+	"""
+	Unpack a batch of activity payloads into signed integers. Each payload contains one second of samples packed into 12-bit two's complement
+	values in YXZ order, so every 3 bytes hold 2 values:
+
+		byte 0       byte 1       byte 2
+		aaaaaaaa     aaaabbbb     bbbbbbbb
+
+	Parameters
+	----------
+	payloads : np.array((n_records, payload_size), dtype = np.uint8)
+		raw bytes of the activity payloads, one record per row
+	sample_rate : int
+		sample rate, i.e. the number of Hz (how many values we obtain per second)
+	num_axes : int (optional)
+		number of axes, default 3 (YXZ)
+
+	Returns
+	---------
+	log_data : np.array((n_records * sample_rate, num_axes), dtype = np.int16)
+		signed integer acceleration values in YXZ order
+	"""
+
+	# number of 12 bit values within one record
+	num_values = sample_rate * num_axes
+	# number of bytes necessary to unpack the values in groups of 3 bytes (2 values)
+	num_bytes = ((num_values + 1) // 2) * 3
+
+	# nothing to unpack
+	if len(payloads) == 0:
+		return np.empty((0, num_axes), dtype = np.int16)
+
+	# check if the payloads contain enough bytes for the number of values
+	if payloads.shape[1] < (num_values * 12 + 7) // 8:
+		logging.error('Payload size {} too small for sample rate {}'.format(payloads.shape[1], sample_rate))
+		exit(1)
+
+	# pad with zero bytes when the last value only uses half of a 3 byte group (happens when the number of values is odd)
+	if payloads.shape[1] < num_bytes:
+		payloads = np.pad(payloads, ((0, 0), (0, num_bytes - payloads.shape[1])))
+
+	# view the payloads as groups of 3 bytes, and use int16 so the values fit after shifting
+	triplets = payloads[:, :num_bytes].reshape(len(payloads), -1, 3).astype(np.int16)
+
+	# empty array for the 2 values within each group of 3 bytes
+	values = np.empty(triplets.shape[:2] + (2,), dtype = np.int16)
+	# first value: all 8 bits of byte 0 followed by the upper 4 bits of byte 1
+	values[..., 0] = (triplets[..., 0] << 4) | (triplets[..., 1] >> 4)
+	# second value: the lower 4 bits of byte 1 followed by all 8 bits of byte 2
+	values[..., 1] = ((triplets[..., 1] & 0x0F) << 8) | triplets[..., 2]
+
+	# convert 12 bit two's complement to signed integer by moving the sign bit to bit 16 and shift back (arithmetic shift keeps the sign)
+	values = (values << 4) >> 4
+
+	# remove the padded value (if any) and return as (samples, axes)
+	return values.reshape(len(payloads), -1)[:, :num_values].reshape(-1, num_axes)
+
+
 def count_payload_size(log_bin, count_payload = 0):
 	"""
 	Count the payload size of the log.bin file. The size of the payload is necessary to know how large
@@ -7,7 +7,16 @@ import logging
 import time
 import h5py
 import os
-from functions.helper_functions import get_random_number_between
+import numpy as np
+from fnmatch import fnmatch
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# advisory file locks are only available on unix
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
 
 
 def get_hdf5_file():
@@ -24,6 +33,420 @@ def get_hdf5_file():
 	return os.path.join(os.sep, 'Volumes', 'LaCie_server', 'ACTIGRAPH_TU7.hdf5')
 
 
+"""
+	HDF5 STORAGE POLICY
+"""
+# chunk shape and compression of the datasets, the first policy with a pattern that matches group/dataset name is used. Chunks contain chunk_seconds of data at the sample 
+# rate of the dataset (read from the meta data if present, otherwise sample_rate), or chunk_rows rows. Slices by time then only read the chunks of those minutes/hours.
+# Datasets with a fixed_sample_rate always use sample_rate, for example the one timestamp per second of a .gt3x file that is saved with the meta data of the acceleration.
+# Policies with compression 'default' use HDF5_DEFAULT_COMPRESSION
+HDF5_STORAGE_POLICY = OrderedDict([
+	# raw acceleration (int16 or float), 10 minutes per chunk
+	('acceleration', {'patterns' : ['*/log', '*/acceleration', '*/*_acc'], 'chunk_seconds' : 600, 'sample_rate' : 100, 'compression' : 'default', 'compression_opts' : None, 'shuffle' : True}),
+	# timestamps of the activity records of a .gt3x file, one row per second, one hour per chunk
+	('time_seconds', {'patterns' : ['*/time'], 'chunk_seconds' : 3600, 'sample_rate' : 1, 'fixed_sample_rate' : True, 'compression' : 'default', 'compression_opts' : None, 'shuffle' : True}),
+	# timestamps of the raw data, same alignment as the acceleration
+	('time', {'patterns' : ['*/*_time'], 'chunk_seconds' : 600, 'sample_rate' : 100, 'compression' : 'default', 'compression_opts' : None, 'shuffle' : True}),
+	# non-wear vectors (0/1), one hour of 100hz data per chunk. Long runs of equal values compress well with gzip
+	('non_wear', {'patterns' : ['*/*non_wear*', 'true_nw_time/*', '*_nw/*'], 'chunk_seconds' : 3600, 'sample_rate' : 100, 'compression' : 'gzip', 'compression_opts' : 4, 'shuffle' : False}),
+	# epoch data, one day of 10 second epochs per chunk
+	('epoch', {'patterns' : ['*/epoch*'], 'chunk_rows' : 8640, 'compression' : 'default', 'compression_opts' : None, 'shuffle' : True}),
+	# ecg and heart rate of the actiwave
+	('signal', {'patterns' : ['*/ecg', '*/*_ecg', '*/estimated_hr', '*/*_hr'], 'chunk_seconds' : 600, 'sample_rate' : 128, 'compression' : 'default', 'compression_opts' : None, 'shuffle' : True}),
+	# all other datasets, h5py guesses the chunk shape
+	('default', {'patterns' : ['*'], 'chunk_rows' : None, 'compression' : 'default', 'compression_opts' : None, 'shuffle' : True}),
+])
+# compression and compression level of the policies with compression 'default'. gzip can be read by every HDF5 library (for example MATLAB, R, and the HDF5 command line
+# tools), lzf is faster but only available within h5py, set to ('lzf', None) to opt in
+HDF5_DEFAULT_COMPRESSION = ('gzip', 1)
+
+
+def get_storage_options(group, data_name, data, meta_data = None, storage_policy = None, resizable = False):
+	"""
+	Return the chunk shape and compression options of a dataset according to the storage policy (see HDF5_STORAGE_POLICY)
+
+	Parameters
+	---------
+	group : string
+		The name of the group where the data needs to be stored
+	data_name : string
+		Name of the dataset
+	data : numpy.array
+		Data that needs to be stored
+	meta_data : dictionary (optional)
+		meta data of the dataset, used to read the sample rate (Sample_Rate of the .gt3x file or Sample Frequency of the .edf file)
+	storage_policy : OrderedDict (optional)
+		storage policy to use. If not given, HDF5_STORAGE_POLICY is used
+	resizable : Boolean (optional)
+		if set to True, the dataset will grow, so the chunk shape is not limited by the size of data
+
+	Returns
+	---------
+	options : dictionary
+		keyword arguments for create_dataset: chunks, compression, compression_opts, and shuffle. Empty if the dataset is stored without chunks (scalars, empty datasets, 
+		and variable length data)
+	"""
+
+	# use the default storage policy if not given
+	if storage_policy is None:
+		storage_policy = HDF5_STORAGE_POLICY
+
+	# data can also be a list
+	data = np.asarray(data) if not hasattr(data, 'dtype') else data
+
+	# scalars and empty datasets can not be chunked, and filters do not work on variable length data
+	if data.ndim == 0 or data.size == 0 or data.dtype.hasobject:
+		return {}
+
+	# find the first policy that matches the group and dataset name
+	name = '{}/{}'.format(group, data_name)
+	policy = next(p for p in storage_policy.values() if any(fnmatch(name, pattern) for pattern in p['patterns']))
+
+	# number of rows within one chunk
+	if policy.get('chunk_seconds') is not None:
+
+		# sample rate from the meta data, otherwise the default of the policy
+		sample_rate = policy['sample_rate']
+		for key in ['Sample_Rate', 'Sample Frequency']:
+			if meta_data is not None and key in meta_data and not policy.get('fixed_sample_rate', False):
+				sample_rate = float(meta_data[key])
+
+		chunk_rows = int(policy['chunk_seconds'] * sample_rate)
+	else:
+		chunk_rows = policy.get('chunk_rows')
+
+	# the chunk of a dataset that does not grow does not need to be larger than the data itself
+	if chunk_rows is not None and not resizable:
+		chunk_rows = max(1, min(chunk_rows, data.shape[0]))
+
+	# h5py guesses the chunk shape if chunk_rows is None
+	chunks = True if chunk_rows is None else (chunk_rows,) + data.shape[1:]
+
+	# compression of the policy, or the default compression
+	compression, compression_opts = HDF5_DEFAULT_COMPRESSION if policy['compression'] == 'default' else (policy['compression'], policy['compression_opts'])
+
+	return {'chunks' : chunks, 'compression' : compression, 'compression_opts' : compression_opts, 'shuffle' : policy['shuffle']}
+
+
+"""
+	HDF5 ACCESS LAYER
+"""
+# maximum number of HDF5 files that are kept open for reading within one process
+HDF5_MAX_READ_HANDLES = 8
+# maximum number of times opening the HDF5 file is retried, and the first and maximum number of seconds to wait between retries
+HDF5_MAX_RETRIES = 10
+HDF5_RETRY_SLEEP = 0.1
+HDF5_MAX_RETRY_SLEEP = 5
+
+# open read handles of this process: hdf5 file -> (h5py.File, version of the file when it was opened, see _file_version), the least recently used handle comes first
+_read_handles = OrderedDict()
+# process ID that owns the handles and locks, a forked process can not reuse the handles of its parent
+_read_handles_pid = None
+# open write handles of this process, so reads and writes that are nested within a write use the same handle
+_write_handles = {}
+# advisory locks held by this process: hdf5 file -> [lock file object (None without fcntl), exclusive, number of nested acquisitions]
+_file_locks = {}
+# counters of the HDF5 access layer (see get_hdf5_metrics)
+_metrics = {'lock_wait_seconds' : 0., 'lock_acquisitions' : 0, 'open_retries' : 0, 'read_handle_hits' : 0, 'read_handle_misses' : 0, 'read_handle_evictions' : 0, 'write_sessions' : 0}
+
+
+def get_hdf5_metrics():
+	"""
+	Return the counters of the HDF5 access layer of this process
+
+	Returns
+	---------
+	metrics : dictionary
+		lock_wait_seconds : total number of seconds spent waiting for the file lock
+		lock_acquisitions : number of times the file lock was acquired
+		open_retries : number of times opening the HDF5 file failed and was retried
+		read_handle_hits : number of reads that used an already open read handle
+		read_handle_misses : number of reads that needed to open the HDF5 file, because it was not open yet or because it has been changed by a writer
+		read_handle_evictions : number of read handles closed because the maximum number of read handles was reached
+		write_sessions : number of times the HDF5 file was opened for writing
+	"""
+
+	return dict(_metrics)
+
+
+def reset_hdf5_metrics():
+	"""
+	Set the counters of the HDF5 access layer back to zero
+	"""
+
+	for key in _metrics:
+		_metrics[key] = type(_metrics[key])()
+
+
+@contextmanager
+def hdf5_lock(hdf5_file, exclusive = False):
+	"""
+	Advisory lock on the HDF5 file, shared between processes through a lock file next to the HDF5 file. Readers hold a shared lock and writers an exclusive lock,
+	so no process reads while another process writes. Nested locks within the same process re-use the lock that is already held. A write nested within a read
+	raises a RuntimeError, because a shared lock can not be turned into an exclusive lock without releasing it first. Writers increase the generation number in the
+	lock file, so readers of other processes know that their open read handle is outdated (see _file_version). Without fcntl (Windows), no lock is taken
+
+	Parameters
+	----------
+	hdf5_file : string
+		location of the hdf5 file
+	exclusive : Boolean (optional)
+		if set to True, take an exclusive (write) lock, otherwise a shared (read) lock
+	"""
+
+	global _read_handles_pid
+
+	# handles and locks of a parent process are not valid within a forked child process
+	if _read_handles_pid != os.getpid():
+		_read_handles.clear()
+		_write_handles.clear()
+		_file_locks.clear()
+		_read_handles_pid = os.getpid()
+
+	# the lock is already held by this process
+	if hdf5_file in _file_locks:
+
+		lock = _file_locks[hdf5_file]
+
+		# another process could change the file between releasing the shared lock and acquiring the exclusive lock, while the outer read still uses its handle
+		if exclusive and not lock[1]:
+			raise RuntimeError('Unable to write to HDF5 file {} within a read of the same file, finish the read first'.format(hdf5_file))
+
+		lock[2] += 1
+		try:
+			yield
+		finally:
+			lock[2] -= 1
+		return
+
+	# the lock file is created next to the HDF5 file, no advisory locks are available without fcntl
+	lock_file = open(hdf5_file + '.lock', 'a+') if fcntl is not None else None
+
+	try:
+		
+		# wait for the lock
+		if lock_file is not None:
+			_acquire_lock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+		_file_locks[hdf5_file] = [lock_file, exclusive, 1]
+
+		yield
+
+	finally:
+
+		# release the lock
+		_file_locks.pop(hdf5_file, None)
+		if lock_file is not None:
+			lock_file.close()
+
+
+def _acquire_lock(lock_file, mode):
+	"""
+	Acquire an advisory lock and keep track of the time spent waiting
+
+	Parameters
+	----------
+	lock_file : file object
+		open lock file
+	mode : int
+		fcntl.LOCK_SH or fcntl.LOCK_EX
+	"""
+
+	tic = time.time()
+	fcntl.flock(lock_file.fileno(), mode)
+
+	_metrics['lock_wait_seconds'] += time.time() - tic
+	_metrics['lock_acquisitions'] += 1
+
+
+def _read_generation(lock_file):
+	"""
+	Return the generation number within the lock file, the number of write sessions of all processes (0 for a new lock file)
+	"""
+
+	lock_file.seek(0)
+	content = lock_file.read().strip()
+
+	return int(content) if content.isdigit() else 0
+
+
+def _increase_generation(lock_file):
+	"""
+	Increase the generation number within the lock file, called by a writer that holds the exclusive lock
+	"""
+
+	generation = _read_generation(lock_file) + 1
+
+	# replace the content of the lock file
+	lock_file.seek(0)
+	lock_file.truncate()
+	lock_file.write(str(generation))
+	lock_file.flush()
+
+
+def _file_version(hdf5_file):
+	"""
+	Return the generation number of the lock file (see _increase_generation), and the modification time and size of the HDF5 file. A read handle is only used when the 
+	version is the same as when the handle was opened. The modification time and size also detect changes by processes that do not use the advisory lock
+	"""
+
+	# lock file of this process, None without fcntl
+	lock = _file_locks.get(hdf5_file)
+	generation = _read_generation(lock[0]) if lock is not None and lock[0] is not None else None
+
+	stat = os.stat(hdf5_file)
+	return (generation, stat.st_mtime_ns, stat.st_size)
+
+
+def _open_hdf5_file(hdf5_file, mode):
+	"""
+	Open the HDF5 file, and retry a bounded number of times with an increasing sleep when the file can not be opened (for example when a process that does not use
+	the advisory lock has the file open). Raises the IOError when all retries have failed
+
+	Parameters
+	----------
+	hdf5_file : string
+		location of the hdf5 file
+	mode : string
+		'r' for reading, 'a' for writing
+
+	Returns
+	---------
+	hf : h5py.File
+		the open HDF5 file
+	"""
+
+	# seconds to sleep before the next retry
+	sleep = HDF5_RETRY_SLEEP
+
+	for retry in range(HDF5_MAX_RETRIES + 1):
+
+		try:
+			# the advisory lock coordinates the processes, so the HDF5 library file locking is turned off (available from h5py 3.5)
+			try:
+				return h5py.File(hdf5_file, mode, locking = False)
+			except TypeError:
+				return h5py.File(hdf5_file, mode)
+
+		except IOError:
+
+			# all retries failed
+			if retry == HDF5_MAX_RETRIES:
+				raise
+
+			logging.warning('Unable to open HDF5 file {}, retry {}/{} in {:.1f} seconds'.format(hdf5_file, retry + 1, HDF5_MAX_RETRIES, sleep))
+			_metrics['open_retries'] += 1
+
+			time.sleep(sleep)
+			sleep = min(sleep * 2, HDF5_MAX_RETRY_SLEEP)
+
+
+def close_read_handles(hdf5_file = None):
+	"""
+	Close the read handles of this process
+
+	Parameters
+	----------
+	hdf5_file : string (optional)
+		only close the read handle of this file. If not given, all read handles are closed
+	"""
+
+	for key in list(_read_handles.keys()):
+		if hdf5_file is None or key == hdf5_file:
+			_read_handles.pop(key)[0].close()
+
+
+@contextmanager
+def hdf5_read(hdf5_file):
+	"""
+	Read access to the HDF5 file. The file is opened once and the handle is kept open for the next reads of this process (up to HDF5_MAX_READ_HANDLES files, the least 
+	recently used handle is closed first). A shared advisory lock is held during the read. The handle is only used while the lock is held, and it is opened again when 
+	a writer has changed the file since it was opened (see _file_version)
+
+	Parameters
+	----------
+	hdf5_file : string
+		location of the hdf5 file
+
+	Yields
+	---------
+	hf : h5py.File
+		the HDF5 file opened for reading
+	"""
+
+	with hdf5_lock(hdf5_file, exclusive = False):
+
+		# a write handle of this process is already open, read from that one
+		if hdf5_file in _write_handles:
+			yield _write_handles[hdf5_file]
+			return
+
+		# check if the open read handle is still up to date, no writer can change the file while the shared lock is held
+		version = _file_version(hdf5_file)
+		if hdf5_file in _read_handles and _read_handles[hdf5_file][1] == version:
+
+			_metrics['read_handle_hits'] += 1
+			# mark as most recently used
+			_read_handles.move_to_end(hdf5_file)
+
+		else:
+
+			_metrics['read_handle_misses'] += 1
+			# close the outdated handle
+			close_read_handles(hdf5_file)
+
+			# close the least recently used handle when the maximum number of handles is reached, handles of files that are being read (nested reads) stay open
+			unused = [x for x in _read_handles if x not in _file_locks]
+			if len(_read_handles) >= HDF5_MAX_READ_HANDLES and len(unused) > 0:
+				close_read_handles(unused[0])
+				_metrics['read_handle_evictions'] += 1
+
+			# open the file for reading
+			_read_handles[hdf5_file] = (_open_hdf5_file(hdf5_file, 'r'), version)
+
+		yield _read_handles[hdf5_file][0]
+
+
+@contextmanager
+def hdf5_write(hdf5_file):
+	"""
+	Write access to the HDF5 file. An exclusive advisory lock is held for as long as the file is open for writing, so no other process reads or writes at the same time.
+	Reads that are nested within the write use the write handle, a write nested within a read raises a RuntimeError (see hdf5_lock). The read handle of this process 
+	to the same file is closed first, and the generation number is increased afterwards, so the read handles of other processes are opened again with their next read
+
+	Parameters
+	----------
+	hdf5_file : string
+		location of the hdf5 file
+
+	Yields
+	---------
+	hf : h5py.File
+		the HDF5 file opened in append mode
+	"""
+
+	with hdf5_lock(hdf5_file, exclusive = True):
+
+		# nested within another write of this process
+		if hdf5_file in _write_handles:
+			yield _write_handles[hdf5_file]
+			return
+
+		# the read handle would not see the changes
+		close_read_handles(hdf5_file)
+
+		# make sure you are in append mode 'a', when in write mode 'w', the file will be recreated
+		_write_handles[hdf5_file] = _open_hdf5_file(hdf5_file, 'a')
+		_metrics['write_sessions'] += 1
+
+		try:
+			yield _write_handles[hdf5_file]
+		finally:
+			_write_handles.pop(hdf5_file).close()
+
+			# the read handles of other processes are outdated
+			if _file_locks[hdf5_file][0] is not None:
+				_increase_generation(_file_locks[hdf5_file][0])
+
 def get_all_subjects_hdf5(hdf5_file = None, filter_on = None):
 	"""
 	Get all the subjects from the hdf5 file where the raw data is stored
@@ -52,7 +475,7 @@ def get_all_subjects_hdf5(hdf5_file = None, filter_on = None):
 		if os.path.exists(hdf5_file):
 
 			# open the hdf5 file
-			with h5py.File(hdf5_file, 'r') as hf:
+			with hdf5_read(hdf5_file) as hf:
 
 				# check if filter_on contains a value, if so, we want return only subjects (i.e. groups) that contain a certain dataset
 				if filter_on is None:
@@ -84,16 +507,6 @@ def get_all_subjects_hdf5(hdf5_file = None, filter_on = None):
 			# return empty list
 			return []
 
-	except IOError:
-	
-		logging.warning('Could not read HDF5 file, possibly already open, retrying')
-		
-		# random sleep between seconds
-		sleep = get_random_number_between(1, 5)
-		time.sleep(sleep)
-	
-		# call function again
-		return get_all_subjects_hdf5(hdf5_file)
 	
 	except Exception as e:
 		logging.warning('Error reading subjects from HDF5 file: {}'.format(e))
@@ -119,21 +532,12 @@ def create_group_in_hdf5_file(group, hdf5_file = None):
 	try:
 
 		# store in HDF5: make sure you are in append mode 'a', when in write mode 'w', the file will be recreated
-		with h5py.File(hdf5_file, 'a') as hf:
+		with hdf5_write(hdf5_file) as hf:
 
 			# create group as subject name
 			hf.create_group(group)
 			
 			logging.info('Succesfully created group {}'.format(group))
-	except IOError:
-
-		# random sleep between seconds
-		sleep = get_random_number_between(1, 5)
-		# logging.warning('HDF5 file currently open, sleeping {} seconds'.format(sleep))
-		time.sleep(sleep)
-
-		# call function again because hdf5 file does not allow for multiple write sessions
-		return create_group_in_hdf5_file(group, hdf5_file)
 
 	except Exception as e:
 		logging.warning('Error creating group in HDF5 file: {}'.format(e))
@@ -146,190 +550,648 @@ def delete_group(group_name, hdf5_file = None):
 
 	Parameters
 	----------
-	group_name : string
-		the name of the group to be deleted
-	hdf5_file : string (optional)
-		path of the HDF5 file. If not given, then read from get_hdf5_file function
+	group_name : string
+		the name of the group to be deleted
+	hdf5_file : string (optional)
+		path of the HDF5 file. If not given, then read from get_hdf5_file function
+	"""
+
+	# if the hdf5 file is not given, then we read it from the function get_hdf5_file 
+	if hdf5_file is None:
+		hdf5_file = get_hdf5_file()	
+
+	# check if file exists
+	if os.path.exists(hdf5_file):
+		try:
+			with hdf5_write(hdf5_file) as hf:
+
+				# check if subject has its own group
+				if group_name in hf.keys():
+
+					# remove the group
+					del hf[group_name]
+
+				else:
+					logging.error('Group {} not present in HDF5 file: {}'.format(group_name, hdf5_file))
+					return None
+
+		except Exception as e:
+			
+			logging.error('Error deleting group {}: {}'.format(group_name, e))
+			exit(1)
+	else:
+		logging.error('HDF5 file does not exist: {}'.format(hdf5_file))
+		exit(1)
+
+
+def delete_dataset_from_group(group_name, dataset, hdf5_file = None):
+	"""
+	Delete a dataset from a group within the HDF5 file
+
+	Parameters
+	----------
+	group_name : string
+		the name of the group
+	dataset : string
+		name of the dataset that needs to be deleted
+	hdf5_file : string (optional)
+		path of the HDF5 file. If not given, then read from get_hdf5_file function
+	"""
+
+	# if the hdf5 file is not given, then we read it from the function get_hdf5_file 
+	if hdf5_file is None:
+		hdf5_file = get_hdf5_file()	
+
+	# check if file exists
+	if os.path.exists(hdf5_file):
+
+		try:
+
+			with hdf5_write(hdf5_file) as hf:
+
+				# check if subject has its own group
+				if group_name in list(hf.keys()):
+
+					if dataset in list(hf[group_name].keys()):
+
+						# remove the group
+						del hf[group_name][dataset]
+					else:
+						logging.warning('Dataset {} not present in group {}'.format(dataset, group_name))
+						return None
+
+				else:
+					logging.error('Group {} not present in HDF5 file: {}'.format(group_name, hdf5_file))
+					return None
+
+		except Exception as e:
+			
+			logging.error('Error deleting group {}: {}'.format(group_name, e))
+			exit(1)
+
+	else:
+		logging.error('HDF5 file does not exist: {}'.format(hdf5_file))
+		exit(1)
+
+
+def read_dataset_from_group(group_name, dataset, hdf5_file = None, start_slice = None, end_slice = None, stride = 1, verbose = False):
+	"""
+	Read dataset from group of HDF5 file
+
+	Parameters
+	-----------
+	group_name : string
+		HDF5 group name
+	dataset : string
+		HDF5 dataset name
+	hdf5_file : string (optional)
+		path of the HDF5 file. If not given, then read from get_hdf5_file function
+	start_slice : int (optional)
+		start slice of the data
+	end_slice : int (optional)
+		end slice of the  data
+	stride : int (optional)
+		stride of the data (i.e. skipping rows)
+	verbose : boolean (optional)
+		if set to True, print out information
+
+	Returns
+	----------
+	data : np.array
+		numpy array of the dataset
+	"""
+
+	if verbose:
+		logging.debug('Reading group: {}, dataset: {}, hdf5_file: {}'.format(group_name, dataset, hdf5_file))
+
+	# if the hdf5 file is not given, then we read it from the function get_hdf5_file 
+	if hdf5_file is None:
+		hdf5_file = get_hdf5_file()	
+
+	try:
+		# check if file exists
+		if os.path.exists(hdf5_file):
+
+			with hdf5_read(hdf5_file) as hf:
+
+				# check if subject has its own group
+				if group_name in list(hf.keys()):
+
+					# get the group
+					group = hf[group_name]
+
+					# get the dataset from the group
+					if dataset in group.keys():
+
+						# get the data
+						return group[dataset][start_slice:end_slice:stride]
+
+					else:
+						logging.error('Dataset {} not part of group {}'.format(dataset, group_name))
+						return None
+
+				else:
+					logging.error('Group {} not present in HDF5 file: {}'.format(group_name, hdf5_file))
+					return None
+		
+		else:
+			logging.error('HDF5 file does not exist: {}'.format(hdf5_file))
+			exit(1)
+	
+	
+	except Exception as e:
+		logging.error('Error reading dataset {} from group {}: {}'.format(dataset, group_name, e))
+		exit()
+
+
+def read_group_bundle(group_name, datasets, with_metadata = True, slices = None, hdf5_file = None):
+	"""
+	Read several datasets of a group, and optionally their meta data and the meta data of the group, with one open HDF5 handle. This replaces a separate 
+	read_dataset_from_group and read_metadata_from_group_dataset call for each dataset
+
+	Parameters
+	-----------
+	group_name : string
+		HDF5 group name, for example the subject ID
+	datasets : list
+		names of the datasets to read
+	with_metadata : Boolean (optional)
+		if set to True, also read the meta data of the datasets and of the group. Default True
+	slices : slice, tuple, or dictionary (optional)
+		part of the datasets to read. Either one slice (or tuple of (start, stop[, stride])) that is used for all datasets, or a dictionary with the dataset name as key and
+		a slice or tuple as value. Datasets without a slice are read completely
+	hdf5_file : string (optional)
+		path of the HDF5 file. If not given, then read from get_hdf5_file function
+
+	Returns
+	----------
+	bundle : dictionary
+		data : dictionary with the dataset name as key and the numpy array as value (None if the dataset is not part of the group)
+		meta_data : dictionary with the dataset name as key and the meta data dictionary as value (only when with_metadata is set to True)
+		group_meta_data : meta data dictionary of the group (only when with_metadata is set to True)
+		None is returned if the group is not present in the HDF5 file
+	"""
+
+	# if the hdf5 file is not given, then we read it from the function get_hdf5_file 
+	if hdf5_file is None:
+		hdf5_file = get_hdf5_file()	
+
+	# check if file exists
+	if not os.path.exists(hdf5_file):
+		logging.error('HDF5 file does not exist: {}'.format(hdf5_file))
+		exit(1)
+
+	try:
+
+		with hdf5_read(hdf5_file) as hf:
+
+			# check if subject has its own group
+			if group_name not in hf.keys():
+				logging.error('Group {} not present in HDF5 file: {}'.format(group_name, hdf5_file))
+				return None
+
+			# get the group
+			group = hf[group_name]
+
+			# empty dictionaries to store the data and meta data
+			bundle = {'data' : {}}
+			if with_metadata:
+				bundle['meta_data'] = {}
+				bundle['group_meta_data'] = dict(group.attrs)
+
+			for dataset in datasets:
+
+				# dataset not part of the group
+				if dataset not in group.keys():
+					logging.error('Dataset {} not part of group {}'.format(dataset, group_name))
+					bundle['data'][dataset] = None
+					if with_metadata:
+						bundle['meta_data'][dataset] = None
+					continue
+
+				# the slice of this dataset
+				dataset_slice = slices.get(dataset) if isinstance(slices, dict) else slices
+				if dataset_slice is None:
+					dataset_slice = slice(None)
+				elif isinstance(dataset_slice, tuple):
+					dataset_slice = slice(*dataset_slice)
+
+				# read the data
+				bundle['data'][dataset] = group[dataset][dataset_slice]
+
+				# read the meta data
+				if with_metadata:
+					bundle['meta_data'][dataset] = dict(group[dataset].attrs)
+
+			return bundle
+
+	except Exception as e:
+		logging.error('Error reading datasets {} from group {}: {}'.format(datasets, group_name, e))
+		exit()
+
+
+def create_time_axis(time_start, time_rate, time_gaps = None):
+	"""
+	Create an implicit time axis: the timestamps of a dataset described by the time of the first row, the sample rate, and a table of gaps. Row i of a continuous segment that
+	starts at row r with time t has timestamp t + (i - r) / time_rate. The start time and sample rate are stored as attributes of the dataset, the gap table as a small dataset
+	next to it, because the size of the attributes of a dataset is limited to 64KB (see save_time_axis)
+
+	Parameters
+	-----------
+	time_start : np.datetime64 or datetime or int
+		time of the first row, an int is interpreted as nanoseconds since 1970-01-01
+	time_rate : float
+		number of rows per second, for example 100 for 100hz data or 0.1 for 10 seconds epoch data
+	time_gaps : np.array((n_gaps, 2)) (optional)
+		row and time (nanoseconds) of each row where a new continuous segment starts, for example after missing seconds. Default None, thus no gaps
+
+	Returns
+	----------
+	time_axis : dictionary
+		time_start (int64 nanoseconds), time_rate (float), and time_gaps (int64 array (n_gaps, 2))
+	"""
+
+	# convert the start time to nanoseconds
+	if not isinstance(time_start, (int, np.integer)):
+		time_start = np.datetime64(time_start, 'ns').astype(np.int64)
+
+	# no gaps
+	if time_gaps is None:
+		time_gaps = np.zeros((0, 2), dtype = np.int64)
+
+	return {'time_start' : np.int64(time_start), 'time_rate' : float(time_rate), 'time_gaps' : np.asarray(time_gaps, dtype = np.int64).reshape(-1, 2)}
+
+
+def get_time_axis_from_time_data(time_data, time_rate):
+	"""
+	Create the implicit time axis of a timestamp array (see create_time_axis). Rows where the time difference to the previous row is not 1 / time_rate become the start of 
+	a new continuous segment in the gap table
+
+	Parameters
+	-----------
+	time_data : np.array
+		timestamps as np.datetime64, one timestamp for each row of the dataset
+	time_rate : float
+		number of rows per second
+
+	Returns
+	----------
+	time_axis : dictionary
+		time_start, time_rate, and time_gaps
+	"""
+
+	# timestamps in nanoseconds
+	time_ns = np.asarray(time_data).reshape(-1).astype('datetime64[ns]').astype(np.int64)
+
+	# no timestamps, thus also no start time
+	if len(time_ns) == 0:
+		return create_time_axis(0, time_rate)
+
+	# rows where the time does not continue with the sample rate
+	gap_rows = np.flatnonzero(np.diff(time_ns) != int(round(1e9 / time_rate))) + 1
+
+	return create_time_axis(time_ns[0], time_rate, np.column_stack([gap_rows, time_ns[gap_rows]]))
+
+
+def get_time_axis(attrs, time_gaps = None):
+	"""
+	Return the implicit time axis that is stored in the attributes of a dataset, None if the dataset has no time axis
+
+	Parameters
+	-----------
+	attrs : h5py attributes or dictionary
+		attributes (meta data) of the dataset
+	time_gaps : np.array((n_gaps, 2)) (optional)
+		gap table of the time axis, as read from the gap table dataset (see get_time_gaps_dataset_name). Files that were saved before the gap table was moved to its own 
+		dataset have the gap table within the attributes
+
+	Returns
+	----------
+	time_axis : dictionary
+		time_start, time_rate, and time_gaps
+	"""
+
+	if 'time_start' not in attrs or 'time_rate' not in attrs:
+		return None
+
+	# gap table within the attributes of older files
+	if time_gaps is None and 'time_gaps' in attrs:
+		time_gaps = attrs['time_gaps']
+
+	# the time axis has gaps, but the gap table is not given
+	if time_gaps is None and attrs.get('num_time_gaps', 0) > 0:
+		raise ValueError('Time axis has {} gaps, but the gap table is not given'.format(attrs['num_time_gaps']))
+
+	return create_time_axis(int(attrs['time_start']), attrs['time_rate'], time_gaps)
+
+
+def get_time_gaps_dataset_name(dataset):
+	"""
+	Return the name of the dataset with the gap table of the implicit time axis of a dataset, for example actigraph_acc -> actigraph_acc_time_gaps
+	"""
+
+	return '{}_time_gaps'.format(dataset)
+
+
+def _read_time_axis(group, dataset):
+	"""
+	Read the implicit time axis of a dataset from an open HDF5 group: the attributes of the dataset and its gap table dataset
+	"""
+
+	# gap table dataset, if present
+	time_gaps_dataset = get_time_gaps_dataset_name(dataset)
+	time_gaps = group[time_gaps_dataset][:] if time_gaps_dataset in group else None
+
+	return get_time_axis(group[dataset].attrs, time_gaps)
+
+
+def save_time_axis(group_name, dataset, time_axis, hdf5_file = None):
+	"""
+	Save the implicit time axis of a dataset, so time ranges can be read without the timestamps (see read_time_range). The start time and sample rate are saved as attributes 
+	of the dataset, the gap table as a dataset next to it (see get_time_gaps_dataset_name)
+
+	Parameters
+	-----------
+	group_name : string
+		HDF5 group name
+	dataset : string
+		name of the dataset
+	time_axis : dictionary
+		time_start, time_rate, and time_gaps (see create_time_axis)
+	hdf5_file : string (optional)
+		path of the HDF5 file. If not given, then read from get_hdf5_file function
+	"""
+
+	save_meta_data_to_group_dataset(group_name, dataset, get_time_axis_meta_data(time_axis), hdf5_file = hdf5_file)
+	save_data_to_group_hdf5(group_name, time_axis['time_gaps'], get_time_gaps_dataset_name(dataset), overwrite = True, hdf5_file = hdf5_file)
+
+
+def get_time_axis_meta_data(time_axis):
+	"""
+	Return the start time, sample rate, and number of gaps of the implicit time axis as a meta data dictionary, so it can be saved as attributes together with the other meta 
+	data of a dataset. The gap table itself is saved as a dataset (see save_time_axis)
+
+	Parameters
+	-----------
+	time_axis : dictionary
+		time_start, time_rate, and time_gaps (see create_time_axis)
+
+	Returns
+	----------
+	meta_data : dictionary
+		time_start, time_rate, and num_time_gaps as attributes
+	"""
+
+	return {'time_start' : time_axis['time_start'], 'time_rate' : time_axis['time_rate'], 'num_time_gaps' : len(time_axis['time_gaps'])}
+
+
+def get_time_axis_rows(time_axis, start, stop, num_rows):
+	"""
+	Calculate the rows of a dataset with an implicit time axis that fall within [start, stop)
+
+	Parameters
+	-----------
+	time_axis : dictionary
+		time_start, time_rate, and time_gaps (see create_time_axis)
+	start : np.datetime64
+		start of the time range, None for the first row
+	stop : np.datetime64
+		end of the time range (not included), None for the last row
+	num_rows : int
+		number of rows of the dataset
+
+	Returns
+	----------
+	start_row : int
+		first row within the time range
+	stop_row : int
+		first row after the time range
 	"""
 
-	# if the hdf5 file is not given, then we read it from the function get_hdf5_file 
-	if hdf5_file is None:
-		hdf5_file = get_hdf5_file()	
+	# start row and start time of each continuous segment
+	segment_rows = np.concatenate([[0], time_axis['time_gaps'][:, 0], [num_rows]])
+	segment_times = np.concatenate([[time_axis['time_start']], time_axis['time_gaps'][:, 1]])
 
-	# check if file exists
-	if os.path.exists(hdf5_file):
-		try:
-			with h5py.File(hdf5_file, 'a') as hf:
+	# nanoseconds between two rows
+	period = 1e9 / time_axis['time_rate']
 
-				# check if subject has its own group
-				if group_name in hf.keys():
+	def _first_row_at_or_after(t):
 
-					# remove the group
-					del hf[group_name]
+		# convert to nanoseconds
+		t = np.datetime64(t, 'ns').astype(np.int64)
 
-				else:
-					logging.error('Group {} not present in HDF5 file: {}'.format(group_name, hdf5_file))
-					return None
+		# the segment that contains t (the last segment that starts at or before t)
+		segment = max(np.searchsorted(segment_times, t, side = 'right') - 1, 0)
 
-		except IOError:
+		# row within the segment, rounded up so the row is not before t
+		row = segment_rows[segment] + max(int(np.ceil((t - segment_times[segment]) / period)), 0)
 
-			# random sleep between seconds
-			sleep = get_random_number_between(1, 5)
-			# logging.warning('HDF5 file currently open, sleeping {} seconds'.format(sleep))
-			time.sleep(sleep)
+		# t falls within a gap, the next segment starts after t
+		return int(min(row, segment_rows[segment + 1]))
 
-			# call function again because hdf5 file does not allow for multiple write sessions
-			return delete_group(group_name = group_name, hdf5_file = hdf5_file)
+	start_row = 0 if start is None else _first_row_at_or_after(start)
+	stop_row = num_rows if stop is None else _first_row_at_or_after(stop)
 
-		except Exception as e:
-			
-			logging.error('Error deleting group {}: {}'.format(group_name, e))
-			exit(1)
-	else:
-		logging.error('HDF5 file does not exist: {}'.format(hdf5_file))
-		exit(1)
+	return start_row, max(start_row, stop_row)
 
 
-def delete_dataset_from_group(group_name, dataset, hdf5_file = None):
+def create_time_axis_array(time_axis, start_row = 0, stop_row = None, num_rows = None):
 	"""
-	Delete a dataset from a group within the HDF5 file
+	Create the timestamps of the rows [start_row, stop_row) of a dataset with an implicit time axis
 
 	Parameters
+	-----------
+	time_axis : dictionary
+		time_start, time_rate, and time_gaps (see create_time_axis)
+	start_row : int (optional)
+		first row
+	stop_row : int (optional)
+		first row after the last row. If not given, num_rows is used
+	num_rows : int (optional)
+		number of rows of the dataset
+
+	Returns
 	----------
-	group_name : string
-		the name of the group
-	dataset : string
-		name of the dataset that needs to be deleted
-	hdf5_file : string (optional)
-		path of the HDF5 file. If not given, then read from get_hdf5_file function
+	time_data : np.array(stop_row - start_row, dtype = 'datetime64[ns]')
+		timestamps of the rows
 	"""
 
-	# if the hdf5 file is not given, then we read it from the function get_hdf5_file 
-	if hdf5_file is None:
-		hdf5_file = get_hdf5_file()	
+	# last row
+	if stop_row is None:
+		stop_row = num_rows
 
-	# check if file exists
-	if os.path.exists(hdf5_file):
+	# rows to create the timestamps for
+	rows = np.arange(start_row, stop_row, dtype = np.int64)
 
-		try:
+	# start row and start time of each continuous segment
+	segment_rows = np.concatenate([[0], time_axis['time_gaps'][:, 0]]).astype(np.int64)
+	segment_times = np.concatenate([[time_axis['time_start']], time_axis['time_gaps'][:, 1]]).astype(np.int64)
 
-			with h5py.File(hdf5_file, 'a') as hf:
+	# segment of each row
+	segment = np.searchsorted(segment_rows, rows, side = 'right') - 1
 
-				# check if subject has its own group
-				if group_name in list(hf.keys()):
+	# nanoseconds between two rows, use integers when possible to stay exact for long recordings
+	period = 1e9 / time_axis['time_rate']
+	if period.is_integer():
+		offset = (rows - segment_rows[segment]) * np.int64(period)
+	else:
+		offset = np.round((rows - segment_rows[segment]) * period).astype(np.int64)
 
-					if dataset in list(hf[group_name].keys()):
+	# time of the segment + the time of the row within the segment
+	time_ns = segment_times[segment] + offset
 
-						# remove the group
-						del hf[group_name][dataset]
-					else:
-						logging.warning('Dataset {} not present in group {}'.format(dataset, group_name))
-						return None
+	return time_ns.astype('datetime64[ns]')
 
-				else:
-					logging.error('Group {} not present in HDF5 file: {}'.format(group_name, hdf5_file))
-					return None
 
-		except IOError:
+def _bisect_time_dataset(time_dataset, t, time_unit):
+	"""
+	Find the first row of a sorted time dataset with a time at or after t, by reading single rows of the dataset (binary search) instead of the full dataset
 
-			# random sleep between seconds
-			sleep = get_random_number_between(1, 3)
-			# logging.warning('HDF5 file currently open, sleeping {} seconds'.format(sleep))
-			time.sleep(sleep)
+	Parameters
+	-----------
+	time_dataset : h5py.Dataset
+		dataset with sorted timestamps (integers in time_unit since 1970-01-01)
+	t : np.datetime64
+		time to search for
+	time_unit : string
+		unit of the timestamps, for example 's', 'ms', or 'ns'
 
-			# call function again because hdf5 file does not allow for multiple write sessions
-			return delete_dataset_from_group(group_name, dataset, hdf5_file)
+	Returns
+	----------
+	row : int
+		first row with a time at or after t
+	"""
 
-		except Exception as e:
-			
-			logging.error('Error deleting group {}: {}'.format(group_name, e))
-			exit(1)
+	# convert t to the unit of the time dataset, rounded up so the found row is not before t
+	t = -(-np.datetime64(t, 'ns').astype(np.int64) // int(np.timedelta64(1, time_unit) / np.timedelta64(1, 'ns')))
 
-	else:
-		logging.error('HDF5 file does not exist: {}'.format(hdf5_file))
-		exit(1)
+	# binary search
+	low, high = 0, time_dataset.shape[0]
+	while low < high:
+		middle = (low + high) // 2
+		if int(np.asarray(time_dataset[middle]).reshape(-1)[0]) < t:
+			low = middle + 1
+		else:
+			high = middle
 
+	return low
 
-def read_dataset_from_group(group_name, dataset, hdf5_file = None, start_slice = None, end_slice = None, stride = 1, verbose = False):
+
+def _guess_time_unit(value):
 	"""
-	Read dataset from group of HDF5 file
+	Guess the unit of an integer timestamp (since 1970-01-01) by its magnitude, valid for dates between 1973 and 2262
+
+	Parameters
+	-----------
+	value : int
+		timestamp
+
+	Returns
+	----------
+	time_unit : string
+		's', 'ms', 'us', or 'ns'
+	"""
+
+	for time_unit, limit in [('s', 1e11), ('ms', 1e14), ('us', 1e17)]:
+		if abs(value) < limit:
+			return time_unit
+	return 'ns'
+
+
+def read_time_range(group_name, dataset, start = None, stop = None, time_dataset = None, time_axis = None, return_time = True, hdf5_file = None):
+	"""
+	Read the rows of a dataset within the time range [start, stop), without reading the full dataset. The rows are found by
+	- the implicit time axis of the dataset (start time, sample rate, and gap table, see create_time_axis) when stored with the dataset or given as time_axis. The rows are calculated
+	- otherwise a binary search on the time dataset, for example 'time' for 'log' or 'actigraph_time' for 'actigraph_acc'. When the time dataset has fewer rows than the dataset 
+	(one timestamp per second of 100hz data), each timestamp covers len(dataset) // len(time_dataset) rows
 
 	Parameters
 	-----------
 	group_name : string
-		HDF5 group name
+		HDF5 group name, for example the subject ID
 	dataset : string
-		HDF5 dataset name
+		name of the dataset to read
+	start : np.datetime64 or string (optional)
+		start of the time range. If not given, read from the first row
+	stop : np.datetime64 or string (optional)
+		end of the time range (not included). If not given, read until the last row
+	time_dataset : string (optional)
+		name of the dataset with the timestamps. If not given, the time dataset is derived from the dataset name: log -> time, x_acc -> x_time, x -> x_time
+	time_axis : dictionary (optional)
+		implicit time axis to use instead of the time axis stored with the dataset (see create_time_axis)
+	return_time : Boolean (optional)
+		if set to True, also return the timestamps of the rows
 	hdf5_file : string (optional)
 		path of the HDF5 file. If not given, then read from get_hdf5_file function
-	start_slice : int (optional)
-		start slice of the data
-	end_slice : int (optional)
-		end slice of the  data
-	stride : int (optional)
-		stride of the data (i.e. skipping rows)
-	verbose : boolean (optional)
-		if set to True, print out information
 
 	Returns
 	----------
 	data : np.array
-		numpy array of the dataset
+		rows of the dataset within the time range
+	time_data : np.array(dtype = 'datetime64[ns]')
+		timestamps of the rows (only when return_time is set to True)
 	"""
 
-	if verbose:
-		logging.debug('Reading group: {}, dataset: {}, hdf5_file: {}'.format(group_name, dataset, hdf5_file))
-
 	# if the hdf5 file is not given, then we read it from the function get_hdf5_file 
 	if hdf5_file is None:
 		hdf5_file = get_hdf5_file()	
 
 	try:
-		# check if file exists
-		if os.path.exists(hdf5_file):
 
-			with h5py.File(hdf5_file, 'r') as hf:
+		with hdf5_read(hdf5_file) as hf:
 
-				# check if subject has its own group
-				if group_name in list(hf.keys()):
+			# get the dataset
+			dset = hf[group_name][dataset]
 
-					# get the group
-					group = hf[group_name]
+			# use the implicit time axis if available
+			if time_axis is None:
+				time_axis = _read_time_axis(hf[group_name], dataset)
 
-					# get the dataset from the group
-					if dataset in group.keys():
+			if time_axis is not None:
 
-						# get the data
-						return group[dataset][start_slice:end_slice:stride]
+				# calculate the rows
+				start_row, stop_row = get_time_axis_rows(time_axis, start, stop, dset.shape[0])
 
-					else:
-						logging.error('Dataset {} not part of group {}'.format(dataset, group_name))
-						return None
+				# timestamps of the rows
+				if return_time:
+					time_data = create_time_axis_array(time_axis, start_row, stop_row)
+			else:
 
-				else:
-					logging.error('Group {} not present in HDF5 file: {}'.format(group_name, hdf5_file))
-					return None
-		
-		else:
-			logging.error('HDF5 file does not exist: {}'.format(hdf5_file))
-			exit(1)
-	
-	except IOError:
+				# derive the name of the time dataset
+				if time_dataset is None:
+					time_dataset = 'time' if dataset == 'log' else '{}_time'.format(dataset[:-4] if dataset.endswith('_acc') else dataset)
 
-		# random sleep between seconds
-		sleep = get_random_number_between(1, 5)
-		# logging.warning('HDF5 file currently open, sleeping {} seconds'.format(sleep))
-		time.sleep(sleep)
+				# get the time dataset
+				tset = hf[group_name][time_dataset]
+
+				# number of rows covered by one timestamp
+				rows_per_time = dset.shape[0] // tset.shape[0]
+				# unit of the timestamps
+				time_unit = _guess_time_unit(int(np.asarray(tset[0]).reshape(-1)[0]))
+
+				# binary search on the time dataset
+				start_time_row = 0 if start is None else _bisect_time_dataset(tset, start, time_unit)
+				stop_time_row = tset.shape[0] if stop is None else _bisect_time_dataset(tset, stop, time_unit)
+
+				# rows of the dataset
+				start_row, stop_row = start_time_row * rows_per_time, max(start_time_row, stop_time_row) * rows_per_time
+
+				# timestamps of the rows, each timestamp covers rows_per_time rows
+				if return_time:
+					time_data = np.asarray(tset[start_time_row:stop_time_row]).reshape(-1).astype('datetime64[{}]'.format(time_unit)).astype('datetime64[ns]')
+					time_data = (time_data.reshape(-1, 1) + (np.arange(rows_per_time) * (10**9 // rows_per_time)).astype('timedelta64[ns]')).reshape(-1)
+
+			# read only the rows within the time range
+			data = dset[start_row:stop_row]
+
+			return (data, time_data) if return_time else data
 
-		# call function again because hdf5 file does not allow for multiple write sessions
-		return read_dataset_from_group(group_name, dataset, hdf5_file, start_slice, end_slice, stride)
-	
 	except Exception as e:
-		logging.error('Error reading dataset {} from group {}: {}'.format(dataset, group_name, e))
+		logging.error('Error reading time range of dataset {} from group {}: {}'.format(dataset, group_name, e))
 		exit()
 
 
-def save_data_to_group_hdf5(group, data, data_name, meta_data = None, overwrite = False, create_group_if_not_exists = True, hdf5_file = None, max_sec_sleep = 5):
+def save_data_to_group_hdf5(group, data, data_name, meta_data = None, overwrite = False, create_group_if_not_exists = True, hdf5_file = None):
 	"""
 	Save data as a dataset in a group
 
@@ -349,8 +1211,6 @@ def save_data_to_group_hdf5(group, data, data_name, meta_data = None, overwrite
 		create group in hdf5 file if not exists
 	hdf5_file : string (optional)
 		location of the hdf5 file. If not given, then we read it from the function get_hdf5_file
-	max_sec_sleep : int
-		maximum time to sleep untill next write action is tried (happens when function is called from multiple threads)
 	"""
 
 	# if the hdf5 file is not given, then we read it from the function get_hdf5_file 
@@ -360,7 +1220,7 @@ def save_data_to_group_hdf5(group, data, data_name, meta_data = None, overwrite
 	try:
 
 		# store in HDF5: make sure you are in append mode 'a', when in write mode 'w', the file will be recreated
-		with h5py.File(hdf5_file, 'a') as hf:
+		with hdf5_write(hdf5_file) as hf:
 
 			# check if group exists
 			group_exists = True if hf.get(group) is not None else False
@@ -390,8 +1250,8 @@ def save_data_to_group_hdf5(group, data, data_name, meta_data = None, overwrite
 			# check if dataset already exists in group
 			if data_name not in grp.keys() or overwrite == True:
 
-				# store data in group
-				grp.create_dataset(data_name, data = data)
+				# store data in group, chunked and compressed according to the storage policy
+				grp.create_dataset(data_name, data = data, **get_storage_options(group, data_name, data, meta_data))
 				logging.info('Dataset {} saved in group {}'.format(data_name, group))
 
 				# store meta data if present
@@ -412,16 +1272,6 @@ def save_data_to_group_hdf5(group, data, data_name, meta_data = None, overwrite
 
 				logging.warning('Dataset {} already exists in group {}. Consider setting overwrite = True if you want to overwrite the data.'.format(data_name, group))
 			
-	except IOError:
-
-		# random sleep between seconds
-		sleep = get_random_number_between(1, max_sec_sleep)
-		logging.warning('HDF5 file currently open, sleeping {} seconds'.format(sleep))
-		time.sleep(sleep)
-
-		# call function again because hdf5 file does not allow for multiple write sessions
-		return save_data_to_group_hdf5(group, data, data_name, meta_data , overwrite, create_group_if_not_exists, hdf5_file)
-
 	except Exception as e:
 		logging.error('Error saving dataset {} to group {}: {}'.format(data_name, group, e))
 		exit()
@@ -462,7 +1312,7 @@ def save_multi_data_to_group_hdf5(group, data, data_name, meta_data = None, over
 	try:
 
 		# store in HDF5: make sure you are in append mode 'a', when in write mode 'w', the file will be recreated
-		with h5py.File(hdf5_file, 'a') as hf:
+		with hdf5_write(hdf5_file) as hf:
 
 			# check if group exists
 			group_exists = True if hf.get(group) is not None else False
@@ -495,8 +1345,8 @@ def save_multi_data_to_group_hdf5(group, data, data_name, meta_data = None, over
 				
 				if data_name[i] not in grp.keys() or overwrite == True:
 
-					# store data in group
-					grp.create_dataset(data_name[i], data = data[i])
+					# store data in group, chunked and compressed according to the storage policy
+					grp.create_dataset(data_name[i], data = data[i], **get_storage_options(group, data_name[i], data[i], meta_data[i] if meta_data is not None else None))
 
 					logging.info('Dataset {} saved in group {}'.format(data_name[i], group))
 
@@ -518,21 +1368,215 @@ def save_multi_data_to_group_hdf5(group, data, data_name, meta_data = None, over
 
 					logging.warning('Dataset {} already exists in group {}. Consider setting overwrite = True if you want to overwrite the data.'.format(data_name[i], group))
 			
-	except IOError:
+	except Exception as e:
+		logging.error('Error saving datasets to group {}: {}'.format(group, e))
+		exit()
+
+
+def append_data_to_group_hdf5(group, data, data_name, meta_data = None, overwrite = False, create_group_if_not_exists = True, chunks = True, hdf5_file = None):
+	"""
+	Append data to a resizable dataset in a group. If the dataset does not exist, it is created as a chunked dataset that can grow along the first axis. This allows
+	data to be saved piece by piece, for example when a .gt3x file is converted in chunks
+
+	Parameters
+	---------
+	group : string
+		The name of the group where the data needs to be stored. Can be subject name for example
+	data : numpy.array
+		Data that needs to be appended. All dimensions except the first one need to match the existing dataset
+	data_name : string
+		Name of the dataset. This is basically the key within the group
+	meta_data : dictionary (optional)
+		meta data to save with the dataset, should be of type dictionary. Only saved when the dataset is created
+	overwrite : Boolean (optional)
+		If set to True then we delete the current dataset if present, and create a new one with data
+	create_group_if_not_exists = Boolean (optional)
+		create group in hdf5 file if not exists
+	chunks : tuple or Boolean (optional)
+		chunk shape of the dataset when it is created. Default True, meaning that the chunk shape of the storage policy is used (see get_storage_options)
+	hdf5_file : string (optional)
+		location of the hdf5 file. If not given, then we read it from the function get_hdf5_file
+	"""
+
+	# if the hdf5 file is not given, then we read it from the function get_hdf5_file 
+	if hdf5_file is None:
+		hdf5_file = get_hdf5_file()
+
+	try:
+
+		# store in HDF5: make sure you are in append mode 'a', when in write mode 'w', the file will be recreated
+		with hdf5_write(hdf5_file) as hf:
+
+			# check if group exists
+			if hf.get(group) is None:
+
+				# don't create group if not exist but if group not exists, issue warning, because otherwise we can't add data to the group
+				if not create_group_if_not_exists:
+					logging.warning('Could not add data {} to group because group {} does not exist. Continue with setting the create_group_if_not_exists parameter to True.'.format(data_name, group))
+					exit(1)
 
-		# random sleep between seconds
-		sleep = get_random_number_between(1, 2)
-		logging.warning('HDF5 file currently open, sleeping {} seconds'.format(sleep))
-		time.sleep(sleep)
+				# create group
+				hf.create_group(group)
 
-		# call function again because hdf5 file does not allow for multiple write sessions
-		return save_multi_data_to_group_hdf5(group, data, data_name, meta_data , overwrite, create_group_if_not_exists, hdf5_file)
+			# add the data at the end of the (resizable) dataset
+			write_data_to_open_group(hf[group], data, data_name, meta_data = meta_data, overwrite = overwrite, append = True, chunks = chunks)
 
 	except Exception as e:
-		logging.error('Error saving datasets to group {}: {}'.format(group, e))
+		logging.error('Error appending dataset {} to group {}: {}'.format(data_name, group, e))
 		exit()
 
 
+def write_data_to_open_group(grp, data, data_name, meta_data = None, overwrite = False, append = False, chunks = True):
+	"""
+	Write data as a dataset in a group of an HDF5 file that is already open. This is used by append_data_to_group_hdf5 and by the single writer process (see write_queue_to_hdf5)
+
+	Parameters
+	---------
+	grp : h5py.Group
+		group of an open HDF5 file
+	data : numpy.array
+		Data that needs to be stored.
+	data_name : string
+		Name of the dataset. This is basically the key within the group
+	meta_data : dictionary (optional)
+		meta data to save with the dataset, only saved when the dataset is created
+	overwrite : Boolean (optional)
+		If set to True then we delete the current dataset first if present
+	append : Boolean (optional)
+		If set to True then the dataset is created as resizable dataset, and data is added at the end of the dataset if it already exists. If set to False, the dataset is created 
+		and an existing dataset is only replaced when overwrite is set to True
+	chunks : tuple or Boolean (optional)
+		chunk shape of a resizable dataset, True uses the chunk shape of the storage policy (see get_storage_options)
+	"""
+
+	# check if overwrite is set to true. If so, then we need to delete the dataset first
+	if overwrite and grp.get(data_name) is not None:
+		del grp[data_name]
+
+	# create the dataset if it does not exist
+	if data_name not in grp.keys():
+
+		# chunk shape and compression according to the storage policy
+		options = get_storage_options(grp.name.strip('/'), data_name, data, meta_data, resizable = append)
+
+		if append:
+			# a resizable dataset always needs chunks, the given chunk shape has priority over the storage policy
+			if chunks is not True or 'chunks' not in options:
+				options['chunks'] = chunks
+			# the first axis can grow, the other axes are fixed
+			grp.create_dataset(data_name, data = data, maxshape = (None,) + data.shape[1:], **options)
+			logging.info('Resizable dataset {} created in group {}'.format(data_name, grp.name))
+		else:
+			# store data in group
+			grp.create_dataset(data_name, data = data, **options)
+			logging.info('Dataset {} saved in group {}'.format(data_name, grp.name))
+
+		# store meta data if present
+		if meta_data is not None:
+
+			# add meta data to dataset
+			for key, value in meta_data.items():
+				grp[data_name].attrs[key] = value
+
+	elif append:
+
+		# get the dataset
+		dataset = grp[data_name]
+
+		# nothing to add (for example the last chunk when the number of records is a multiple of the chunk size plus one), dataset[-0:] would be the whole dataset
+		if data.shape[0] == 0:
+			return
+
+		# grow the dataset along the first axis and add the data at the end
+		num_rows = dataset.shape[0]
+		dataset.resize(num_rows + data.shape[0], axis = 0)
+		dataset[num_rows:] = data
+
+	else:
+		logging.warning('Dataset {} already exists in group {}. Consider setting overwrite = True if you want to overwrite the data.'.format(data_name, grp.name))
+
+
+def write_queue_to_hdf5(save_queue, hdf5_file = None):
+	"""
+	Single writer for the HDF5 file. Runs in its own process and writes all datasets that other processes put on the save_queue, this way only one process writes to the HDF5 file
+	and the worker processes do not have to wait for each other (see batch_process_gt3x_files in convert_raw_gt3x_to_hdf5.py). The HDF5 file is kept open (with the exclusive lock)
+	for as long as the writer runs
+
+	Each item on the queue is a dictionary with the keys group, data, data_name, and optionally meta_data, overwrite, append, and chunks (see write_data_to_open_group). 
+	An item with the keys group and delete_group = True deletes the group (for example a subject that could not be converted completely). The writer stops when it receives None
+
+	When a dataset can not be written, the group is deleted and the remaining datasets of the group are skipped, so no group with missing chunks is left in the HDF5 file.
+	The writer then exits with exit code 1 after all other datasets are written, so the parent process knows that not all groups were saved
+
+	Parameters
+	---------
+	save_queue : multiprocessing.Queue
+		(bounded) queue with the datasets to write. When the queue is full, the worker processes wait until the writer has caught up
+	hdf5_file : string (optional)
+		location of the hdf5 file. If not given, then we read it from the function get_hdf5_file
+	"""
+
+	# if the hdf5 file is not given, then we read it from the function get_hdf5_file 
+	if hdf5_file is None:
+		hdf5_file = get_hdf5_file()
+
+	# keep track of the number of written datasets
+	num_written = 0
+	# groups with a dataset that could not be written
+	failed_groups = set()
+
+	# open the HDF5 file once for all datasets
+	with hdf5_write(hdf5_file) as hf:
+
+		while True:
+
+			# wait for the next dataset
+			item = save_queue.get()
+
+			# None marks the end of the queue
+			if item is None:
+				break
+
+			# delete a group that was not completed by the worker
+			if item.get('delete_group', False):
+				if item['group'] in hf:
+					del hf[item['group']]
+					logging.info('Deleted group {}'.format(item['group']))
+				continue
+
+			# the group is incomplete, appending the next chunks would leave holes in the data
+			if item['group'] in failed_groups:
+				continue
+
+			try:
+
+				# create group if not exists
+				grp = hf.require_group(item['group'])
+
+				# write the data
+				write_data_to_open_group(grp, item['data'], item['data_name'], meta_data = item.get('meta_data'), overwrite = item.get('overwrite', False), append = item.get('append', False), chunks = item.get('chunks', True))
+
+				# write the data to disk, so the file is consistent when the writer is stopped
+				hf.flush()
+
+				num_written += 1
+
+			except Exception as e:
+				logging.error('Error writing dataset {} to group {}, deleting the group: {}'.format(item['data_name'], item['group'], e))
+
+				# remove the incomplete group, so the subject is processed again in the next run
+				failed_groups.add(item['group'])
+				if item['group'] in hf:
+					del hf[item['group']]
+
+	logging.info('HDF5 writer finished, written {} datasets, access metrics: {}'.format(num_written, get_hdf5_metrics()))
+
+	# report the failed groups to the parent process
+	if len(failed_groups) > 0:
+		logging.error('HDF5 writer was unable to save the groups: {}'.format(sorted(failed_groups)))
+		exit(1)
+
+
 def read_metadata_from_group_dataset(group_name, dataset, hdf5_file = None):
 	"""
 	Read metadata from a dataset from group of HDF5 file
@@ -560,39 +1604,28 @@ def read_metadata_from_group_dataset(group_name, dataset, hdf5_file = None):
 	# check if file exists
 	if os.path.exists(hdf5_file):
 
-		try:
-
-			with h5py.File(hdf5_file, 'r') as hf:
+		with hdf5_read(hdf5_file) as hf:
 
-				# check if subject has its own group
-				if group_name in hf.keys():
-
-					# get the group
-					group = hf[group_name]
+			# check if subject has its own group
+			if group_name in hf.keys():
 
-					# get the dataset from the group
-					if dataset in group.keys():
+				# get the group
+				group = hf[group_name]
 
-						# get the data
-						return dict(group[dataset].attrs)
+				# get the dataset from the group
+				if dataset in group.keys():
 
-					else:
-						logging.error('Dataset {} not part of group {}'.format(dataset, group_name))
-						return None
+					# get the data
+					return dict(group[dataset].attrs)
 
 				else:
-					logging.error('Group {} not present in HDF5 file: {}'.format(group_name, hdf5_file))
+					logging.error('Dataset {} not part of group {}'.format(dataset, group_name))
 					return None
-					
-		except IOError:
 
-			# random sleep between seconds
-			sleep = get_random_number_between(1, 2)
-			# logging.warning('HDF5 file currently open, sleeping {} seconds'.format(sleep))
-			time.sleep(sleep)
+			else:
+				logging.error('Group {} not present in HDF5 file: {}'.format(group_name, hdf5_file))
+				return None
 
-			# call function again because hdf5 file does not allow for multiple write sessions
-			return read_metadata_from_group_dataset(group_name, dataset, hdf5_file)
 	else:
 		logging.error('HDF5 file does not exist: {}'.format(hdf5_file))
 		exit(1)
@@ -622,7 +1655,7 @@ def read_metadata_from_group(group_name, hdf5_file = None):
 	# check if file exists
 	if os.path.exists(hdf5_file):
 
-		with h5py.File(hdf5_file, 'r') as hf:
+		with hdf5_read(hdf5_file) as hf:
 
 			# check if subject has its own group
 			if group_name in hf.keys():
@@ -663,7 +1696,7 @@ def save_meta_data_to_group(group_name, meta_data, hdf5_file = None):
 		# check if file exists
 		if os.path.exists(hdf5_file):
 
-			with h5py.File(hdf5_file, 'a') as hf:
+			with hdf5_write(hdf5_file) as hf:
 
 				# check if subject has its own group
 				if group_name in hf.keys():
@@ -694,16 +1727,6 @@ def save_meta_data_to_group(group_name, meta_data, hdf5_file = None):
 			logging.error('HDF5 file does not exist: {}'.format(hdf5_file))
 			return None
 		
-	except IOError:
-
-		# random sleep between seconds
-		sleep = get_random_number_between(1, 5)
-		# logging.warning('HDF5 file currently open, sleeping {} seconds'.format(sleep))
-		time.sleep(sleep)
-
-		# call function again because hdf5 file does not allow for multiple write sessions
-		return save_meta_data_to_group(group_name, meta_data, hdf5_file)
-
 	except Exception as e:
 		logging.error('Error saving meta data to group {}: {}'.format(group_name, e))
 		exit()
@@ -733,7 +1756,7 @@ def save_meta_data_to_group_dataset(group_name, dataset, meta_data, hdf5_file =
 		# check if file exists
 		if os.path.exists(hdf5_file):
 
-			with h5py.File(hdf5_file, 'a') as hf:
+			with hdf5_write(hdf5_file) as hf:
 
 				# check if subject has its own group
 				if group_name in hf.keys():
@@ -771,16 +1794,6 @@ def save_meta_data_to_group_dataset(group_name, dataset, meta_data, hdf5_file =
 			logging.error('HDF5 file does not exist: {}'.format(hdf5_file))
 			return None
 		
-	except IOError:
-
-		# random sleep between seconds
-		sleep = get_random_number_between(1, 5)
-		# logging.warning('HDF5 file currently open, sleeping {} seconds'.format(sleep))
-		time.sleep(sleep)
-
-		# call function again because hdf5 file does not allow for multiple write sessions
-		return save_meta_data_to_group_dataset(group_name, dataset, meta_data, hdf5_file)
-
 	except Exception as e:
 		logging.error('Error saving meta data to group {} and dataset {}: {}'.format(group_name,dataset, e))
 		exit()
@@ -810,7 +1823,7 @@ def get_datasets_from_group(group_name, hdf5_file = None):
 	# check if file exists
 	if os.path.exists(hdf5_file):
 
-		with h5py.File(hdf5_file, 'r') as hf:
+		with hdf5_read(hdf5_file) as hf:
 
 			# check if subject has its own group
 			if group_name in hf.keys():
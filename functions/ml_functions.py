@@ -178,6 +178,126 @@ def get_confusion_matrix(y, y_hat, **kwargs):
 	return sklearn.metrics.confusion_matrix(y, y_hat, **kwargs)
 
 
+def calculate_binary_confusion_matrix(y, y_hat, batch = False):
+	"""
+	Compute the confusion matrix of binary 0/1 vectors (for example uint8 non-wear vectors) faster than get_confusion_matrix. The true positives are counted from
+	y & y_hat, and the other cells follow from the number of positive labels and positive predictions. Raises a ValueError when the labels are not 0/1 or when the number 
+	of predicted labels does not match the number of true labels
+
+	Paramaters
+	---------
+	y : np.array(n_samples, 1)
+		true class labels, 1 for the positive class and 0 for the negative class
+	y_hat : np.array(n_samples, 1) or np.array((..., n_samples))
+		predicted class labels, or if batch is set to True, a batch of predicted class labels with the samples along the last axis (for example one row for each 
+		grid search combination)
+	batch : Boolean (optional)
+		if set to True, y_hat is a batch of predicted class labels and one confusion matrix is returned for each
+
+	Returns
+	---------
+	confusion_matrix : np.array(4) or np.array((..., 4))
+		tn, fp, fn, tp, the same as get_confusion_matrix(y, y_hat, labels = [0,1]).ravel()
+	"""
+
+	# flatten the true labels to a vector
+	y = np.asarray(y).reshape(-1)
+
+	# one prediction vector is flattened as well, a batch keeps the leading dimensions
+	y_hat = np.asarray(y_hat)
+	if not batch:
+		if y_hat.ndim > 2 or (y_hat.ndim == 2 and y_hat.shape[1] != 1):
+			raise ValueError('Expected one vector of predicted labels, got shape {}. Set batch = True for a batch of predicted labels'.format(y_hat.shape))
+		y_hat = y_hat.reshape(-1)
+
+	# the samples of the predicted labels need to match the true labels, otherwise y_hat & y would broadcast
+	if y_hat.ndim == 0 or y_hat.shape[-1] != len(y):
+		raise ValueError('Number of predicted labels {} does not match the number of true labels {}'.format(y_hat.shape, len(y)))
+
+	# convert to boolean, the same as labels = [0,1] of get_confusion_matrix other values are not allowed
+	y, y_hat = _as_binary_labels(y, 'true'), _as_binary_labels(y_hat, 'predicted')
+
+	# number of positive labels, positive predictions, and true positives
+	num_positive = np.count_nonzero(y)
+	num_predicted_positive = np.count_nonzero(y_hat, axis = -1)
+	tp = np.count_nonzero(y_hat & y, axis = -1)
+
+	# predicted positive with a negative label, and predicted negative with a positive label
+	fp = num_predicted_positive - tp
+	fn = num_positive - tp
+
+	return np.stack([len(y) - num_positive - fp, fp, fn, tp], axis = -1).astype(np.int64)
+
+
+def _as_binary_labels(labels, name):
+	"""
+	Return 0/1 labels as a boolean array, raises a ValueError when there are other values than 0 and 1
+	"""
+
+	# boolean arrays are already binary
+	if labels.dtype == bool:
+		return labels
+
+	# any value other than 0 and 1 changes when converted to boolean
+	binary_labels = labels.astype(bool)
+	if np.any(binary_labels != labels):
+		raise ValueError('The {} labels contain values other than 0 and 1'.format(name))
+
+	return binary_labels
+
+
+def calculate_threshold_confusion_matrix(statistic, y, thresholds, sample_weight = None):
+	"""
+	Compute the confusion matrix of a whole range of thresholds on one statistic in one sorted pass, with a sample predicted as the positive class when its statistic is 
+	below the threshold (y_hat = statistic < threshold). The samples are sorted by their statistic once, and the number of true and predicted positive samples of each 
+	threshold are read from the cumulative sums of the labels
+
+	Parameters
+	---------
+	statistic : np.array(n_samples, 1)
+		statistic of each sample, NaN values are never below a threshold
+	y : np.array(n_samples, 1)
+		true class labels, 1 for the positive class and 0 for the negative class
+	thresholds : np.array(n_thresholds)
+		threshold values
+	sample_weight : np.array(n_samples, 1) (optional)
+		number of times each sample is counted, for example the number of seconds of an epoch. Defaults to 1 for each sample
+
+	Returns
+	---------
+	confusion_matrix : np.array((n_thresholds, 4))
+		tn, fp, fn, tp of each threshold, the same as confusion_matrix(y, statistic < threshold, labels = [0, 1]).ravel()
+	"""
+
+	# flatten the statistic and the labels
+	statistic = np.asarray(statistic).reshape(-1)
+	y = np.asarray(y).reshape(-1) == 1
+
+	# weight of each sample
+	sample_weight = np.ones(len(statistic), dtype = np.int64) if sample_weight is None else np.asarray(sample_weight).reshape(-1)
+
+	# sort the samples by their statistic (NaN values are sorted to the end)
+	order = np.argsort(statistic, kind = 'stable')
+
+	# cumulative weight of all samples and of the positive samples, with a leading zero
+	cumulative_total = np.concatenate([[0], np.cumsum(sample_weight[order])])
+	cumulative_positive = np.concatenate([[0], np.cumsum(np.where(y[order], sample_weight[order], 0))])
+
+	# number of samples with a statistic below each threshold (no samples are below a NaN threshold)
+	thresholds = np.asarray(thresholds, dtype = np.float64).reshape(-1)
+	num_below = np.where(np.isnan(thresholds), 0, np.searchsorted(statistic[order], thresholds, side = 'left'))
+
+	# number of positive and negative labels
+	num_positive = cumulative_positive[-1]
+	num_negative = cumulative_total[-1] - num_positive
+
+	# samples predicted as positive with a positive and with a negative label
+	tp = cumulative_positive[num_below]
+	fp = cumulative_total[num_below] - tp
+
+	return np.stack([num_negative - fp, fp, num_positive - tp, tp], axis = -1)
+
+
 def get_gridsearch_number_between(random, start, end, length = 1):
 	"""
 	Get an array of floats between two values (start and stop) random or a structured range
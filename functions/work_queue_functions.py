@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+"""
+	IMPORT PACKAGES
+"""
+import os
+import json
+import time
+import uuid
+import logging
+
+"""
+	IMPORTED FUNCTIONS
+"""
+from functions.helper_functions import create_directory, delete_directory
+
+"""
+	A work queue on a (shared) filesystem. Each task is a JSON file that moves from the 'pending' folder to the 'running' folder when a worker claims it, and to the 'done'
+	folder when the worker has completed it. Moving a file with os.rename is atomic, so workers on different nodes that mount the same folder never claim the same task.
+	Each time the queue is created it gets a new run ID, the 'finished' marker contains the run ID of the run it belongs to
+"""
+
+
+def create_work_queue(queue_folder, tasks):
+	"""
+	Create a work queue with one task file per task
+
+	Parameters
+	----------
+	queue_folder : os.path
+		folder of the work queue, on a filesystem that is shared by all workers
+	tasks : list
+		list of JSON serializable tasks, for example dictionaries
+
+	Returns
+	---------
+	run_id : string
+		ID of this run of the queue
+	"""
+
+	# remove the finished marker of an earlier queue
+	if os.path.exists(os.path.join(queue_folder, 'finished')):
+		os.remove(os.path.join(queue_folder, 'finished'))
+
+	# new run ID, a finished marker of an earlier run does not match this ID (see is_work_queue_finished)
+	run_id = uuid.uuid4().hex
+	create_directory(queue_folder)
+	_write_work_queue_file(os.path.join(queue_folder, 'run'), run_id)
+
+	# create the folders of the queue, without the tasks of an earlier queue
+	for status in ['pending', 'running', 'done']:
+		if os.path.exists(os.path.join(queue_folder, status)):
+			delete_directory(os.path.join(queue_folder, status))
+		create_directory(os.path.join(queue_folder, status))
+
+	for i, task in enumerate(tasks):
+
+		# write the task to a temporary file first, so workers never claim a partially written task
+		task_file = os.path.join(queue_folder, 'pending', 'task-{:08d}.json'.format(i))
+		with open(task_file + '.tmp', 'w') as f:
+			json.dump(task, f)
+		os.rename(task_file + '.tmp', task_file)
+
+	logging.info('Created work queue with {} tasks: {} (run {})'.format(len(tasks), queue_folder, run_id))
+
+	return run_id
+
+
+def claim_work_queue_task(queue_folder):
+	"""
+	Claim the next pending task of a work queue
+
+	Parameters
+	----------
+	queue_folder : os.path
+		folder of the work queue (see create_work_queue)
+
+	Returns
+	---------
+	task_id : string or None
+		ID of the claimed task, None if there are no pending tasks
+	task : object or None
+		the claimed task
+	"""
+
+	# pending tasks, sorted so the tasks are processed in the order in which they were created
+	pending_folder = os.path.join(queue_folder, 'pending')
+	task_ids = sorted(x for x in os.listdir(pending_folder) if x.endswith('.json')) if os.path.exists(pending_folder) else []
+
+	for task_id in task_ids:
+
+		# the task file in the running folder
+		running_file = os.path.join(queue_folder, 'running', task_id)
+
+		try:
+			# set the modification time to the time of the claim before the task is moved, os.rename keeps the modification time and a task that has been pending
+			# for longer than the timeout would otherwise be released again right away (see release_stale_work_queue_tasks)
+			os.utime(os.path.join(pending_folder, task_id))
+
+			# claim the task, only one worker can move the file
+			os.rename(os.path.join(pending_folder, task_id), running_file)
+
+			with open(running_file, 'r') as f:
+				return task_id, json.load(f)
+
+		except FileNotFoundError:
+			# the task has been claimed by another worker, or released and claimed again
+			continue
+
+	return None, None
+
+
+def complete_work_queue_task(queue_folder, task_id):
+	"""
+	Mark a claimed task of a work queue as done
+
+	Parameters
+	----------
+	queue_folder : os.path
+		folder of the work queue (see create_work_queue)
+	task_id : string
+		ID of the task (see claim_work_queue_task)
+	"""
+
+	try:
+		os.rename(os.path.join(queue_folder, 'running', task_id), os.path.join(queue_folder, 'done', task_id))
+	except FileNotFoundError:
+		# a released stale task that has been completed by another worker as well, the results of both workers are the same
+		logging.warning('Task already completed by another worker: {}'.format(task_id))
+
+
+def release_stale_work_queue_tasks(queue_folder, task_timeout):
+	"""
+	Move tasks that have been running for longer than the timeout back to the pending tasks, for example tasks of a worker that has been stopped
+
+	Parameters
+	----------
+	queue_folder : os.path
+		folder of the work queue (see create_work_queue)
+	task_timeout : int
+		number of seconds after which a running task is considered stale, this needs to be longer than the longest task
+
+	Returns
+	---------
+	num_released : int
+		number of tasks that have been moved back to the pending tasks
+	"""
+
+	# number of released tasks
+	num_released = 0
+
+	for task_id in os.listdir(os.path.join(queue_folder, 'running')):
+
+		# file of the running task
+		running_file = os.path.join(queue_folder, 'running', task_id)
+
+		try:
+			if time.time() - os.path.getmtime(running_file) > task_timeout:
+				os.rename(running_file, os.path.join(queue_folder, 'pending', task_id))
+				num_released += 1
+				logging.warning('Released stale task: {}'.format(task_id))
+		except FileNotFoundError:
+			# the task has been completed in the meantime
+			continue
+
+	return num_released
+
+
+def get_work_queue_progress(queue_folder):
+	"""
+	Return the number of pending, running, and done tasks of a work queue
+
+	Parameters
+	----------
+	queue_folder : os.path
+		folder of the work queue (see create_work_queue)
+
+	Returns
+	---------
+	progress : dict()
+		status ('pending', 'running', 'done') to number of tasks
+	"""
+
+	return {status : len([x for x in os.listdir(os.path.join(queue_folder, status)) if x.endswith('.json')]) for status in ['pending', 'running', 'done']}
+
+
+def finish_work_queue(queue_folder):
+	"""
+	Mark the current run of a work queue as finished, so waiting workers stop (see is_work_queue_finished)
+
+	Parameters
+	----------
+	queue_folder : os.path
+		folder of the work queue (see create_work_queue)
+	"""
+
+	_write_work_queue_file(os.path.join(queue_folder, 'finished'), get_work_queue_run_id(queue_folder))
+
+
+def is_work_queue_finished(queue_folder, ignore_run_id = None):
+	"""
+	Return True if the current run of the work queue has been marked as finished by the coordinator. A finished marker of another run is ignored
+
+	Parameters
+	----------
+	queue_folder : os.path
+		folder of the work queue (see create_work_queue)
+	ignore_run_id : string (optional)
+		run ID of which the finished marker is ignored, for example the run that was already finished when a worker started to wait for the next run
+	"""
+
+	# run ID within the finished marker
+	finished_run_id = _read_work_queue_file(os.path.join(queue_folder, 'finished'))
+
+	return finished_run_id is not None and finished_run_id == get_work_queue_run_id(queue_folder) and finished_run_id != ignore_run_id
+
+
+def get_work_queue_run_id(queue_folder):
+	"""
+	Return the ID of the current run of a work queue, None if the queue has not been created yet
+
+	Parameters
+	----------
+	queue_folder : os.path
+		folder of the work queue (see create_work_queue)
+	"""
+
+	return _read_work_queue_file(os.path.join(queue_folder, 'run'))
+
+
+def _write_work_queue_file(file, content):
+
+	# write to a temporary file first, so other workers never read a partially written file
+	with open(file + '.tmp', 'w') as f:
+		f.write(content)
+	os.replace(file + '.tmp', file)
+
+
+def _read_work_queue_file(file):
+
+	try:
+		with open(file, 'r') as f:
+			return f.read()
+	except FileNotFoundError:
+		return None
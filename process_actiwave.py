@@ -22,14 +22,15 @@ from math import sqrt
 from functions.helper_functions import 	set_start, set_end, dictionary_values_bytes_to_string, create_directory, read_directory, calculate_vector_magnitude, \
 										save_pickle, get_random_number_between, load_pickle, get_subject_counters_for_correction, get_subjects_with_invalid_data,\
 										read_csv, convert_short_code_to_long
-from functions.hdf5_functions import get_all_subjects_hdf5, read_metadata_from_group, read_dataset_from_group, read_metadata_from_group_dataset, save_multi_data_to_group_hdf5, save_meta_data_to_group_dataset, save_data_to_group_hdf5
+from functions.hdf5_functions import get_all_subjects_hdf5, read_dataset_from_group, read_metadata_from_group_dataset, save_multi_data_to_group_hdf5, save_meta_data_to_group_dataset, save_data_to_group_hdf5, read_group_bundle, \
+										get_time_axis_from_time_data, get_time_axis_meta_data, get_time_gaps_dataset_name
 from functions.actiwave_functions import create_actiwave_time_vector
 from functions.plot_functions import plot_classification_results, plot_time_distribution, plot_nw_scenarios, plot_nw_distribution, plot_non_wear_data
 from functions.gt3x_functions import rescale_log_data, create_time_array
 from functions.raw_non_wear_functions import find_candidate_non_wear_segments_from_raw, find_consecutive_index_ranges
 from functions.autocalibrate_functions_2 import get_calibration_weights, return_default_weights, find_segments_moving_averages
 from functions.statistical_functions import calculate_lower_bound_Keogh, signal_to_noise
-from functions.ml_functions import execute_gridsearch_cv, predict_class, get_confusion_matrix, calculate_classification_performance
+from functions.ml_functions import execute_gridsearch_cv, predict_class, calculate_binary_confusion_matrix, calculate_classification_performance
 from functions.datasets_functions import get_actigraph_acc_data, get_actiwave_acc_data, get_actiwave_hr_data, get_actiwave_ecg_data
 from functions.signal_processing_functions import apply_butterworth_filter, resample_acceleration
 from functions.dl_functions import train_mlp_classifier
@@ -125,8 +126,11 @@ def process_mapping_actiwave_on_actigraph(subject, idx = 1, total = 1):
 	# verbose
 	logging.info('{style} Processing subject:{} {}/{} {style}'.format(subject, idx, total, style = '='*10))
 
+	# read the ecg, heart rate, and acceleration data of the actiwave, together with the meta data, with one open HDF5 file
+	actiwave_bundle = read_group_bundle(subject, ['ecg', 'estimated_hr', 'acceleration'], hdf5_file = ACTIWAVE_HDF5_FILE)
+
 	# read meta data from the original EDF file that is stored as a dictionary in HDF5
-	meta_data = read_metadata_from_group(group_name = subject, hdf5_file = ACTIWAVE_HDF5_FILE)
+	meta_data = actiwave_bundle['group_meta_data']
 	# convert meta_data values from bytes to string
 	meta_data = dictionary_values_bytes_to_string(meta_data)
 	# read start of the measurement
@@ -136,10 +140,10 @@ def process_mapping_actiwave_on_actigraph(subject, idx = 1, total = 1):
 		ECG DATA
 	"""
 
-	# read ecg data
-	actiwave_ecg = read_dataset_from_group(group_name = subject, dataset = 'ecg', hdf5_file = ACTIWAVE_HDF5_FILE)
-	# read ecg meta data
-	actiwave_ecg_meta_data = read_metadata_from_group_dataset(group_name = subject, dataset = 'ecg', hdf5_file = ACTIWAVE_HDF5_FILE)
+	# ecg data
+	actiwave_ecg = actiwave_bundle['data']['ecg']
+	# ecg meta data
+	actiwave_ecg_meta_data = actiwave_bundle['meta_data']['ecg']
 	# extract length of data
 	ecg_length = actiwave_ecg_meta_data['NSamples']
 	# extract sample frequency (hz)
@@ -151,10 +155,10 @@ def process_mapping_actiwave_on_actigraph(subject, idx = 1, total = 1):
 		HEART RATE
 	"""
 
-	#read hr data
-	actiwave_hr = read_dataset_from_group(group_name = subject, dataset = 'estimated_hr', hdf5_file = ACTIWAVE_HDF5_FILE)
-	# read ecg meta data
-	actiwave_hr_meta_data = read_metadata_from_group_dataset(group_name = subject, dataset = 'estimated_hr', hdf5_file = ACTIWAVE_HDF5_FILE)
+	# hr data
+	actiwave_hr = actiwave_bundle['data']['estimated_hr']
+	# hr meta data
+	actiwave_hr_meta_data = actiwave_bundle['meta_data']['estimated_hr']
 	# extract length of data
 	hr_length = actiwave_hr_meta_data['NSamples']
 	# create time vector
@@ -165,10 +169,10 @@ def process_mapping_actiwave_on_actigraph(subject, idx = 1, total = 1):
 		ACCELERATION ACTIWAVE
 	"""
 
-	# read acceleration data
-	actiwave_acc = read_dataset_from_group(group_name = subject, dataset = 'acceleration', hdf5_file = ACTIWAVE_HDF5_FILE)
-	# # read ecg meta data
-	actiwave_acc_meta_data = read_metadata_from_group_dataset(group_name = subject, dataset = 'acceleration', hdf5_file = ACTIWAVE_HDF5_FILE)
+	# acceleration data
+	actiwave_acc = actiwave_bundle['data']['acceleration']
+	# acceleration meta data
+	actiwave_acc_meta_data = actiwave_bundle['meta_data']['acceleration']
 	# # extract length of data
 	acc_length = actiwave_acc_meta_data['NSamples']
 	# extract the sample frequency
@@ -180,20 +184,24 @@ def process_mapping_actiwave_on_actigraph(subject, idx = 1, total = 1):
 		ACCELERATION ACTIGRAPH
 	"""
 
-	# read log data
-	actigraph_acc = read_dataset_from_group(group_name = subject, dataset = 'log', hdf5_file = ACTIGRAPH_HDF5_FILE)
+	# read log data, log meta data, and time data with one open HDF5 file
+	actigraph_bundle = read_group_bundle(subject, ['log', 'time'], hdf5_file = ACTIGRAPH_HDF5_FILE)
 	# check if subject had actigraph log data (this is the raw data extracted from the .gt3x file)
-	if actigraph_acc is None:
+	if actigraph_bundle is None or actigraph_bundle['data']['log'] is None:
 		logging.warning('Subject {} has no Actigraph log data. Skipping ...'.format(subject))
 		return
-	# read log meta data
-	actigraph_acc_meta_data = read_metadata_from_group_dataset(group_name = subject, dataset = 'log', hdf5_file = ACTIGRAPH_HDF5_FILE)
+	# log data
+	actigraph_acc = actigraph_bundle['data']['log']
+	# log meta data
+	actigraph_acc_meta_data = actigraph_bundle['meta_data']['log']
 	# scale log data
 	actigraph_acc = rescale_log_data(actigraph_acc, acceleration_scale = actigraph_acc_meta_data['Acceleration_Scale'])	
+	# extract the sample frequency
+	actigraph_hz = int(actigraph_acc_meta_data['Sample_Rate'])
 	# get time data
-	actigraph_time = read_dataset_from_group(group_name = subject, dataset = 'time', hdf5_file = ACTIGRAPH_HDF5_FILE)
+	actigraph_time = actigraph_bundle['data']['time']
 	# convert time data to correct time series array with correct miliseconds values
-	actigraph_time = create_time_array(actigraph_time)
+	actigraph_time = create_time_array(actigraph_time, hz = actigraph_hz)
 	
 
 	"""
@@ -248,10 +256,28 @@ def process_mapping_actiwave_on_actigraph(subject, idx = 1, total = 1):
 		SAVE DATA TO HDF5
 	"""
 
+	# the timestamps are not saved as int64 arrays but as an implicit time axis (start time, sample rate, and gaps, see create_time_axis) of each dataset
+	actigraph_acc_time_axis = get_time_axis_from_time_data(actigraph_time, time_rate = actigraph_hz)
+	actiwave_acc_time_axis = get_time_axis_from_time_data(actiwave_time, time_rate = acc_hz)
+	actiwave_hr_time_axis = get_time_axis_from_time_data(actiwave_hr_time, time_rate = 1)
+	actiwave_ecg_time_axis = get_time_axis_from_time_data(actiwave_ecg_time, time_rate = ecg_hz)
+
+	# the start time and sample rate are saved within the attributes of each dataset
+	actigraph_acc_meta_data = dict(actigraph_acc_meta_data, **get_time_axis_meta_data(actigraph_acc_time_axis))
+	actiwave_acc_meta_data = dict(actiwave_acc_meta_data, **get_time_axis_meta_data(actiwave_acc_time_axis))
+	actiwave_hr_meta_data = dict(actiwave_hr_meta_data, **get_time_axis_meta_data(actiwave_hr_time_axis))
+	actiwave_ecg_meta_data = dict(actiwave_ecg_meta_data, **get_time_axis_meta_data(actiwave_ecg_time_axis))
+
 	# create list of data, data_name, and meta_data. IMPORTANT, mapping is based on position within the three lists, so they need to be of equal length with corresponding index number
-	data = [actigraph_acc, actigraph_time.astype('int64'), actiwave_acc, actiwave_time.astype('int64'), actiwave_hr, actiwave_hr_time.astype('int64'), actiwave_ecg, actiwave_ecg_time.astype('int64')]
-	data_name = ['actigraph_acc', 'actigraph_time', 'actiwave_acc', 'actiwave_time', 'actiwave_hr', 'actiwave_hr_time', 'actiwave_ecg', 'actiwave_ecg_time']
-	meta_data = [actigraph_acc_meta_data, None, actiwave_acc_meta_data, None, actiwave_hr_meta_data, None, actiwave_ecg_meta_data, None]
+	data = [actigraph_acc, actiwave_acc, actiwave_hr, actiwave_ecg]
+	data_name = ['actigraph_acc', 'actiwave_acc', 'actiwave_hr', 'actiwave_ecg']
+	meta_data = [actigraph_acc_meta_data, actiwave_acc_meta_data, actiwave_hr_meta_data, actiwave_ecg_meta_data]
+
+	# the gap tables are saved as datasets next to the data, the attributes of a dataset are limited to 64KB which is not enough for recordings with many gaps
+	time_axes = [actigraph_acc_time_axis, actiwave_acc_time_axis, actiwave_hr_time_axis, actiwave_ecg_time_axis]
+	data += [x['time_gaps'] for x in time_axes]
+	data_name += [get_time_gaps_dataset_name(x) for x in data_name]
+	meta_data += [{} for _ in time_axes]
 
 	# check if lists are of equal length
 	if any(len(x) != len(data) for x in [data_name, meta_data]):
@@ -696,7 +722,7 @@ def create_dl_features_from_labels(f, save_location, i = 1, total = 1, autocalib
 		GET DATA
 	"""
 	# actigraph acceleration data
-	actigraph_acc, *_ = get_actigraph_acc_data(subject, ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE, autocalibrate)
+	actigraph_acc, *_ = get_actigraph_acc_data(subject, ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE, autocalibrate, return_time = False)
 	# actiwave acceleration data
 	actiwave_acc, _, actiwave_time = get_actiwave_acc_data(subject, ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE, autocalibrate)
 	
@@ -711,7 +737,7 @@ def create_dl_features_from_labels(f, save_location, i = 1, total = 1, autocalib
 		exit(1)
 
 	# actiwave heart rate data
-	actiwave_hr, _ = get_actiwave_hr_data(subject, ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE)
+	actiwave_hr, _ = get_actiwave_hr_data(subject, ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE, return_time = False)
 	if resample_hz > 1:
 		# actiwave_hr has 1 measurement per second, whereas we need to have 32 measurements per second, we simply extend the values
 		actiwave_hr = actiwave_hr.repeat(resample_hz, axis = 0)
@@ -1487,19 +1513,16 @@ def process_classification_performance_total(data_folder = os.path.join('files',
 		# dataframe to store values to
 		df = pd.DataFrame()
 
+		# confusion matrix values of all non wear algorithms in one batch, the true labels are the first column, or index 0
+		confusion_matrices = calculate_binary_confusion_matrix(non_wear_data[:,0], non_wear_data[:,1:].T, batch = True)
+
 		# loop over data from non wear algorithm and calculate classification performance
 		for col in range(1, non_wear_data.shape[1]):
 
 			logging.debug('Processing column {} {}'.format(col, col_to_label[col]))
 
-			# true labels; this is the first column, or index 0
-			y = non_wear_data[:,0]
-
-			# get predicted values
-			y_hat = non_wear_data[:,col]
-
 			# get confusion matrix values
-			tn, fp, fn, tp = get_confusion_matrix(y, y_hat, labels = [0,1]).ravel()
+			tn, fp, fn, tp = confusion_matrices[col - 1]
 
 			logging.debug('tn: {}, fp: {}, fn: {}, tp: {}'.format(tn, fp, fn, tp))
 
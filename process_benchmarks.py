@@ -0,0 +1,621 @@
+# -*- coding: utf-8 -*-
+
+"""
+	IMPORT PACKAGES
+"""
+import os
+import time
+import glob2
+import h5py
+import struct
+import zipfile
+import tempfile
+import numpy as np
+from multiprocessing import Process
+
+"""
+	IMPORTED FUNCTIONS
+"""
+from functions.helper_functions import set_start, set_end, delete_directory
+from functions.gt3x_functions import unzip_gt3x_file, extract_info, extract_log, extract_log_vectorized, build_log_index, extract_gt3x_log_chunks
+from functions.hdf5_functions import read_group_bundle, get_storage_options, read_dataset_from_group, get_all_subjects_hdf5, save_data_to_group_hdf5, append_data_to_group_hdf5, close_read_handles, get_hdf5_metrics, reset_hdf5_metrics
+from functions.helper_functions import calculate_vector_magnitude
+from functions.ml_functions import get_confusion_matrix, calculate_binary_confusion_matrix
+from algorithms.non_wear_time.hecht_2009 import hecht_2009_triaxial_calculate_non_wear_time, hecht_2009_triaxial_calculate_non_wear_time_vectorized
+from algorithms.non_wear_time.troiano_2007 import troiano_2007_calculate_non_wear_time, troiano_2007_calculate_non_wear_time_vectorized
+from algorithms.non_wear_time.choi_2011 import choi_2011_calculate_non_wear_time, choi_2011_calculate_non_wear_time_vectorized
+from algorithms.non_wear_time.hees_2013 import hees_2013_calculate_non_wear_time, hees_2013_calculate_non_wear_time_vectorized
+
+"""
+	GLOBAL VARIABLES
+"""
+# folder location of the .gt3x files
+GT3X_FOLDER = os.path.join(os.sep, 'Volumes', 'LaCie_server', 'Actigraph_raw')
+# HDF5 file with the actigraph and actiwave data mapped on each other
+ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE = os.path.join(os.sep, 'users', 'shaheensyed', 'hdf5', 'ACTIWAVE_ACTIGRAPH_MAPPING.hdf5')
+
+
+"""
+	GT3X DECODING
+"""
+def benchmark_gt3x_decoding(gt3x_file = None, repeat = 1):
+	"""
+	Compare the bitstring based extract_log with the vectorized extract_log_vectorized on the same .gt3x file. Both the execution time
+	and the equality of the returned acceleration and time arrays are logged, as well as the overhead of the checksum verification
+
+	Parameters
+	----------
+	gt3x_file : os.path (optional)
+		location of the .gt3x file. If not given, the first .gt3x file within GT3X_FOLDER is used
+	repeat : int (optional)
+		number of times each decoder is executed, the fastest run is reported
+	"""
+
+	# use the first gt3x file if no file is given
+	if gt3x_file is None:
+		gt3x_file = glob2.glob(os.path.join(GT3X_FOLDER, '**', '*.gt3x'))[0]
+
+	# unzip the raw .gt3x file into a temporary folder
+	save_location = gt3x_file.split('.')[0]
+	log_bin, info_txt = unzip_gt3x_file(gt3x_file, save_location = save_location)
+
+	# get info data from info file
+	info_data = extract_info(info_txt)
+	acceleration_scale, sample_rate = float(info_data['Acceleration_Scale']), int(info_data['Sample_Rate'])
+
+	# keep track of the results of each decoder
+	results = {}
+
+	for decoder in [extract_log, extract_log_vectorized]:
+
+		# keep track of the execution time of each run
+		timings = []
+
+		for _ in range(repeat):
+
+			tic = time.time()
+			log_data, log_time = decoder(log_bin, acceleration_scale = acceleration_scale, sample_rate = sample_rate)
+			timings.append(time.time() - tic)
+
+		results[decoder.__name__] = {'log_data' : log_data, 'log_time' : log_time, 'seconds' : min(timings)}
+
+		logging.info('{}: {:.2f} seconds ({} records)'.format(decoder.__name__, min(timings), len(log_time)))
+
+	# check if both decoders return the same data
+	equal_data = np.array_equal(results['extract_log']['log_data'], results['extract_log_vectorized']['log_data'])
+	equal_time = np.array_equal(results['extract_log']['log_time'], results['extract_log_vectorized']['log_time'])
+
+	logging.info('Equal log data: {}, equal time data: {}'.format(equal_data, equal_time))
+	logging.info('Speedup: {:.1f}x'.format(results['extract_log']['seconds'] / results['extract_log_vectorized']['seconds']))
+
+	# overhead of validating the checksum of each activity record
+	timings = {}
+	for verify_checksums in [False, True]:
+
+		# keep track of the execution time of each run
+		runs = []
+		for _ in range(repeat):
+
+			tic = time.time()
+			extract_log_vectorized(log_bin, acceleration_scale = acceleration_scale, sample_rate = sample_rate, verify_checksums = verify_checksums)
+			runs.append(time.time() - tic)
+
+		timings[verify_checksums] = min(runs)
+
+	logging.info('Checksum verification overhead: {:.1f}%'.format(100 * (timings[True] - timings[False]) / timings[False]))
+
+	# delete the unzipped files
+	delete_directory(save_location)
+
+
+def benchmark_gt3x_corrupt_records(gt3x_file = None, corrupt_record = 100, chunk_records = 3600):
+	"""
+	Corrupt the size bytes of one activity record of a .gt3x file and check that both extract_log_vectorized and the streaming extract_gt3x_log_chunks with recovery
+	set to 'skip' leave out only the corrupt record, continue at the next record, and report the skipped bytes as unreadable
+
+	Parameters
+	----------
+	gt3x_file : os.path (optional)
+		location of the .gt3x file. If not given, the first .gt3x file within GT3X_FOLDER is used
+	corrupt_record : int (optional)
+		activity record of which the size bytes are corrupted
+	chunk_records : int (optional)
+		number of activity records within one chunk of the streaming extraction
+
+	Returns
+	----------
+	equal : Boolean
+		True if both extractions return the original data without the corrupt record, and report the skipped bytes
+	"""
+
+	# use the first gt3x file if no file is given
+	if gt3x_file is None:
+		gt3x_file = glob2.glob(os.path.join(GT3X_FOLDER, '**', '*.gt3x'))[0]
+
+	# read the info.txt and log.bin file from the .gt3x file
+	with zipfile.ZipFile(gt3x_file, 'r') as myzip:
+		info_txt, log_bin = myzip.read('info.txt'), bytearray(myzip.read('log.bin'))
+
+	with tempfile.TemporaryDirectory() as temp_folder:
+
+		# save the original log.bin file
+		log_file = os.path.join(temp_folder, 'log.bin')
+		with open(log_file, 'wb') as f:
+			f.write(log_bin)
+
+		# get info data from info file
+		info_file = os.path.join(temp_folder, 'info.txt')
+		with open(info_file, 'wb') as f:
+			f.write(info_txt)
+		info_data = extract_info(info_file)
+		acceleration_scale, sample_rate = float(info_data['Acceleration_Scale']), int(info_data['Sample_Rate'])
+
+		# extract the original data
+		log_data, log_time = extract_log_vectorized(log_file, acceleration_scale = acceleration_scale, sample_rate = sample_rate)
+
+		# increase the size of the corrupt record by one byte, so it ends within its own checksum
+		log_index = build_log_index(log_file)
+		offset = int(log_index['offset'][np.flatnonzero(log_index['type'] == 0)[corrupt_record]])
+		struct.pack_into('<H', log_bin, offset + 6, struct.unpack_from('<H', log_bin, offset + 6)[0] + 1)
+
+		# save the corrupt log.bin file, and a .gt3x file with the corrupt log.bin file for the streaming extraction
+		corrupt_file = os.path.join(temp_folder, 'corrupt.bin')
+		with open(corrupt_file, 'wb') as f:
+			f.write(log_bin)
+		corrupt_gt3x_file = os.path.join(temp_folder, 'corrupt.gt3x')
+		with zipfile.ZipFile(corrupt_gt3x_file, 'w', compression = zipfile.ZIP_DEFLATED) as myzip:
+			myzip.writestr('info.txt', info_txt)
+			myzip.writestr('log.bin', bytes(log_bin))
+
+		# extract the corrupt data
+		corrupt_data, corrupt_time, corrupt_report = extract_log_vectorized(corrupt_file, acceleration_scale = acceleration_scale, sample_rate = sample_rate, recovery = 'skip', return_report = True)
+
+		# extract the corrupt data chunk by chunk
+		chunks = list(extract_gt3x_log_chunks(corrupt_gt3x_file, acceleration_scale = acceleration_scale, sample_rate = sample_rate, chunk_records = chunk_records, recovery = 'skip'))
+		stream_data, stream_time = np.concatenate([x[0] for x in chunks]), np.concatenate([x[1] for x in chunks])
+		stream_report = np.concatenate([x[3] for x in chunks])
+
+	# the original data without the corrupt record
+	keep = np.ones(len(log_time), dtype = bool)
+	keep[corrupt_record] = False
+	expected_data, expected_time = log_data.reshape(len(log_time), sample_rate, -1)[keep].reshape(-1, log_data.shape[1]), log_time[keep]
+
+	# check the extracted data and the unreadable bytes of the report
+	equal_data = np.array_equal(corrupt_data, expected_data) and np.array_equal(stream_data, expected_data)
+	equal_time = np.array_equal(corrupt_time, expected_time) and np.array_equal(stream_time, expected_time)
+	unreadable = [int(x['offset']) for x in corrupt_report if x['reason'] == b'unreadable'] == [offset] and np.array_equal(corrupt_report, stream_report)
+
+	logging.info('Equal log data: {}, equal time data: {}, reported unreadable bytes: {}'.format(equal_data, equal_time, unreadable))
+
+	return equal_data and equal_time and unreadable
+
+
+"""
+	HDF5 STORAGE
+"""
+def benchmark_hdf5_storage(subject, datasets = ['actigraph_acc', 'actiwave_acc', 'actiwave_hr', 'actiwave_ecg'], hdf5_file = ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE, slice_rows = 360000, repeat = 3):
+	"""
+	Compare the storage size and the read and write throughput of the datasets of one subject when stored contiguous without compression (as before the storage policy), 
+	with the chunk shape of the storage policy and different compression filters
+
+	Parameters
+	----------
+	subject : string
+		subject ID
+	datasets : list (optional)
+		names of the datasets to compare
+	hdf5_file : os.path (optional)
+		HDF5 file to read the datasets from
+	slice_rows : int (optional)
+		number of rows of the sliced read, default 360000 which is one hour of 100hz data
+	repeat : int (optional)
+		number of times each read is executed, the fastest read is reported
+	"""
+
+	# read the datasets
+	bundle = read_group_bundle(subject, datasets, hdf5_file = hdf5_file)
+
+	# storage options to compare: name -> function that returns the create_dataset options of a dataset
+	storage_options = {	'contiguous' : lambda name, data, meta_data: {},
+						'policy chunks' : lambda name, data, meta_data: {'chunks' : get_storage_options(subject, name, data, meta_data).get('chunks')},
+						'policy chunks + lzf + shuffle' : lambda name, data, meta_data: dict(get_storage_options(subject, name, data, meta_data), compression = 'lzf', compression_opts = None, shuffle = True),
+						'policy chunks + gzip 1 + shuffle' : lambda name, data, meta_data: dict(get_storage_options(subject, name, data, meta_data), compression = 'gzip', compression_opts = 1, shuffle = True),
+						'policy chunks + gzip 4 + shuffle' : lambda name, data, meta_data: dict(get_storage_options(subject, name, data, meta_data), compression = 'gzip', compression_opts = 4, shuffle = True),
+						'storage policy' : lambda name, data, meta_data: get_storage_options(subject, name, data, meta_data)}
+
+	for name in datasets:
+
+		# data and meta data of the dataset
+		data, meta_data = bundle['data'][name], bundle['meta_data'][name]
+		if data is None:
+			continue
+
+		# size of the data in MB
+		data_mb = data.nbytes / 1024**2
+		logging.info('{style} Dataset {}: {} {}, {:.1f} MB {style}'.format(name, data.shape, data.dtype, data_mb, style = '='*10))
+
+		for option_name, get_options in storage_options.items():
+
+			# write the dataset to a temporary HDF5 file
+			with tempfile.TemporaryDirectory() as temp_folder:
+
+				temp_file = os.path.join(temp_folder, 'storage.hdf5')
+
+				tic = time.time()
+				with h5py.File(temp_file, 'w') as hf:
+					hf.create_dataset(name, data = data, **get_options(name, data, meta_data))
+				write_seconds = time.time() - tic
+
+				# size of the file on disk
+				file_mb = os.path.getsize(temp_file) / 1024**2
+
+				# read the full dataset and a slice from the middle of the dataset
+				full_seconds, slice_seconds = [], []
+				with h5py.File(temp_file, 'r') as hf:
+					for _ in range(repeat):
+
+						tic = time.time()
+						hf[name][:]
+						full_seconds.append(time.time() - tic)
+
+						tic = time.time()
+						hf[name][len(data) // 2:len(data) // 2 + slice_rows]
+						slice_seconds.append(time.time() - tic)
+
+			logging.info('{:<35} size: {:8.1f} MB ({:5.1f}%), write: {:8.1f} MB/s, read: {:8.1f} MB/s, slice read: {:6.1f} ms'.format(option_name, file_mb, 100 * file_mb / data_mb, 
+						data_mb / write_seconds, data_mb / min(full_seconds), 1000 * min(slice_seconds)))
+
+
+def benchmark_hdf5_append(num_chunks = 24, chunk_rows = 360000):
+	"""
+	Compare appending chunks to a resizable dataset (as the streaming conversion of a .gt3x file does) with saving all data at once, and check that the appended dataset
+	is the same as the data. The chunks include an empty chunk in the middle and at the end, which the streaming conversion creates when the number of records 
+	is a multiple of the chunk size plus one
+
+	Parameters
+	----------
+	num_chunks : int (optional)
+		number of chunks to append
+	chunk_rows : int (optional)
+		number of rows of each chunk, default 360000 which is one hour of 100hz data
+
+	Returns
+	----------
+	equal : Boolean
+		True if the appended dataset is the same as the data
+	"""
+
+	# random acceleration data in chunks, with empty chunks
+	random = np.random.default_rng(42)
+	chunks = [random.integers(-2048, 2048, (chunk_rows, 3), dtype = np.int16) for _ in range(num_chunks)]
+	chunks.insert(num_chunks // 2, np.zeros((0, 3), dtype = np.int16))
+	chunks.append(np.zeros((0, 3), dtype = np.int16))
+
+	with tempfile.TemporaryDirectory() as temp_folder:
+
+		temp_file = os.path.join(temp_folder, 'append.hdf5')
+
+		# save all data at once
+		tic = time.time()
+		save_data_to_group_hdf5('subject', np.concatenate(chunks), 'data', hdf5_file = temp_file)
+		save_seconds = time.time() - tic
+
+		# append the chunks one by one
+		tic = time.time()
+		for chunk in chunks:
+			append_data_to_group_hdf5('subject', chunk, 'appended', hdf5_file = temp_file)
+		append_seconds = time.time() - tic
+
+		# the appended dataset should be the same as the data
+		equal = np.array_equal(read_dataset_from_group('subject', 'appended', hdf5_file = temp_file), np.concatenate(chunks))
+
+		close_read_handles(temp_file)
+
+	logging.info('Save at once: {:.2f} seconds, append {} chunks: {:.2f} seconds'.format(save_seconds, len(chunks), append_seconds))
+	logging.info('Equal appended dataset: {}'.format(equal))
+
+	return equal
+
+
+def benchmark_hdf5_read_handles(num_reads = 100, num_rows = 360000):
+	"""
+	Compare repeated reads of one dataset with the pooled read handle (hdf5_read) to reads that open and close the HDF5 file every time. Also checks that the pooled
+	handle is reused between top level reads, and that it is opened again when another process has written to the file
+
+	Parameters
+	----------
+	num_reads : int (optional)
+		number of top level reads
+	num_rows : int (optional)
+		number of rows of the dataset
+
+	Returns
+	----------
+	valid : Boolean
+		True if the file is opened only once for all reads, and opened again after the write of another process
+	"""
+
+	with tempfile.TemporaryDirectory() as temp_folder:
+
+		# HDF5 file with one dataset
+		temp_file = os.path.join(temp_folder, 'read_handles.hdf5')
+		save_data_to_group_hdf5('subject', np.zeros((num_rows, 3), dtype = np.int16), 'data', hdf5_file = temp_file)
+
+		# reads that open and close the file every time
+		tic = time.time()
+		for _ in range(num_reads):
+			read_dataset_from_group('subject', 'data', hdf5_file = temp_file, start_slice = 0, end_slice = 100)
+			close_read_handles(temp_file)
+		reopen_seconds = time.time() - tic
+
+		# reads with the pooled read handle
+		reset_hdf5_metrics()
+		tic = time.time()
+		for _ in range(num_reads):
+			read_dataset_from_group('subject', 'data', hdf5_file = temp_file, start_slice = 0, end_slice = 100)
+		pooled_seconds = time.time() - tic
+
+		# the file should be opened by the first read only
+		reused = get_hdf5_metrics()['read_handle_misses'] == 1
+
+		# another process changes the dataset
+		writer = Process(target = save_data_to_group_hdf5, args = ('subject', np.ones((num_rows, 3), dtype = np.int16), 'data'), kwargs = {'overwrite' : True, 'hdf5_file' : temp_file})
+		writer.start()
+		writer.join()
+
+		# the next read should open the file again and see the new data
+		data = read_dataset_from_group('subject', 'data', hdf5_file = temp_file, start_slice = 0, end_slice = 100)
+		reopened = get_hdf5_metrics()['read_handle_misses'] == 2 and np.all(data == 1)
+
+		close_read_handles(temp_file)
+
+	logging.info('Open and close: {:.2f} ms per read, pooled read handle: {:.2f} ms per read'.format(1000 * reopen_seconds / num_reads, 1000 * pooled_seconds / num_reads))
+	logging.info('Read handle reused between reads: {}, opened again after a write of another process: {}'.format(reused, reopened))
+
+	return reused and reopened
+
+
+"""
+	NON WEAR ALGORITHMS
+"""
+def benchmark_hecht_2009(subject, epoch_dataset = 'epoch60', hdf5_file = ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE, threshold = 5, time_interval_mins = 20, min_count = 2, repeat = 3):
+	"""
+	Compare the loop based hecht_2009_triaxial_calculate_non_wear_time with the vectorized hecht_2009_triaxial_calculate_non_wear_time_vectorized on the epoch data of one subject. Both 
+	the execution time and the equality of the returned non-wear vectors are logged
+
+	Parameters
+	----------
+	subject : string
+		subject ID
+	epoch_dataset : string (optional)
+		name of the 60s epoch dataset
+	hdf5_file : os.path (optional)
+		HDF5 file to read the epoch data from
+	threshold : int (optional)
+		threshold value in VMU
+	time_interval_mins : int (optional)
+		time interval in minutes
+	min_count : int (optional)
+		min count within the following and preceding time interval
+	repeat : int (optional)
+		number of times each implementation is executed, the fastest run is reported
+	"""
+
+	# read the epoch data and calculate the VMU, the same as the grid search
+	data = calculate_vector_magnitude(read_dataset_from_group(group_name = subject, dataset = epoch_dataset, hdf5_file = hdf5_file).astype('float16'))
+
+	_benchmark_non_wear_functions(hecht_2009_triaxial_calculate_non_wear_time, hecht_2009_triaxial_calculate_non_wear_time_vectorized, repeat = repeat, 
+								data = data, threshold = threshold, time_interval_mins = time_interval_mins, min_count = min_count)
+
+
+def benchmark_troiano_2007(subject, epoch_dataset = 'epoch60', hdf5_file = ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE, repeat = 3):
+	"""
+	Compare the state machine troiano_2007_calculate_non_wear_time with the vectorized troiano_2007_calculate_non_wear_time_vectorized on the epoch data of one subject, for
+	the default parameters and each value of the Troiano grid search parameters
+
+	Parameters
+	----------
+	subject : string
+		subject ID
+	epoch_dataset : string (optional)
+		name of the 60s epoch dataset
+	hdf5_file : os.path (optional)
+		HDF5 file to read the epoch data from
+	repeat : int (optional)
+		number of times each implementation is executed, the fastest run is reported
+	"""
+
+	# read the epoch data, the same as the grid search
+	data = read_dataset_from_group(group_name = subject, dataset = epoch_dataset, hdf5_file = hdf5_file).astype('float16')
+
+	# default parameters and a few values of each grid search parameter
+	for parameters in [	{}, {'activity_threshold' : 100}, {'min_period_len' : 1}, {'min_period_len' : 200}, {'spike_tolerance' : 10}, {'spike_stoplevel' : 1}, 
+						{'spike_stoplevel' : 200}, {'use_vector_magnitude' : True}]:
+
+		logging.info('Parameters: {}'.format(parameters))
+
+		_benchmark_non_wear_functions(troiano_2007_calculate_non_wear_time, troiano_2007_calculate_non_wear_time_vectorized, repeat = repeat, data = data, time = None, **parameters)
+
+
+def benchmark_choi_2011(subjects = None, epoch_dataset = 'epoch60', hdf5_file = ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE, repeat = 1):
+	"""
+	Compare the loop based choi_2011_calculate_non_wear_time with the vectorized choi_2011_calculate_non_wear_time_vectorized on the epoch data of all subjects, for
+	the default parameters and the extreme values of the Choi grid search parameters
+
+	Parameters
+	----------
+	subjects : list (optional)
+		subject IDs. If not given, all subjects of the HDF5 file are used
+	epoch_dataset : string (optional)
+		name of the 60s epoch dataset
+	hdf5_file : os.path (optional)
+		HDF5 file to read the epoch data from
+	repeat : int (optional)
+		number of times each implementation is executed, the fastest run is reported
+	"""
+
+	# use all subjects if no subjects are given
+	if subjects is None:
+		subjects = get_all_subjects_hdf5(hdf5_file = hdf5_file)
+
+	# default parameters and the extreme values of each grid search parameter
+	parameters_list = [	{}, {'activity_threshold' : 100}, {'min_period_len' : 30}, {'min_period_len' : 210}, {'spike_tolerance' : 1}, {'spike_tolerance' : 5}, 
+						{'min_window_len' : 10}, {'min_window_len' : 60}, {'window_spike_tolerance' : 4}, {'use_vector_magnitude' : True}]
+
+	# keep track of the subjects and parameters with a different non-wear vector
+	not_equal = []
+
+	for subject in subjects:
+
+		# read the epoch data, the same as the grid search
+		data = read_dataset_from_group(group_name = subject, dataset = epoch_dataset, hdf5_file = hdf5_file)
+		if data is None:
+			continue
+		data = data.astype('float16')
+
+		for parameters in parameters_list:
+
+			logging.info('Subject: {}, parameters: {}'.format(subject, parameters))
+
+			if not _benchmark_non_wear_functions(choi_2011_calculate_non_wear_time, choi_2011_calculate_non_wear_time_vectorized, repeat = repeat, data = data, time = None, **parameters):
+				not_equal.append((subject, parameters))
+
+	logging.info('Subjects and parameters with a different non-wear vector: {}'.format(not_equal))
+
+
+def benchmark_hees_2013(subject, acc_dataset = 'actigraph_acc', hdf5_file = ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE, repeat = 1):
+	"""
+	Compare the per window hees_2013_calculate_non_wear_time with the rolling statistics hees_2013_calculate_non_wear_time_vectorized on the raw acceleration data of one subject, for
+	the default parameters and a few values of the Hees grid search parameters
+
+	Parameters
+	----------
+	subject : string
+		subject ID
+	acc_dataset : string (optional)
+		name of the raw acceleration dataset
+	hdf5_file : os.path (optional)
+		HDF5 file to read the acceleration data from
+	repeat : int (optional)
+		number of times each implementation is executed, the fastest run is reported
+	"""
+
+	# read the raw acceleration data
+	data = read_dataset_from_group(group_name = subject, dataset = acc_dataset, hdf5_file = hdf5_file)
+
+	# default parameters and a few values of the grid search parameters
+	for parameters in [{}, {'window_overlap' : 1}, {'min_non_wear_time_window' : 135, 'window_overlap' : 1}, {'std_mg_threshold' : 8.0, 'value_range_mg_threshold' : 1.0}]:
+
+		logging.info('Parameters: {}'.format(parameters))
+
+		_benchmark_non_wear_functions(hees_2013_calculate_non_wear_time, hees_2013_calculate_non_wear_time_vectorized, repeat = repeat, data = data, **parameters)
+
+
+def benchmark_confusion_matrix(num_samples = 604800, num_predictions = 50, repeat = 3):
+	"""
+	Compare get_confusion_matrix (scikit learn) with calculate_binary_confusion_matrix on random 0/1 uint8 vectors, one week of seconds by default. The binary kernel is
+	timed for one prediction vector at a time and for all prediction vectors as one batch
+
+	Parameters
+	----------
+	num_samples : int (optional)
+		number of samples of each vector
+	num_predictions : int (optional)
+		number of predicted vectors, for example the number of grid search combinations of one subject
+	repeat : int (optional)
+		number of times each implementation is executed, the fastest run is reported
+	"""
+
+	# random true labels and predicted labels
+	random = np.random.default_rng(42)
+	y = random.integers(0, 2, (num_samples, 1), dtype = np.uint8)
+	y_hat = random.integers(0, 2, (num_predictions, num_samples), dtype = np.uint8)
+
+	# implementations to compare
+	confusion_functions = {	'get_confusion_matrix' : lambda: np.array([get_confusion_matrix(y, x, labels = [0,1]).ravel() for x in y_hat]),
+							'calculate_binary_confusion_matrix' : lambda: np.array([calculate_binary_confusion_matrix(y, x) for x in y_hat]),
+							'calculate_binary_confusion_matrix (batch)' : lambda: calculate_binary_confusion_matrix(y, y_hat, batch = True)}
+
+	# keep track of the results of each implementation
+	results = {}
+
+	for name, confusion_function in confusion_functions.items():
+
+		timings = []
+		for _ in range(repeat):
+
+			tic = time.time()
+			results[name] = confusion_function()
+			timings.append(time.time() - tic)
+
+		logging.info('{}: {:.4f} seconds ({} vectors of {} samples)'.format(name, min(timings), num_predictions, num_samples))
+
+	# check if all implementations return the same confusion matrices
+	logging.info('Equal confusion matrices: {}'.format(all(np.array_equal(results['get_confusion_matrix'], x) for x in results.values())))
+
+
+def _benchmark_non_wear_functions(reference_function, vectorized_function, repeat = 3, **kwargs):
+	"""
+	Log the execution time of two non-wear functions and if they return the same non-wear vector
+
+	Parameters
+	----------
+	reference_function : function
+		original non-wear function
+	vectorized_function : function
+		vectorized non-wear function with the same parameters
+	repeat : int (optional)
+		number of times each function is executed, the fastest run is reported
+	**kwargs : dict
+		parameters of both functions
+
+	Returns
+	----------
+	equal : Boolean
+		True if both functions return the same non-wear vector
+	"""
+
+	# keep track of the results of each implementation
+	results = {}
+
+	for nw_function in [reference_function, vectorized_function]:
+
+		# keep track of the execution time of each run
+		timings = []
+
+		for _ in range(repeat):
+
+			tic = time.time()
+			nw_vector = nw_function(**kwargs)
+			timings.append(time.time() - tic)
+
+		results[nw_function.__name__] = {'nw_vector' : nw_vector, 'seconds' : min(timings)}
+
+		logging.info('{}: {:.4f} seconds ({} epochs)'.format(nw_function.__name__, min(timings), len(kwargs['data'])))
+
+	# check if both implementations return the same non-wear vector
+	equal = np.array_equal(results[reference_function.__name__]['nw_vector'], results[vectorized_function.__name__]['nw_vector'])
+
+	logging.info('Equal non-wear vector: {}'.format(equal))
+	logging.info('Speedup: {:.1f}x'.format(results[reference_function.__name__]['seconds'] / results[vectorized_function.__name__]['seconds']))
+
+	return equal
+
+if __name__ == '__main__':
+
+	# start timer and memory counter
+	tic, process, logging = set_start()
+
+	# benchmark_gt3x_decoding()
+	# benchmark_gt3x_corrupt_records()
+	# benchmark_hdf5_storage(subject = '90001')
+	# benchmark_hdf5_append()
+	# benchmark_hdf5_read_handles()
+	# benchmark_hecht_2009(subject = '90001')
+	# benchmark_troiano_2007(subject = '90001')
+	# benchmark_choi_2011()
+	# benchmark_hees_2013(subject = '90001')
+	# benchmark_confusion_matrix()
+
+	# print time and memory
+	set_end(tic, process)
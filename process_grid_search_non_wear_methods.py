@@ -7,24 +7,31 @@ import os
 import numpy as np
 import pandas as pd
 import time
+import tempfile
 import itertools
-from multiprocessing import cpu_count, Manager
+from multiprocessing import cpu_count
 from joblib import Parallel
 from joblib import delayed
 
 """
 	IMPORTED FUNCTIONS
 """
-from functions.helper_functions import set_start, set_end, get_subjects_with_invalid_data, calculate_vector_magnitude, save_pickle, load_pickle, create_directory, read_directory, get_current_timestamp, convert_short_code_to_long
-from functions.hdf5_functions import get_all_subjects_hdf5, get_datasets_from_group, read_dataset_from_group, save_data_to_group_hdf5
-from functions.datasets_functions import get_actigraph_acc_data, get_actigraph_epoch_data, get_actigraph_epoch_60_data
-from functions.ml_functions import get_confusion_matrix, calculate_classification_performance, create_train_test_split, return_stratified_k_folds
+from functions.helper_functions import set_start, set_end, dictionary_values_bytes_to_string, get_subjects_with_invalid_data, calculate_vector_magnitude, save_pickle, load_pickle, create_directory, read_directory, get_current_timestamp, convert_short_code_to_long
+from functions.hdf5_functions import get_all_subjects_hdf5, get_datasets_from_group, read_dataset_from_group, save_data_to_group_hdf5, read_metadata_from_group_dataset, read_time_range, create_time_axis
+from functions.datasets_functions import get_actigraph_acc_data, get_actigraph_epoch_60_data
+from functions.epoch_functions import create_epoch_time_array
+from functions.ml_functions import calculate_binary_confusion_matrix, calculate_classification_performance, create_train_test_split, return_stratified_k_folds
 from functions.plot_functions import plot_grid_search, plot_classification_results_comparison, plot_classification_results_comparison_all
 from functions.raw_non_wear_functions import find_consecutive_index_ranges
-from algorithms.non_wear_time.hecht_2009 import hecht_2009_triaxial_calculate_non_wear_time
-from algorithms.non_wear_time.troiano_2007 import troiano_2007_calculate_non_wear_time
-from algorithms.non_wear_time.choi_2011 import choi_2011_calculate_non_wear_time
-from algorithms.non_wear_time.hees_2013 import hees_2013_calculate_non_wear_time
+from functions.data_store_functions import create_subject_data_store, attach_subject_data_store, delete_subject_data_store, create_result_cache, get_cached_result, set_cached_result, sync_result_cache, get_result_cache_progress, get_result_cache_dict, get_result_cache_tensor, attach_result_cache, detach_result_cache, merge_result_cache_journals, \
+											get_result_cache_fingerprint
+from functions.work_queue_functions import create_work_queue, claim_work_queue_task, complete_work_queue_task, release_stale_work_queue_tasks, get_work_queue_progress, finish_work_queue, is_work_queue_finished, \
+											get_work_queue_run_id
+from functions.grid_search_functions import calculate_hecht_grid_confusion_matrix, calculate_hees_grid_confusion_matrix, get_grid_combinations
+from algorithms.non_wear_time.hecht_2009 import hecht_2009_triaxial_calculate_non_wear_time_vectorized
+from algorithms.non_wear_time.troiano_2007 import troiano_2007_calculate_non_wear_time_vectorized
+from algorithms.non_wear_time.choi_2011 import choi_2011_calculate_non_wear_time_vectorized
+from algorithms.non_wear_time.hees_2013 import hees_2013_calculate_non_wear_time_vectorized
 
 """
 	GLOBAL VARIABLES
@@ -37,6 +44,8 @@ ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE = os.path.join(os.sep, 'users', 'shaheensye
 # ACTIGRAPH_HDF5_FILE = os.path.join(os.sep, 'media', 'shaheen', 'LaCie_serve', 'ACTIGRAPH_TU7.hdf5')
 # ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE = os.path.join(os.sep, 'media', 'shaheen', 'LaCie_serve', 'ACTIWAVE_ACTIGRAPH_MAPPING.hdf5')
 # ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE = os.path.join('hdf5', 'ACTIWAVE_ACTIGRAPH_MAPPING.hdf5')
+# version of the non wear algorithms and the confusion matrix calculation, increase when they change so the result cache of earlier runs is not reused
+RESULT_CACHE_VERSION = 1
 
 """
 	PROCESS EPOCH FILES
@@ -100,7 +109,7 @@ def create_epoch_datasets(subject, S, dataset_prefix, idx = 1, total = 1):
 """
 	GRID SEARCH
 """
-def perform_grid_search(method, nw_method, num_jobs = cpu_count(), save_folder = os.path.join('files', 'grid-search-hecht')):
+def perform_grid_search(method, nw_method, num_jobs = cpu_count(), save_folder = os.path.join('files', 'grid-search-hecht'), cache_folder = os.path.join('files', 'grid-search-result-cache'), resume = True, queue_folder = None):
 	"""
 	Perform grid search analysis on epoch or raw data. For epoch data, set method = 'epoch', for raw set method = 'raw'
 
@@ -114,10 +123,18 @@ def perform_grid_search(method, nw_method, num_jobs = cpu_count(), save_folder =
 		number of parallel processes to use to speed up calculation
 	save_folder : os.path
 		folder location to save classification results to
+	cache_folder : os.path
+		folder location of the result cache with the confusion matrix of each subject and combination, results of earlier runs are reused
+	resume : bool (optional)
+		if True, skip the subject and combination results that were completed by an earlier (interrupted) run with the same subjects, combinations, and RESULT_CACHE_VERSION. 
+		If False, start without cached results
+	queue_folder : os.path (optional)
+		folder of a work queue on a filesystem that is shared with other nodes. If set, the grid search is split into tasks that are also processed by workers on
+		other nodes (see process_grid_search_work_queue). The cache folder needs to be on the same shared filesystem
 	"""
 
 	# create list of all possible grid search parameter values combinations
-	combinations, *_ = _get_grid_search_parameter_combinations(nw_method)
+	combinations, parameters, *_ = _get_grid_search_parameter_combinations(nw_method)
 	
 	# get all the subjects from the hdf5 file and remove subjects with invalid data
 	subjects = [s for s in get_all_subjects_hdf5(hdf5_file = ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE) if s not in get_subjects_with_invalid_data()]
@@ -146,20 +163,16 @@ def perform_grid_search(method, nw_method, num_jobs = cpu_count(), save_folder =
 		PERFORM GRID SEARCH
 	"""
 
-	# keep track of confusion matrix results per combination
-	combination_to_confusion_matrix = {x : None for x in combinations}
+	# result cache with the confusion matrix of each subject and combination, results are written to the cache as soon as they are completed
+	result_cache = create_result_cache(cache_folder, '{}-{}'.format(method, nw_method), subjects, combinations, resume = resume, \
+										fingerprint = get_result_cache_fingerprint(subjects, combinations, RESULT_CACHE_VERSION))
 
-	# parallel processing of t an i parameters
-	executor = Parallel(n_jobs = num_jobs, backend = 'multiprocessing')
-	
-	# create tasks so we can execute them in parallel
-	tasks = (delayed(_calculate_subject_combination_confusion_matrix)(method = method, combination = combination, subjects = subjects, nw_method = nw_method, subjects_data = subjects_data, idx = idx, total = len(combinations)) for idx, combination in enumerate(combinations))
-	
-	# execute tasks and process the return values
-	for combination, cf_matrix in executor(tasks):
+	# confusion matrix of each subject and combination, completed results of earlier runs are skipped
+	confusion_tensor = _calculate_confusion_tensor(method = method, nw_method = nw_method, subjects = subjects, subjects_data = subjects_data, combinations = combinations, \
+						parameters = parameters, result_cache = result_cache, queue_folder = queue_folder, num_jobs = num_jobs)
 
-		# save classification performance
-		combination_to_confusion_matrix[combination] = calculate_classification_performance(*cf_matrix)
+	# sum the confusion matrices of all subjects and save the classification performance of each combination
+	combination_to_confusion_matrix = {combination : calculate_classification_performance(*cf_matrix) for combination, cf_matrix in zip(combinations, confusion_tensor.sum(axis = 0))}
 
 	# save classification results to disk
 	save_pickle(combination_to_confusion_matrix, 'grid-search-results-{}'.format(nw_method), save_folder)
@@ -167,7 +180,7 @@ def perform_grid_search(method, nw_method, num_jobs = cpu_count(), save_folder =
 """
 	CV GRID SEARCH
 """
-def perform_cv_grid_search(method, nw_method, num_jobs = cpu_count(), save_folder = os.path.join('files', 'grid-search-cv-hecht')):
+def perform_cv_grid_search(method, nw_method, num_jobs = cpu_count(), save_folder = os.path.join('files', 'grid-search-cv-hecht'), cache_folder = os.path.join('files', 'grid-search-result-cache'), resume = True, queue_folder = None):
 	"""
 	Perform cross validated grid search
 
@@ -181,10 +194,18 @@ def perform_cv_grid_search(method, nw_method, num_jobs = cpu_count(), save_folde
 		number of parallel processes to use to speed up calculation
 	save_folder : os.path
 		folder location to save classification results to
+	cache_folder : os.path
+		folder location of the result cache with the confusion matrix of each subject and combination, results of earlier runs are reused
+	resume : bool (optional)
+		if True, skip the subject and combination results that were completed by an earlier (interrupted) run with the same subjects, combinations, and RESULT_CACHE_VERSION. 
+		If False, start without cached results
+	queue_folder : os.path (optional)
+		folder of a work queue on a filesystem that is shared with other nodes. If set, the grid search is split into tasks that are also processed by workers on
+		other nodes (see process_grid_search_work_queue). The cache folder needs to be on the same shared filesystem
 	"""
 
 	# create list of all possible grid search parameter values combinations
-	combinations, *_ = _get_grid_search_parameter_combinations(nw_method)
+	combinations, parameters, *_ = _get_grid_search_parameter_combinations(nw_method)
 	
 	# number of cross validations
 	cv = 10
@@ -242,10 +263,16 @@ def perform_cv_grid_search(method, nw_method, num_jobs = cpu_count(), save_folde
 	# dictionary to store fold results
 	all_fold_results = {x : {'combination' : None, 'training_results' : None, 'test_results' : None} for x in range(cv)}
 
-	# start a manager to share the tracker dictionary accross parallel processed
-	manager = Manager()
-	# create the tracker as a manager dictionary
-	subject_combination_tracker = manager.dict()
+	# result cache with the confusion matrix of each subject and combination, shared with the parallel processes through a memory-mapped array
+	result_cache = create_result_cache(cache_folder, '{}-{}'.format(method, nw_method), subjects, combinations, resume = resume, \
+										fingerprint = get_result_cache_fingerprint(subjects, combinations, RESULT_CACHE_VERSION))
+
+	# confusion matrix of each subject and combination, calculated once. The folds then only sum the confusion matrices of their subjects
+	confusion_tensor = _calculate_confusion_tensor(method = method, nw_method = nw_method, subjects = subjects, subjects_data = subjects_data, combinations = combinations, \
+						parameters = parameters, result_cache = result_cache, queue_folder = queue_folder, num_jobs = num_jobs)
+
+	# row of each subject in the confusion tensor
+	subject_to_index = {subject : i for i, subject in enumerate(subjects)}
 	
 	# loop over eacht fold
 	fold_cnt = 0
@@ -261,30 +288,15 @@ def perform_cv_grid_search(method, nw_method, num_jobs = cpu_count(), save_folde
 		# get the test subjects of the fold
 		test_fold_subjects = [train_subjects[x] for x in test_idx]
 
-		# keep track of confusion matrix results per combination
-		combination_to_confusion_matrix = {x : None for x in combinations}
-
-		# parallel processing of t an i parameters
-		executor = Parallel(n_jobs = num_jobs, backend = 'multiprocessing')
-		
-		# create tasks so we can execute them in parallel
-		tasks = (delayed(_calculate_subject_combination_confusion_matrix)(method = method, combination = combination, subjects = train_fold_subjects, nw_method = nw_method, \
-				subject_combination_tracker = subject_combination_tracker, subjects_data = subjects_data, idx = idx, total = len(combinations)) for idx, combination in enumerate(combinations))
-		
-		# execute tasks and process the return values
-		for combination, cf_train in executor(tasks):
-
-			combination_to_confusion_matrix[combination] = calculate_classification_performance(*cf_train)
-			
-			
-		logging.debug('-\tItems in combination tracker: {}'.format(len(subject_combination_tracker)))
+		# confusion matrix of each combination summed over the training subjects of the fold (n_combinations, 4)
+		cf_train = confusion_tensor[[subject_to_index[s] for s in train_fold_subjects]].sum(axis = 0)
 
 		# find combination with the highest accuracy 
-		top_combination = sorted(combination_to_confusion_matrix.items(), key = lambda item: item[1][cv_metric], reverse = True)[0]
+		top_idx = _get_top_combination_index(cf_train, cv_metric)
+		top_combination = (combinations[top_idx], calculate_classification_performance(*cf_train[top_idx]))
 
 		# apply top combination on test subjects
-		_, cv_confusion_test = _calculate_subject_combination_confusion_matrix(method = method, combination = top_combination[0], subjects = test_fold_subjects, nw_method = nw_method, \
-						subject_combination_tracker = subject_combination_tracker, subjects_data = subjects_data)
+		cv_confusion_test = confusion_tensor[[subject_to_index[s] for s in test_fold_subjects], top_idx].sum(axis = 0)
 
 		# save fold results
 		all_fold_results[fold_cnt]['combination'] = top_combination[0]
@@ -327,7 +339,7 @@ def perform_cv_grid_search(method, nw_method, num_jobs = cpu_count(), save_folde
 	logging.info('{}-Fold cross validation Training results: {}'.format(cv, combined_training_results))	
 
 	# try best combination obtained from cross validation on test subjects
-	_, confusion_test = _calculate_subject_combination_confusion_matrix(method = method, combination = top_cv_combination, subjects = test_subjects, nw_method = nw_method, subjects_data = subjects_data)
+	confusion_test = confusion_tensor[[subject_to_index[s] for s in test_subjects], combinations.index(top_cv_combination)].sum(axis = 0)
 
 	# get test classification performance
 	test_results = calculate_classification_performance(*confusion_test)
@@ -344,7 +356,7 @@ def perform_cv_grid_search(method, nw_method, num_jobs = cpu_count(), save_folde
 	save_pickle(classification_data, 'cv-grid-search-results-{}'.format(nw_method), save_folder)
 
 	# save tracker
-	save_pickle(dict(subject_combination_tracker), 'cv-grid-search-tracker-{}'.format(nw_method), save_folder)
+	save_pickle(get_result_cache_dict(result_cache, subjects, combinations), 'cv-grid-search-tracker-{}'.format(nw_method), save_folder)
 	
 
 """
@@ -626,6 +638,369 @@ def _get_plot_data(data, parameters, default_parameters, classification, skip_pa
 
 	return plot_data, default_parameters
 
+def _use_grid_engine(method, nw_method):
+	"""
+	Return True if all grid search combinations of a subject can be calculated in one pass (hecht on epoch data, and hees on raw data)
+	"""
+
+	return (nw_method == 'hecht' and method == 'epoch') or (nw_method == 'hees' and method == 'raw')
+
+
+def _calculate_confusion_tensor(method, nw_method, subjects, subjects_data, combinations, parameters, result_cache, queue_folder = None, num_jobs = cpu_count()):
+	"""
+	Calculate the confusion matrix of each subject and combination once. Results that are already in the result cache are reused, new results are added to the cache
+
+	Parameters
+	-----------
+	method : string
+		what type of data to process. Options are 'epoch' and 'raw'
+	nw_method : string
+		which non wear method to use. Options are 'hecht', 'troiano', 'choi', and 'hees'
+	subjects : list
+		subject IDs
+	subjects_data : dict()
+		subject ID to epoch data ('data') and true non wear time ('true_nw_time')
+	combinations : list
+		combination names
+	parameters : dict()
+		grid search values of each parameter (see _get_grid_search_parameter_combinations)
+	result_cache : os.path
+		folder of the result cache (see create_result_cache)
+	queue_folder : os.path (optional)
+		folder of a work queue to distribute the missing results over workers on several nodes (see _calculate_work_queue_confusion_matrix)
+	num_jobs : int (optional)
+		number of parallel processes
+
+	Returns
+	-----------
+	confusion_tensor : np.array((n_subjects, n_combinations, 4))
+		tn, fp, fn, tp of each subject and combination
+	"""
+
+	# results that are not in the result cache yet
+	missing = (get_result_cache_tensor(result_cache, subjects, combinations) < 0).any(axis = -1)
+
+	# subjects and combinations with at least one missing result
+	missing_subjects = [subject for subject, x in zip(subjects, missing.any(axis = 1)) if x]
+	missing_combinations = [combination for combination, x in zip(combinations, missing.any(axis = 0)) if x]
+
+	# progress at the start, used to estimate the time to finish
+	progress = {'tic' : time.time(), 'num_completed' : get_result_cache_progress(result_cache)[0]}
+
+	logging.info('Completed results: {}, remaining results: {} (subjects: {}/{}, combinations: {}/{})'.format(missing.size - missing.sum(), missing.sum(), len(missing_subjects), len(subjects), len(missing_combinations), len(combinations)))
+
+	if len(missing_subjects) > 0:
+
+		# distribute the missing results over the workers of a work queue
+		if queue_folder is not None:
+
+			_calculate_work_queue_confusion_matrix(method = method, nw_method = nw_method, subjects = missing_subjects, subjects_data = subjects_data, combinations = missing_combinations, \
+												result_cache = result_cache, queue_folder = queue_folder, num_jobs = num_jobs)
+
+		# hecht on epoch data and hees on raw data: calculate all combinations of a subject in one pass
+		elif _use_grid_engine(method, nw_method):
+
+			# confusion matrix grid of each subject, the tasks add the grid of each subject to the result cache
+			_calculate_grid_confusion_matrix(nw_method = nw_method, subjects = missing_subjects, subjects_data = subjects_data, parameters = parameters, result_cache = result_cache, \
+											progress = progress, num_jobs = num_jobs)
+
+		else:
+
+			# save the data of all subjects once, the tasks attach to the store by name instead of receiving a copy of the data
+			subjects_data_store = create_subject_data_store({subject : subjects_data[subject] for subject in missing_subjects})
+
+			try:
+
+				# parallel processing
+				executor = Parallel(n_jobs = num_jobs, backend = 'multiprocessing')
+				
+				# create tasks so we can execute them in parallel, the tasks add the confusion matrix of each subject to the result cache
+				tasks = (delayed(_calculate_subject_combination_confusion_matrix)(method = method, combination = combination, subjects = missing_subjects, nw_method = nw_method, \
+						result_cache = result_cache, subjects_data_store = subjects_data_store, progress = progress, idx = idx, total = len(missing_combinations)) for idx, combination in enumerate(missing_combinations))
+				
+				# execute tasks
+				executor(tasks)
+
+			finally:
+
+				# delete the subject data store, also when a task failed
+				delete_subject_data_store(subjects_data_store)
+
+	return get_result_cache_tensor(result_cache, subjects, combinations)
+
+
+def _calculate_work_queue_confusion_matrix(method, nw_method, subjects, subjects_data, combinations, result_cache, queue_folder, subjects_per_task = 50, combinations_per_task = 100, \
+										task_timeout = 6 * 60 * 60, poll_seconds = 10, num_jobs = cpu_count()):
+	"""
+	Split the missing results into tasks of a block of subjects and a block of combinations, and process the tasks together with the workers on other nodes that
+	process the same work queue (see process_grid_search_work_queue). This node is the coordinator: it creates the tasks, processes tasks itself, releases the tasks
+	of workers that have stopped, and merges the results of all workers into the result cache
+
+	Parameters
+	-----------
+	method : string
+		what type of data to process. Options are 'epoch' and 'raw'
+	nw_method : string
+		which non wear method to use. Options are 'hecht', 'troiano', 'choi', and 'hees'
+	subjects : list
+		subject IDs with missing results
+	subjects_data : dict()
+		subject ID to epoch data ('data') and true non wear time ('true_nw_time')
+	combinations : list
+		combination names with missing results
+	result_cache : os.path
+		folder of the result cache (see create_result_cache), on a filesystem that is shared with the other nodes
+	queue_folder : os.path
+		folder of the work queue, on a filesystem that is shared with the other nodes
+	subjects_per_task : int (optional)
+		number of subjects of a task
+	combinations_per_task : int (optional)
+		number of combinations of a task. Tasks of the grid engine (see _use_grid_engine) always contain all combinations
+	task_timeout : int (optional)
+		number of seconds after which a running task is given to another worker
+	poll_seconds : int (optional)
+		number of seconds to wait between checks of the work queue
+	num_jobs : int (optional)
+		number of parallel processes on this node
+	"""
+
+	# save the data of the subjects to the shared filesystem, a new folder for each queue so workers never use the data of an earlier queue
+	create_directory(queue_folder)
+	subjects_data_store = create_subject_data_store({subject : subjects_data[subject] for subject in subjects}, store_folder = tempfile.mkdtemp(prefix = 'subject-data-store-', dir = queue_folder))
+
+	try:
+
+		# the grid engine calculates all combinations of a subject in one pass, so only the subjects are split into blocks
+		if _use_grid_engine(method, nw_method):
+			combinations_per_task = len(combinations)
+
+		# one task for each block of subjects and block of combinations, the paths are absolute so workers can start from any folder
+		tasks = [{	'method' : method,
+					'nw_method' : nw_method,
+					'subjects' : subjects[i:i + subjects_per_task],
+					'combinations' : combinations[j:j + combinations_per_task],
+					'result_cache' : os.path.abspath(result_cache),
+					'subjects_data_store' : os.path.abspath(subjects_data_store)} for j in range(0, len(combinations), combinations_per_task) for i in range(0, len(subjects), subjects_per_task)]
+
+		# create the work queue, workers on other nodes start processing the tasks
+		create_work_queue(queue_folder, tasks)
+
+		# process tasks on this node as well, until no pending tasks are left
+		process_grid_search_work_queue(queue_folder, num_jobs = num_jobs, wait = False)
+
+		# wait for the tasks of the other workers
+		while True:
+
+			# give the tasks of workers that have stopped to other workers
+			release_stale_work_queue_tasks(queue_folder, task_timeout)
+
+			# number of pending, running, and done tasks
+			progress = get_work_queue_progress(queue_folder)
+
+			logging.info('-	Completed tasks: {}/{}, running tasks: {}, pending tasks: {}'.format(progress['done'], len(tasks), progress['running'], progress['pending']))
+
+			if progress['done'] >= len(tasks):
+				break
+		
+			# process released tasks on this node
+			if progress['pending'] > 0:
+				process_grid_search_work_queue(queue_folder, num_jobs = num_jobs, wait = False)
+			else:
+				time.sleep(poll_seconds)
+
+		# let the waiting workers stop
+		finish_work_queue(queue_folder)
+
+		# merge the results of all workers into the result cache
+		merge_result_cache_journals(result_cache)
+
+	finally:
+
+		# delete the subject data store, also when the coordinator failed
+		delete_subject_data_store(subjects_data_store)
+
+
+def process_grid_search_work_queue(queue_folder, num_jobs = cpu_count(), wait = True, poll_seconds = 10):
+	"""
+	Process the tasks of a grid search work queue (see perform_grid_search with queue_folder). Start this function on each node that should take part in the grid search,
+	with the queue folder on a filesystem that is mounted on the same path on all nodes. Results are written to the journal of the worker, the coordinator merges
+	the journals into the result cache
+
+	Parameters
+	-----------
+	queue_folder : os.path
+		folder of the work queue
+	num_jobs : int (optional)
+		number of parallel processes
+	wait : bool (optional)
+		if True, wait for new tasks until the coordinator marks the queue as finished. If False, return as soon as there are no pending tasks. A run of the queue that is
+		already finished when the worker starts is ignored, the worker waits for the next run
+	poll_seconds : int (optional)
+		number of seconds to wait between checks of the work queue
+	"""
+
+	# the finished marker of an earlier run, the coordinator may not have created the queue of the next run yet
+	finished_run_id = get_work_queue_run_id(queue_folder) if is_work_queue_finished(queue_folder) else None
+
+	while True:
+
+		# claim the next pending task
+		task_id, task = claim_work_queue_task(queue_folder)
+
+		if task_id is None:
+
+			# stop if no new tasks will be added
+			if not wait or is_work_queue_finished(queue_folder, ignore_run_id = finished_run_id):
+				break
+
+			time.sleep(poll_seconds)
+			continue
+
+		logging.info('Processing task {}: {} subjects, {} combinations'.format(task_id, len(task['subjects']), len(task['combinations'])))
+
+		# only write to the journal of this worker, the array of the result cache is only written by the coordinator
+		attach_result_cache(task['result_cache'], journal_only = True)
+
+		# grid search values of each parameter, recreated from the non wear method instead of sent with the task
+		_, parameters, *_ = _get_grid_search_parameter_combinations(task['nw_method'])
+
+		if _use_grid_engine(task['method'], task['nw_method']):
+
+			# data of the subjects of the task (memory-mapped arrays)
+			subjects_data = attach_subject_data_store(task['subjects_data_store'])
+
+			# confusion matrix grid of each subject, the tasks add the grid of each subject to the journal
+			_calculate_grid_confusion_matrix(nw_method = task['nw_method'], subjects = task['subjects'], subjects_data = {subject : {'data' : subjects_data[subject].get('data'), \
+											'true_nw_time' : subjects_data[subject]['true_nw_time']} for subject in task['subjects']}, parameters = parameters, result_cache = task['result_cache'], num_jobs = num_jobs)
+
+		else:
+
+			# parallel processing
+			executor = Parallel(n_jobs = num_jobs, backend = 'multiprocessing')
+
+			# create tasks so we can execute them in parallel, the tasks add the confusion matrix of each subject to the journal
+			tasks = (delayed(_calculate_subject_combination_confusion_matrix)(method = task['method'], combination = combination, subjects = task['subjects'], nw_method = task['nw_method'], \
+					result_cache = task['result_cache'], subjects_data_store = task['subjects_data_store'], idx = idx, total = len(task['combinations'])) for idx, combination in enumerate(task['combinations']))
+
+			# execute tasks
+			executor(tasks)
+
+		# close the journal of this worker, all results of the task have been written to disk
+		detach_result_cache(task['result_cache'])
+
+		# mark the task as done
+		complete_work_queue_task(queue_folder, task_id)
+
+
+def _get_top_combination_index(confusion_matrix, metric):
+	"""
+	Return the index of the combination with the highest classification metric, the first combination if several have the same value
+
+	Parameters
+	-----------
+	confusion_matrix : np.array((n_combinations, 4))
+		tn, fp, fn, tp of each combination
+	metric : string
+		classification metric (see calculate_classification_performance)
+
+	Returns
+	-----------
+	top_idx : int
+		index of the top combination
+	"""
+
+	# classification performance of all combinations at once (combinations without positive or predicted positive samples are nan)
+	with np.errstate(divide = 'ignore', invalid = 'ignore'):
+		performance = calculate_classification_performance(*confusion_matrix.T)[metric]
+
+	# nan values are never the top combination
+	return int(np.argmax(np.where(np.isnan(performance), -np.inf, performance)))
+
+
+def _calculate_grid_confusion_matrix(nw_method, subjects, subjects_data, parameters, result_cache, progress = None, num_jobs = cpu_count()):
+	"""
+	Calculate the confusion matrix of all grid search combinations for each subject, one task per subject instead of one task per combination. Each task adds the
+	confusion matrices of its subject to the result cache
+
+	Parameters
+	-----------
+	nw_method : string
+		which non wear method to use. Options are 'hecht' (epoch data) and 'hees' (raw data)
+	subjects : list
+		subject IDs
+	subjects_data : dict()
+		subject ID to epoch data ('data') and true non wear time ('true_nw_time'). The data is None for hees, the raw data is then read within the task of the subject
+	parameters : dict()
+		grid search values of each parameter (see _get_grid_search_parameter_combinations)
+	result_cache : os.path
+		folder of the result cache (see create_result_cache)
+	progress : dict() (optional)
+		start time ('tic') and number of completed results at the start ('num_completed') to log the progress (see _log_progress)
+	num_jobs : int (optional)
+		number of parallel processes
+	"""
+
+	# parallel processing
+	executor = Parallel(n_jobs = num_jobs, backend = 'multiprocessing')
+
+	# create tasks so we can execute them in parallel
+	tasks = (delayed(_calculate_subject_grid_confusion_matrix)(subject = subject, nw_method = nw_method, data = subjects_data[subject]['data'], true_nw = subjects_data[subject]['true_nw_time'], \
+			parameters = parameters, result_cache = result_cache, progress = progress, idx = idx, total = len(subjects)) for idx, subject in enumerate(subjects))
+
+	# execute tasks
+	executor(tasks)
+
+
+def _calculate_subject_grid_confusion_matrix(subject, nw_method, data, true_nw, parameters, result_cache, progress = None, idx = 1, total = 1):
+
+	logging.debug('-\tProcessing subject {} {}/{}'.format(subject, idx + 1, total))
+
+	if nw_method == 'hecht':
+		subject_grid = calculate_hecht_grid_confusion_matrix(data = data, y = true_nw, thresholds = parameters['T'], time_intervals_mins = parameters['I'], min_counts = parameters['M'])
+	elif nw_method == 'hees':
+		
+		# get raw data, read once for all combinations
+		data, *_ = get_actigraph_acc_data(subject, hdf5_file = ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE, return_time = False)
+
+		subject_grid = calculate_hees_grid_confusion_matrix(data = data, y = true_nw, min_non_wear_time_windows = parameters['MW'], window_overlaps = parameters['WO'], std_mg_thresholds = parameters['ST'], \
+				std_min_num_axes = parameters['SA'], value_range_mg_thresholds = parameters['VT'], value_range_min_num_axes = parameters['VA'])
+	else:
+		logging.error('Non-wear method {} not implemented for the grid engine.'.format(nw_method))
+		exit(1)
+
+	# add the confusion matrix of each combination to the result cache and write it to disk
+	set_cached_result(result_cache, subject, get_grid_combinations(list(parameters.values())).ravel(), subject_grid.reshape(-1, 4))
+	sync_result_cache(result_cache)
+
+	# log the progress
+	if progress is not None:
+		_log_progress(result_cache, progress)
+
+
+def _log_progress(result_cache, progress):
+	"""
+	Log the number of completed and remaining results of the result cache, and the estimated time to finish based on the results completed since the start
+
+	Parameters
+	-----------
+	result_cache : os.path
+		folder of the result cache (see create_result_cache)
+	progress : dict()
+		start time ('tic') and number of completed results at the start ('num_completed')
+	"""
+
+	# number of completed results and total number of results
+	num_completed, num_total = get_result_cache_progress(result_cache)
+
+	# results completed since the start and the time it took
+	num_new, seconds = num_completed - progress['num_completed'], time.time() - progress['tic']
+
+	# estimated time to finish
+	eta = 'unknown' if num_new <= 0 else '{:.0f} seconds'.format(seconds / num_new * (num_total - num_completed))
+
+	logging.info('-\tCompleted results: {}/{} ({:.1f}%), remaining results: {}, estimated time to finish: {}'.format(num_completed, num_total, 100 * num_completed / max(num_total, 1), num_total - num_completed, eta))
+
+
 def _get_hecht_grid_search_nw_vector(variables, data, reverse = True, s = 60, verbose = False):
 
 	# unpack variables
@@ -638,7 +1013,7 @@ def _get_hecht_grid_search_nw_vector(variables, data, reverse = True, s = 60, ve
 	data = calculate_vector_magnitude(data)
 
 	# retrieve non-wear vector
-	nw_vector = hecht_2009_triaxial_calculate_non_wear_time(data = data, epoch_sec = s, threshold = int(t), time_interval_mins = int(i), min_count = int(m))
+	nw_vector = hecht_2009_triaxial_calculate_non_wear_time_vectorized(data = data, epoch_sec = s, threshold = int(t), time_interval_mins = int(i), min_count = int(m))
 
 	# upscale nw_vector
 	nw_vector = nw_vector.repeat(s, axis = 0)
@@ -658,7 +1033,7 @@ def _get_troiano_grid_search_nw_vector(variables, data, reverse = True, verbose
 		logging.debug('Calculating at: {}, mpl: {}, st: {}, ss: {}, vm: {}'.format(*variables))
 
 	# obtain Troiano non wear vector
-	nw_vector = troiano_2007_calculate_non_wear_time(data, None, activity_threshold = int(at), min_period_len = int(mpl), spike_tolerance = int(st), spike_stoplevel = int(ss), use_vector_magnitude = eval(vm), print_output = False)
+	nw_vector = troiano_2007_calculate_non_wear_time_vectorized(data, None, activity_threshold = int(at), min_period_len = int(mpl), spike_tolerance = int(st), spike_stoplevel = int(ss), use_vector_magnitude = eval(vm), print_output = False)
 
 	# upscale nw_vector
 	nw_vector = nw_vector.repeat(60, axis = 0)
@@ -681,7 +1056,7 @@ def _get_choi_grid_search_nw_vector(variables, data, reverse = True, verbose = F
 		logging.debug('Calculating at: {}, mpl: {}, st: {}, mwl: {}, vm: {}'.format(*variables))
 
 	# obtain Choi non wear vector
-	nw_vector = choi_2011_calculate_non_wear_time(data, None, activity_threshold = int(at), min_period_len = int(mpl), spike_tolerance = int(st),  min_window_len = int(mwl), window_spike_tolerance = int(wst), use_vector_magnitude = eval(vm), print_output = False)
+	nw_vector = choi_2011_calculate_non_wear_time_vectorized(data, None, activity_threshold = int(at), min_period_len = int(mpl), spike_tolerance = int(st),  min_window_len = int(mwl), window_spike_tolerance = int(wst), use_vector_magnitude = eval(vm), print_output = False)
 
 	# upscale nw_vector
 	nw_vector = nw_vector.repeat(60, axis = 0)
@@ -701,7 +1076,7 @@ def _get_hees_grid_search_nw_vector(variables, data, reverse = True, hz = 100):
 	mw, wo, st, sa, vt, va = variables
 
 	# obtain Troiano non wear vector
-	nw_vector = hees_2013_calculate_non_wear_time(data, hz = hz, min_non_wear_time_window = int(mw), window_overlap = int(wo), std_mg_threshold = float(st), std_min_num_axes = int(sa) , value_range_mg_threshold = float(vt), value_range_min_num_axes = int(va))
+	nw_vector = hees_2013_calculate_non_wear_time_vectorized(data, hz = hz, min_non_wear_time_window = int(mw), window_overlap = int(wo), std_mg_threshold = float(st), std_min_num_axes = int(sa) , value_range_mg_threshold = float(vt), value_range_min_num_axes = int(va))
 
 	# downscale nw_vector to 1s samples (so it can be compared to true non wear time that is on 1s resolution)
 	nw_vector = nw_vector[::100]
@@ -735,7 +1110,7 @@ def _get_classification_performance(key, y, temp_folder, subject_order):
 	y_hat = np.vstack(y_hat_from_file)
 
 	# get confusion matrix values
-	tn, fp, fn, tp = get_confusion_matrix(y, y_hat, labels = [0,1]).ravel()
+	tn, fp, fn, tp = calculate_binary_confusion_matrix(y, y_hat)
 
 	# calculate classification performance such as precision, recall, f1 etc.
 	classification_performance = calculate_classification_performance(tn, fp, fn, tp)
@@ -795,8 +1170,27 @@ def _read_epoch_dataset(subject, epoch_dataset, start_time, stop_time, use_vmu =
 	# check if epoch dataset is part of HDF5 group
 	if epoch_dataset in get_datasets_from_group(group_name = subject, hdf5_file = ACTIGRAPH_HDF5_FILE):
 
-		# get actigraph 10s epoch data
-		epoch_data, _ , epoch_time_data = get_actigraph_epoch_data(subject, epoch_dataset = epoch_dataset, hdf5_file = ACTIGRAPH_HDF5_FILE)
+		# read epoch meta data
+		epoch_meta_data = dictionary_values_bytes_to_string(read_metadata_from_group_dataset(group_name = subject, dataset = epoch_dataset, hdf5_file = ACTIGRAPH_HDF5_FILE))
+
+		# time of the first epoch
+		epoch_start = create_epoch_time_array(start_date = epoch_meta_data['Start Date'], start_date_format = epoch_meta_data['Date Format'], start_time = epoch_meta_data['Start Time'], epoch_data_length = 1, epoch_sec = start_epoch_sec)[0]
+
+		# implicit time axis of the epoch data, one row every start_epoch_sec seconds
+		epoch_time_axis = create_time_axis(time_start = epoch_start, time_rate = 1. / start_epoch_sec)
+
+		# the upscaled epochs start at the first epoch and every end_epoch_sec seconds after that, so only read the start_epoch_sec epochs of the upscaled epochs within [start_time, stop_time]
+		window_sec = end_epoch_sec if upscale_epoch else start_epoch_sec
+		# first and last + 1 window within the time range
+		first_window = max(0, int(np.ceil((start_time - epoch_start) / np.timedelta64(window_sec, 's'))))
+		stop_window = max(0, int(np.floor((stop_time - epoch_start) / np.timedelta64(window_sec, 's'))) + 1)
+
+		# read only the epochs of these windows
+		epoch_data, epoch_time_data = read_time_range(subject, epoch_dataset, start = epoch_start + np.timedelta64(first_window * window_sec, 's'), stop = epoch_start + np.timedelta64(stop_window * window_sec, 's'), 
+													time_axis = epoch_time_axis, hdf5_file = ACTIGRAPH_HDF5_FILE)
+
+		# make epoch time data on a similar scale as raw time data (thus on ms scale and not on s)
+		epoch_time_data = np.asarray(epoch_time_data, dtype = 'datetime64[ms]')
 
 		# if upscale_epoch is set to True, then upsample epoch counts to epoch_sec
 		if upscale_epoch:
@@ -811,7 +1205,7 @@ def _read_epoch_dataset(subject, epoch_dataset, start_time, stop_time, use_vmu =
 			epoch_data = calculate_vector_magnitude(epoch_data[:,:3], minus_one = False, round_negative_to_zero = False)
 
 		# create dataframe of actigraph acceleration 
-		df_epoch_data = pd.DataFrame(epoch_data, index = epoch_time_data).loc[start_time:stop_time]
+		df_epoch_data = pd.DataFrame(epoch_data, index = epoch_time_data)
 	
 		return df_epoch_data
 
@@ -966,7 +1360,11 @@ def _get_grid_search_parameter_combinations(nw_method):
 
 	return combinations, parameters, labels, default_parameters
 
-def _calculate_subject_combination_confusion_matrix(method, combination, subjects, nw_method, subject_combination_tracker = None, subjects_data = None, verbose = False, idx = 1, total = 1):
+def _calculate_subject_combination_confusion_matrix(method, combination, subjects, nw_method, result_cache = None, subjects_data = None, subjects_data_store = None, progress = None, verbose = False, idx = 1, total = 1):
+
+	# attach to the subject data store (memory-mapped arrays, attached once per process)
+	if subjects_data_store is not None:
+		subjects_data = attach_subject_data_store(subjects_data_store)
 
 	# verbose
 	if verbose:
@@ -984,7 +1382,8 @@ def _calculate_subject_combination_confusion_matrix(method, combination, subject
 		"""
 		CHECK IF SUBJECT COMBINATION HAS ALREADY BEEN PROCESSED
 		"""
-		if subject_combination_tracker is None or subject_combination_tracker.get('{}-{}'.format(subject, combination)) is None:
+		cached_confusion_matrix = None if result_cache is None else get_cached_result(result_cache, subject, combination)
+		if cached_confusion_matrix is None:
 
 			"""
 				GET ACCELERATION DATA
@@ -996,7 +1395,7 @@ def _calculate_subject_combination_confusion_matrix(method, combination, subject
 				subject_true_nw = subjects_data[subject]['true_nw_time']
 			elif method == 'raw':
 				# get raw data
-				subject_data, *_ = get_actigraph_acc_data(subject, hdf5_file = ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE)
+				subject_data, *_ = get_actigraph_acc_data(subject, hdf5_file = ACTIWAVE_ACTIGRAPH_MAPPING_HDF5_FILE, return_time = False)
 				
 				# get raw data from dictionary
 				# subject_data = subjects_data[subject]['data']
@@ -1046,16 +1445,16 @@ def _calculate_subject_combination_confusion_matrix(method, combination, subject
 			"""
 
 			# get confusion matrix values
-			tn, fp, fn, tp = get_confusion_matrix(subject_true_nw, subject_nw_vector, labels = [0,1]).ravel()
+			tn, fp, fn, tp = calculate_binary_confusion_matrix(subject_true_nw, subject_nw_vector)
 
-			# add to tracker
-			if subject_combination_tracker is not None:
-				subject_combination_tracker['{}-{}'.format(subject, combination)] = [tn, fp, fn, tp]
+			# add to result cache
+			if result_cache is not None:
+				set_cached_result(result_cache, subject, combination, [tn, fp, fn, tp])
 
 		else:
 			
-			# read classification results from tracker
-			tn, fp, fn, tp = subject_combination_tracker['{}-{}'.format(subject, combination)]
+			# read classification results from the result cache
+			tn, fp, fn, tp = cached_confusion_matrix
 		
 		# return confusion matrix results
 		classification_data.append([tn, fp, fn, tp])
@@ -1063,6 +1462,15 @@ def _calculate_subject_combination_confusion_matrix(method, combination, subject
 	# combine data into numpy array and calculate column totals
 	classification_data = np.sum(np.array(classification_data), axis = 0)
 
+	if result_cache is not None:
+
+		# write the results of the combination to disk, completed combinations are skipped when an interrupted run is resumed
+		sync_result_cache(result_cache)
+
+		# log the progress every 100 combinations
+		if progress is not None and idx % 100 == 0:
+			_log_progress(result_cache, progress)
+
 	return combination, classification_data
 
 
@@ -1090,6 +1498,10 @@ if __name__ == '__main__':
 	# perform_cv_grid_search(method = 'epoch', nw_method = 'choi')
 	# perform_cv_grid_search(method = 'raw', nw_method = 'hees')
 
+	# distribute the grid search over several nodes: start the coordinator on one node, and a worker on each other node with the same shared queue folder
+	# perform_grid_search(method = 'raw', nw_method = 'hees', queue_folder = os.path.join('files', 'grid-search-work-queue'))
+	# process_grid_search_work_queue(queue_folder = os.path.join('files', 'grid-search-work-queue'))
+
 	"""
 		4) plot grid search analysis contourplot
 	"""